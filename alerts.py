@@ -0,0 +1,124 @@
+import math
+
+from money import format_cents
+
+# An expense is a spike when it lies this many standard deviations above its category's mean amount, once the
+# category has enough history for the deviation to mean something
+SPIKE_Z_SCORE = 3.0
+MIN_SPIKE_SAMPLES = 10
+# Writes warn once a category has used this share of its monthly budget, in percent
+BUDGET_WARNING_PERCENT = 80
+
+# Both lookups are single primary-key reads: category_stats and the rollup are kept current by triggers (schema.py)
+CATEGORY_STATS_SQL = "SELECT expense_count, mean, m2 FROM category_stats WHERE category_id = ?"
+BUDGET_STATUS_SQL = ("SELECT budgets.amount, IFNULL(totals.total, 0) FROM budgets "
+                     "LEFT JOIN monthly_category_totals AS totals "
+                     "ON totals.month = ? AND totals.category_id = budgets.category_id "
+                     "WHERE budgets.category_id = ?")
+# After an insert both are in one read: the triggers have already added the expense to each
+INSERT_STATUS_SQL = ("SELECT stats.expense_count, stats.mean, stats.m2, budgets.amount, IFNULL(totals.total, 0) "
+                     "FROM category_stats AS stats LEFT JOIN budgets ON budgets.category_id = stats.category_id "
+                     "LEFT JOIN monthly_category_totals AS totals "
+                     "ON totals.month = ? AND totals.category_id = stats.category_id "
+                     "WHERE stats.category_id = ?")
+SET_BUDGET_SQL = ("INSERT INTO budgets (category_id, amount, updated_at) VALUES (?, ?, ?) "
+                  "ON CONFLICT (category_id) DO UPDATE SET amount = excluded.amount, updated_at = excluded.updated_at")
+REMOVE_BUDGET_SQL = "DELETE FROM budgets WHERE category_id = (SELECT id FROM categories WHERE name_key = ?)"
+LIST_BUDGETS_SQL = ("SELECT categories.name, budgets.amount, IFNULL(totals.total, 0) FROM budgets "
+                    "JOIN categories ON categories.id = budgets.category_id "
+                    "LEFT JOIN monthly_category_totals AS totals "
+                    "ON totals.month = ? AND totals.category_id = budgets.category_id "
+                    "ORDER BY categories.name")
+
+
+class Alert:
+    # kind is "over_budget", "budget" (close to it) or "spike"
+    __slots__ = ("kind", "category", "message")
+
+    def __init__(self, kind, category, message):
+        self.kind = kind
+        self.category = category
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"Alert({self.kind!r}, {self.category!r}, {self.message!r})"
+
+
+def category_stats(connection, category_id):
+    # (expense count, mean cents, M2) of the category, or None before its first expense
+    return connection.execute(CATEGORY_STATS_SQL, (category_id,)).fetchone()
+
+
+def _stats_before(count, mean, m2, amount):
+    # Undoes the Welford step that added amount, as schema._STATS_REMOVE_SQL does on a delete
+    if count <= 1:
+        return None
+    previous_mean = (mean * count - amount) / (count - 1)
+    return count - 1, previous_mean, max(m2 - (amount - previous_mean) * (amount - mean), 0)
+
+
+def spike_alert(stats, amount, category):
+    # stats are the category's statistics from before this expense was written, so it is not compared with itself
+    if stats is None or stats[0] < MIN_SPIKE_SAMPLES:
+        return None
+    count, mean, m2 = stats
+    deviation = math.sqrt(max(m2, 0) / (count - 1))
+    if not deviation:
+        return None
+    score = (amount - mean) / deviation
+    if score < SPIKE_Z_SCORE:
+        return None
+    return Alert("spike", category, f"${format_cents(amount)} in {category} is {score:.1f} standard deviations above "
+                                    f"its ${format_cents(round(mean))} average")
+
+
+def budget_alert(connection, category_id, category, month):
+    # month is YYYY-MM; the rollup row already includes the write that was just made
+    return _budget_status_alert(connection.execute(BUDGET_STATUS_SQL, (month, category_id)).fetchone(), category, month)
+
+
+def _budget_status_alert(status, category, month):
+    # status is (budget, cents spent in the month), or None for a category without a budget
+    if status is None:
+        return None
+    budget, spent = status
+    if spent > budget:
+        return Alert("over_budget", category, f"{category} is over its ${format_cents(budget)} budget for {month}: "
+                                              f"${format_cents(spent)} spent")
+    if spent * 100 >= budget * BUDGET_WARNING_PERCENT:
+        return Alert("budget", category, f"{category} has used {spent * 100 // budget}% of its "
+                                         f"${format_cents(budget)} budget for {month}")
+    return None
+
+
+def evaluate_write(connection, stats, amount, category_id, category, date):
+    # Alerts for one updated expense, with the category's statistics from before the update: a constant number of
+    # primary-key reads, whatever the history size
+    alerts = [spike_alert(stats, amount, category), budget_alert(connection, category_id, category, date[:7])]
+    return [alert for alert in alerts if alert is not None]
+
+
+def evaluate_insert(connection, amount, category_id, category, date):
+    # Alerts for an expense the same transaction just inserted, from a single read: the statistics are taken back to
+    # before the insert, so the expense is not compared with itself
+    count, mean, m2, budget, spent = connection.execute(INSERT_STATUS_SQL, (date[:7], category_id)).fetchone()
+    alerts = [spike_alert(_stats_before(count, mean, m2, amount), amount, category),
+              _budget_status_alert(None if budget is None else (budget, spent), category, date[:7])]
+    return [alert for alert in alerts if alert is not None]
+
+
+def set_budget(connection, category_id, amount, updated_at):
+    connection.execute(SET_BUDGET_SQL, (category_id, amount, updated_at))
+
+
+def remove_budget(connection, category_key):
+    # By dictionaries.name_key, so removing a budget never adds a category
+    return connection.execute(REMOVE_BUDGET_SQL, (category_key,)).rowcount
+
+
+def list_budgets(connection, month):
+    # (category, budget cents, cents spent in the month) for every budgeted category
+    return connection.execute(LIST_BUDGETS_SQL, (month,)).fetchall()
@@ -0,0 +1,167 @@
+import numpy as np
+
+from money import CENTS, divide_cents
+from schema import CATEGORY_NAMES_SQL
+
+# Months are counted as year * 12 + (month - 1) so date arithmetic stays in integer arrays.
+# {schema} is the partition read (see partitions.PartitionRouter).
+ROLLUP_COLUMNS_TEMPLATE = ("SELECT CAST(substr(month, 1, 4) AS INTEGER) * 12 + CAST(substr(month, 6, 2) AS INTEGER) "
+                           "- 1, category_id, total FROM {schema}.monthly_category_totals "
+                           "WHERE month >= ? AND month < ?")
+# One covering-index range per category and year, returned as a single string NumPy parses in C
+CATEGORY_AMOUNTS_TEMPLATE = ("SELECT group_concat(amount) FROM {schema}.expenses "
+                             "WHERE category_id = ? AND date >= ? AND date < ?")
+FIRST_MONTH_TEMPLATE = "SELECT MIN(month) FROM {schema}.monthly_category_totals"
+
+
+def month_index(year, month):
+    return year * 12 + month - 1
+
+
+def month_key(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def first_ledger_month(connection, partitions):
+    # Month index of the oldest expense in any partition, None for an empty ledger; one primary key seek each
+    for schema in partitions.schemas():
+        first = connection.execute(FIRST_MONTH_TEMPLATE.format(schema=schema)).fetchone()[0]
+        if first is not None:
+            return month_index(int(first[:4]), int(first[5:7]))
+    return None
+
+
+def rollup_rows(connection, partitions, first_key="", end_key="9999-99"):
+    # (month index, category id, total cents) rows of the months [first_key, end_key) from every partition they span
+    rows = []
+    for schema in partitions.schemas(f"{first_key}-01" if first_key else None, f"{end_key}-01"):
+        rows += connection.execute(ROLLUP_COLUMNS_TEMPLATE.format(schema=schema), (first_key, end_key)).fetchall()
+    return rows
+
+
+def load_columns(rows):
+    # Rollup rows into NumPy arrays, category ids renumbered densely.
+    # Cent totals stay exact in float64 up to 2**53 cents.
+    if not rows:
+        return [], np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float64)
+    month_column, category_column, total_column = zip(*rows)
+    category_ids, codes = np.unique(np.array(category_column, dtype=np.int64), return_inverse=True)
+    return (category_ids.tolist(), np.array(month_column, dtype=np.int32), codes.astype(np.int32),
+            np.array(total_column, dtype=np.float64))
+
+
+def category_names(connection, category_ids):
+    names = dict(connection.execute(CATEGORY_NAMES_SQL).fetchall())
+    return [names[category_id] for category_id in category_ids]
+
+
+def load_amounts(connection, partitions, category_id, first_month, last_month):
+    # Every single expense amount of a category, fetched one year (and so one partition) at a time
+    chunks = []
+    for year in range(first_month // 12, last_month // 12 + 1):
+        sql = CATEGORY_AMOUNTS_TEMPLATE.format(schema=partitions.schema_for_year(year))
+        values = connection.execute(sql, (category_id, f"{year:04d}-01-01", f"{year + 1:04d}-01-01")).fetchone()[0]
+        if values:
+            chunks.append(np.fromstring(values, sep=","))
+    return np.concatenate(chunks) if chunks else np.empty(0, np.float64)
+
+
+def monthly_matrix(months, codes, amounts, category_count, first_month=None, last_month=None):
+    # Category x month totals, every month in [first_month, last_month] present even when empty
+    first_month = int(months.min()) if first_month is None else first_month
+    last_month = int(months.max()) if last_month is None else last_month
+    width = last_month - first_month + 1
+    inside = (months >= first_month) & (months <= last_month)
+    flat = codes[inside].astype(np.int64) * width + (months[inside] - first_month)
+    totals = np.bincount(flat, weights=amounts[inside], minlength=category_count * width)
+    return totals.reshape(category_count, width), first_month
+
+
+def rolling_mean(matrix, window):
+    # Trailing mean over the last `window` months, NaN until a full window is available
+    cumulative = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] >= window:
+        result[:, window - 1:] = (cumulative[:, window:] - cumulative[:, :-window]) / window
+    return result
+
+
+def year_over_year(matrix):
+    result = np.full(matrix.shape, np.nan)
+    result[:, 12:] = matrix[:, 12:] - matrix[:, :-12]
+    return result
+
+
+def category_percentiles(connection, partitions, category_ids, first_month, last_month, percentiles=(50, 90, 99)):
+    result = np.full((len(category_ids), len(percentiles)), np.nan)
+    for row, category_id in enumerate(category_ids):
+        amounts = load_amounts(connection, partitions, category_id, first_month, last_month)
+        if len(amounts):
+            result[row] = np.percentile(amounts, percentiles, method="lower")
+    return result
+
+
+def linear_forecast(matrix, horizon=1, history=12):
+    # Least-squares line through each category's last `history` months, extrapolated `horizon` months ahead
+    recent = matrix[:, -history:]
+    points = recent.shape[1]
+    if points < 2:
+        return np.repeat(recent[:, -1:], horizon, axis=1) if points else np.zeros((matrix.shape[0], horizon))
+    x = np.arange(points, dtype=np.float64)
+    x_centered = x - x.mean()
+    slope = (recent - recent.mean(axis=1, keepdims=True)) @ x_centered / (x_centered @ x_centered)
+    intercept = recent.mean(axis=1) - slope * x.mean()
+    future = np.arange(points, points + horizon, dtype=np.float64)
+    return np.maximum(intercept[:, None] + slope[:, None] * future, 0)
+
+
+class SpendingAnalytics:
+    # Monthly series come from the rollup table; only percentiles need the individual expense amounts
+    def __init__(self, connection, partitions):
+        self.connection = connection
+        self.partitions = partitions
+        self.category_ids, months, codes, totals = load_columns(rollup_rows(connection, partitions))
+        self.categories = category_names(connection, self.category_ids)
+        if self.categories:
+            self.matrix, self.first_month = monthly_matrix(months, codes, totals, len(self.categories))
+        else:
+            self.matrix, self.first_month = np.zeros((0, 0)), None
+
+    @property
+    def last_month(self):
+        return self.first_month + self.matrix.shape[1] - 1
+
+    @property
+    def latest_month(self):
+        return month_key(self.last_month) if self.categories else None
+
+    def summary(self, percentiles=(50, 90)):
+        # One row per category for the latest month in the ledger, converted from cents once per column
+        if not self.categories:
+            return []
+        columns = [self.matrix[:, -1]]
+        columns += [rolling_mean(self.matrix, window)[:, -1] for window in (3, 6, 12)]
+        columns.append(year_over_year(self.matrix)[:, -1])
+        columns += list(category_percentiles(self.connection, self.partitions, self.category_ids, self.first_month,
+                                             self.last_month, percentiles).T)
+        columns.append(linear_forecast(self.matrix)[:, 0])
+        values = (np.column_stack(columns) / CENTS).tolist()
+        return [(category, *values[i]) for i, category in enumerate(self.categories)]
+
+
+def trailing_averages(connection, partitions, month, year, months=12, ledger_start=None):
+    # Average monthly spend in cents per category over the `months` months ending with the report month, from the
+    # rollup; the integer totals are averaged with integer rounding. A ledger younger than the window is averaged
+    # over the months it covers (from ledger_start, see first_ledger_month), not as if the months before were empty.
+    last = month_index(year, month)
+    first = last - months + 1
+    rows = rollup_rows(connection, partitions, month_key(first), month_key(last + 1))
+    category_ids, month_column, codes, totals = load_columns(rows)
+    if not category_ids:
+        return {}
+    matrix, _ = monthly_matrix(month_column, codes, totals, len(category_ids), first, last)
+    if ledger_start is None:
+        ledger_start = first_ledger_month(connection, partitions)
+    covered = last - max(first, ledger_start) + 1
+    return {category: divide_cents(int(total), covered)
+            for category, total in zip(category_names(connection, category_ids), matrix.sum(axis=1))}
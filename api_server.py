@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+from importer import InvalidExpense, validate_expense
+from money import format_cents
+from repository import DEFAULT_DB, ExpenseRepository
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_POOL_SIZE = 4
+MAX_WRITE_BATCH = 512
+MAX_PAGE_SIZE = 1000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ConnectionPool:
+    # A fixed set of read connections, each used by one executor thread at a time.
+    # WAL lets them all read while the write batcher's connection commits.
+    def __init__(self, db_name, executor, size=DEFAULT_POOL_SIZE):
+        self.db_name = db_name
+        self.executor = executor
+        self.size = size
+        self.idle = asyncio.Queue()
+        self.repositories = []
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            repository = await loop.run_in_executor(self.executor, ExpenseRepository, self.db_name, False)
+            self.repositories.append(repository)
+            self.idle.put_nowait(repository)
+
+    @asynccontextmanager
+    async def acquire(self):
+        repository = await self.idle.get()
+        try:
+            yield repository
+        finally:
+            self.idle.put_nowait(repository)
+
+    async def run(self, function, *args):
+        async with self.acquire() as repository:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, repository, *args)
+
+    def close(self):
+        for repository in self.repositories:
+            repository.close()
+
+
+def run_write_batch(repository, batch):
+    # Every queued write shares one transaction and one commit. Each request runs in its own savepoint, so one that
+    # fails, whatever the error, is undone as a whole (a bulk add included) and the others still commit.
+    results = []
+    with repository.transaction():
+        for function, args, _ in batch:
+            try:
+                with repository.savepoint():
+                    result = function(repository, *args)
+            except Exception as error:
+                results.append((None, error))
+            else:
+                results.append((result, None))
+    return results
+
+
+class WriteBatcher:
+    # Group commit: writes that arrive while a batch is committing are queued and committed together next
+    def __init__(self, db_name, executor, max_batch=MAX_WRITE_BATCH):
+        self.db_name = db_name
+        self.executor = executor
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.repository = None
+        self.task = None
+        self.batches = self.writes = 0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.repository = await loop.run_in_executor(self.executor, ExpenseRepository, self.db_name, False)
+        self.task = asyncio.create_task(self._run())
+
+    def submit(self, function, *args):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((function, args, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # Any error that escapes the batch (e.g. its commit failing) fails only this batch's requests; the writer
+            # itself keeps running, or every later write would wait forever
+            try:
+                results = await loop.run_in_executor(self.executor, run_write_batch, self.repository, batch)
+            except Exception as error:
+                results = [(None, error)] * len(batch)
+            self.batches += 1
+            self.writes += len(batch)
+            for (_, _, future), (result, error) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.repository is not None:
+            self.repository.close()
+
+
+def expense_row(expense):
+    # Amounts go out as exact decimal strings, with the integer cents alongside for clients that sum them
+    return {"id": expense.id, "amount": format_cents(expense.amount), "amount_cents": expense.amount,
+            "category": expense.category, "description": expense.description, "date": expense.date,
+            "expense_type": expense.expense_type}
+
+
+def money_fields(name, cents):
+    return {name: format_cents(cents), f"{name}_cents": cents}
+
+
+def expense_values(body):
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Expected a JSON object per expense")
+    return validate_expense(body.get("amount"), body.get("category"), body.get("description"),
+                            body.get("date") or datetime.now().strftime('%Y-%m-%d'), body.get("expense_type"))
+
+
+def page_cursor(query):
+    cursor = query.get("after", [None])[0]
+    if cursor is None:
+        return None
+    date, _, expense_id = cursor.rpartition(",")
+    if not date or not expense_id.isdigit():
+        raise HTTPError(400, "after must look like YYYY-MM-DD,<id>")
+    return date, int(expense_id)
+
+
+def content_length(headers):
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be an integer")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    return length
+
+
+def query_int(query, name, default, low, high):
+    value = query.get(name, [default])[0]
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be an integer")
+    if not low <= value <= high:
+        raise HTTPError(400, f"{name} must be between {low} and {high}")
+    return value
+
+
+class ExpenseAPI:
+    def __init__(self, db_name=DEFAULT_DB, pool_size=DEFAULT_POOL_SIZE):
+        # One extra thread so the writer never waits behind a full set of readers
+        self.executor = ThreadPoolExecutor(max_workers=pool_size + 1, thread_name_prefix="expense-api")
+        self.pool = ConnectionPool(db_name, self.executor, pool_size)
+        self.writer = WriteBatcher(db_name, self.executor)
+        self.routes = [
+            ("POST", re.compile(r"/expenses"), self.add_expense),
+            ("POST", re.compile(r"/expenses/bulk"), self.add_expenses),
+            ("GET", re.compile(r"/expenses"), self.list_expenses),
+            ("PUT", re.compile(r"/expenses/(\d+)"), self.update_expense),
+            ("DELETE", re.compile(r"/expenses/(\d+)"), self.delete_expense),
+            ("GET", re.compile(r"/reports/(\d{4})/(\d{1,2})"), self.monthly_report),
+            ("GET", re.compile(r"/stats"), self.stats),
+        ]
+
+    async def open(self):
+        # The writer opens first so migrations run once, before any reader connects
+        await self.writer.open()
+        await self.pool.open()
+
+    async def close(self):
+        await self.writer.close()
+        self.pool.close()
+        self.executor.shutdown()
+
+    async def add_expense(self, body, query):
+        values = expense_values(body)
+        expense_id, alerts = await self.writer.submit(lambda repository: (
+            repository.add_expense(*values[:3], values[4], values[3]), repository.last_alerts))
+        return 201, {"id": expense_id, "alerts": [alert.message for alert in alerts]}
+
+    async def add_expenses(self, body, query):
+        if not isinstance(body, dict) or not isinstance(body.get("expenses"), list):
+            raise HTTPError(400, "Expected {\"expenses\": [...]}")
+        rows = [expense_values(expense) for expense in body["expenses"]]
+        inserted = await self.writer.submit(lambda repository: repository.add_expenses(rows))
+        return 201, {"inserted": inserted}
+
+    async def list_expenses(self, body, query):
+        limit = query_int(query, "limit", 100, 1, MAX_PAGE_SIZE)
+        rows = await self.pool.run(lambda repository: repository.list_expenses(page_cursor(query), limit))
+        next_cursor = f"{rows[-1].date},{rows[-1].id}" if len(rows) == limit else None
+        return 200, {"expenses": [expense_row(row) for row in rows], "next": next_cursor}
+
+    async def update_expense(self, body, query, expense_id):
+        # The date is not editable, so only the other fields are validated and stored
+        amount, category, description, _, expense_type = expense_values(body)
+        updated, alerts = await self.writer.submit(lambda repository: (repository.update_expense(
+            int(expense_id), amount, category, description, expense_type), repository.last_alerts))
+        if not updated:
+            raise HTTPError(404, f"Expense {expense_id} not found")
+        return 200, {"updated": updated, "alerts": [alert.message for alert in alerts]}
+
+    async def delete_expense(self, body, query, expense_id):
+        deleted = await self.writer.submit(lambda repository: repository.delete_expense(int(expense_id)))
+        if not deleted:
+            raise HTTPError(404, f"Expense {expense_id} not found")
+        return 204, None
+
+    async def monthly_report(self, body, query, year, month):
+        year, month = int(year), int(month)
+        if year < 1:
+            raise HTTPError(400, "year must be between 1 and 9999")
+        if not 1 <= month <= 12:
+            raise HTTPError(400, "month must be between 1 and 12")
+        total, by_category, averages = await self.pool.run(lambda repository: repository.monthly_report(month, year))
+        if total is None:
+            raise HTTPError(404, f"No expenses in {year:04d}-{month:02d}")
+        return 200, {"year": year, "month": month, **money_fields("total", total),
+                     "categories": [{"category": category, **money_fields("total", category_total),
+                                     **money_fields("trailing_average", averages.get(category, 0))}
+                                    for category, category_total in by_category]}
+
+    async def stats(self, body, query):
+        return 200, {"write_batches": self.writer.batches, "writes": self.writer.writes,
+                     "pool_size": self.pool.size, "idle_connections": self.pool.idle.qsize()}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            return await handler(body, query, *match.groups())
+        raise HTTPError(405 if allowed else 404, f"{method} {url.path} is not supported")
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1: JSON bodies with Content-Length, keep-alive unless the client asks to close
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = content_length(headers)
+                except HTTPError as error:
+                    # The body is left unread, so the connection cannot be reused for another request
+                    await self.respond(writer, error.status, {"error": str(error)}, False)
+                    break
+
+                status, payload = await self.process(method, target, length, reader)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def process(self, method, target, length, reader):
+        try:
+            body = None
+            if length:
+                try:
+                    body = json.loads(await reader.readexactly(length))
+                except ValueError:
+                    raise HTTPError(400, "Request body is not valid JSON")
+            return await self.dispatch(method, target, body)
+        except HTTPError as error:
+            return error.status, {"error": str(error)}
+        except (InvalidExpense, OverflowError) as error:
+            # OverflowError: an integer too large for SQLite, e.g. an expense id
+            return 400, {"error": str(error)}
+        except sqlite3.IntegrityError as error:
+            # e.g. a write dated in an archived year
+            return 400, {"error": str(error)}
+        except sqlite3.Error as error:
+            return 500, {"error": f"Database error: {error}"}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(db_name=DEFAULT_DB, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=DEFAULT_POOL_SIZE):
+    api = ExpenseAPI(db_name, pool_size)
+    await api.open()
+    server = await asyncio.start_server(api.handle, host, port)
+    print(f"Expense API listening on http://{host}:{server.sockets[0].getsockname()[1]} ({db_name})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the expense ledger over a JSON HTTP API")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="read connections")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.pool_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import customtkinter as tk
+
+from dictionaries import name_key
+
+MAX_SUGGESTIONS = 12
+
+
+def matching_names(names, text, limit=MAX_SUGGESTIONS):
+    # Names starting with the typed text first, then names containing it, compared like the dictionary does
+    key = name_key(text)
+    prefix, inner = [], []
+    for name in names:
+        candidate = name_key(name)
+        if candidate.startswith(key):
+            prefix.append(name)
+        elif key in candidate:
+            inner.append(name)
+    return (prefix + inner)[:limit]
+
+
+class AutocompleteComboBox(tk.CTkComboBox):
+    # A text entry whose drop-down lists the known names matching what has been typed so far.
+    # The names come from the repository's interned dictionaries, so loading them costs no scan of expenses.
+    def __init__(self, master, **kwargs):
+        super().__init__(master, values=[], **kwargs)
+        self.names = []
+        self.set("")
+        self.bind("<KeyRelease>", lambda _: self.update_suggestions())
+
+    def set_names(self, names):
+        self.names = names
+        self.update_suggestions()
+
+    def update_suggestions(self):
+        self.configure(values=matching_names(self.names, self.get()))
+
+    def clear(self):
+        self.set("")
+        self.update_suggestions()
@@ -0,0 +1,123 @@
+import os
+import tkinter
+from concurrent.futures import ThreadPoolExecutor
+
+import customtkinter as tk
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache")
+POLL_INTERVAL_MS = 15
+RESIZE_DELAY_MS = 200
+# Each render is a raw PPM of a few MB; keep the most recently used window sizes only
+CACHED_SIZES = 3
+
+
+def cache_path(source, width, height, cache_dir=CACHE_DIR):
+    # Keyed by source mtime and window size, so an edited image or a new size never hits a stale file
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, f"{stem}-{os.stat(source).st_mtime_ns}-{width}x{height}.ppm")
+
+
+def decode_source(source, width, height):
+    # PIL is only imported on a cache miss, and always off the main thread
+    from PIL import Image
+
+    image = Image.open(source)
+    # JPEG draft mode decodes straight to the smallest scale that still covers the window
+    image.draft("RGB", (width, height))
+    return image.convert("RGB")
+
+
+def render_background(source, width, height, cache_dir=CACHE_DIR, decoded=None):
+    # Returns the path of a pre-resized PPM, which Tk loads without PIL, and the decoded source if one was needed
+    path = cache_path(source, width, height, cache_dir)
+    try:
+        # A hit counts as a use: the file's mtime orders the renders for prune_cache
+        os.utime(path)
+        return path, decoded
+    except FileNotFoundError:
+        pass
+
+    from PIL import Image
+
+    if decoded is None:
+        decoded = decode_source(source, width, height)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    decoded.resize((width, height), Image.Resampling.LANCZOS).save(temporary_path, "PPM")
+    os.replace(temporary_path, path)
+    prune_cache(source, cache_dir)
+    return path, decoded
+
+
+def prune_cache(source, cache_dir=CACHE_DIR, keep=CACHED_SIZES):
+    # Drops cached renders of older versions of the source image and all but the `keep` most recently used sizes
+    prefix = os.path.splitext(os.path.basename(source))[0] + "-"
+    current = f"{prefix}{os.stat(source).st_mtime_ns}-"
+    renders = []
+    for entry in os.scandir(cache_dir):
+        if not entry.name.startswith(prefix) or entry.name.endswith(".tmp"):
+            continue
+        try:
+            if entry.name.startswith(current):
+                renders.append((entry.stat().st_mtime_ns, entry.path))
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Pruned by another process meanwhile
+            pass
+    for _, path in sorted(renders, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class BackgroundImage:
+    # Paints the background after the widgets are up and re-renders it on window resize
+    def __init__(self, master, source, cache_dir=CACHE_DIR):
+        self.master = master
+        self.source = source
+        self.cache_dir = cache_dir
+        self.decoded = None
+        self.size = None
+        self.pending = None
+        self._resize_id = None
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background-image")
+
+        self.label = tk.CTkLabel(self.master, text="")
+        self.label.place(relwidth=1, relheight=1)
+        self.label.lower()
+        self.master.bind("<Configure>", self.on_configure, add="+")
+
+    def load(self, width, height):
+        if (width, height) == self.size:
+            return
+        self.size = (width, height)
+        self.pending = self.pool.submit(render_background, self.source, width, height, self.cache_dir, self.decoded)
+        self.master.after(POLL_INTERVAL_MS, self._poll, self.pending)
+
+    def _poll(self, future):
+        if future is not self.pending:
+            return
+        if not future.done():
+            self.master.after(POLL_INTERVAL_MS, self._poll, future)
+            return
+        path, self.decoded = future.result()
+
+        # Tk reads the raw PPM directly, no JPEG decode or PIL conversion on the main thread
+        photo = tkinter.PhotoImage(file=path)
+        self.label.configure(image=photo)
+        self.label.lower()
+
+        # Ensure the image is retained by tkinter
+        self.label.image = photo
+
+    def on_configure(self, event):
+        if event.widget is not self.master:
+            return
+        if self._resize_id is not None:
+            self.master.after_cancel(self._resize_id)
+        self._resize_id = self.master.after(RESIZE_DELAY_MS, self.load, event.width, event.height)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import evaluate_insert
+from benchmarks.synthetic import build_ledger, synthetic_expenses
+from bulk_edit import ExpenseFilter
+from repository import ExpenseRepository
+
+STATS_TRIGGERS = ["expenses_stats_insert", "expenses_stats_delete", "expenses_stats_update"]
+RAW_STATS_SQL = "SELECT category_id, amount FROM expenses"
+
+
+def time_writes(plain_write, alert_write, expenses):
+    # The two variants take turns, first one then the other, so disk and CPU noise lands on both alike
+    plain_timings, alert_timings = [], []
+    for number, expense in enumerate(expenses):
+        variants = [(plain_write, plain_timings), (alert_write, alert_timings)]
+        for write, timings in variants[::-1] if number % 2 else variants:
+            start = time.perf_counter()
+            write(expense)
+            timings.append(time.perf_counter() - start)
+    return plain_timings, alert_timings
+
+
+def describe(timings):
+    return statistics.median(timings) * 1e6, np.percentile(timings, 95) * 1e6
+
+
+def check_stats(repository):
+    # The trigger-maintained statistics against mean and variance computed from scratch; returns the worst error
+    rows = np.array(repository.connection.execute(RAW_STATS_SQL).fetchall(), dtype=np.float64)
+    worst = 0.0
+    for category_id, count, mean, m2 in repository.connection.execute("SELECT * FROM category_stats"):
+        amounts = rows[rows[:, 0] == category_id, 1]
+        if amounts.size != count:
+            return float("inf")
+        variance = ((amounts - amounts.mean()) ** 2).sum()
+        worst = max(worst, abs(mean - amounts.mean()) / max(abs(amounts.mean()), 1),
+                    abs(m2 - variance) / max(variance, 1))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-insert latency with and without budget and spike alerts")
+    parser.add_argument("--rows", type=int, default=200000, help="history already in the ledger")
+    parser.add_argument("--writes", type=int, default=2000, help="single-expense commits timed per variant")
+    parser.add_argument("--max-overhead", type=float, default=0.25,
+                        help="fail if alerts make the median insert slower by more than this fraction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with_alerts = os.path.join(tmp, "alerts.db")
+        without_alerts = os.path.join(tmp, "plain.db")
+        build_ledger(with_alerts, args.rows)
+        shutil.copy(with_alerts, without_alerts)
+        expenses = list(synthetic_expenses(args.writes, seed=11))
+
+        # The write path as it was before alerts: no statistics triggers, no evaluation
+        plain = ExpenseRepository(without_alerts)
+        for trigger in STATS_TRIGGERS:
+            plain.connection.execute(f"DROP TRIGGER {trigger}")
+        repository = ExpenseRepository(with_alerts)
+        for category in {expense[1] for expense in expenses}:
+            repository.set_budget(category, 50000)
+        alerted = 0
+
+        def add(expense):
+            nonlocal alerted
+            amount, category, description, date, expense_type = expense
+            repository.add_expense(amount, category, description, expense_type, date)
+            alerted += bool(repository.last_alerts)
+
+        plain_timings, alert_timings = time_writes(lambda expense: plain.add_expenses([expense]), add, expenses)
+        plain.close()
+
+        # The evaluation alone, read-only, for the same expenses
+        evaluation_timings = []
+        for amount, category, _, date, _ in expenses:
+            category_id = repository.categories.intern(category)
+            start = time.perf_counter()
+            evaluate_insert(repository.connection, amount, category_id, category, date)
+            evaluation_timings.append(time.perf_counter() - start)
+
+        # Every other write path keeps the statistics exact too
+        ids = [expense_id for expense_id, in repository.connection.execute("SELECT id FROM expenses LIMIT 300")]
+        for expense_id in ids[:100]:
+            repository.update_expense(expense_id, 4321, "Travel", "moved", "Card")
+        for expense_id in ids[100:200]:
+            repository.delete_expense(expense_id)
+        repository.bulk_update(ExpenseFilter(category="Food", start="2024-06-01"), category="Shopping")
+        repository.bulk_delete(ExpenseFilter(category="Health"))
+        repository.undo_bulk_edit()
+        error = check_stats(repository)
+        repository.close()
+
+    plain_median, plain_p95 = describe(plain_timings)
+    alert_median, alert_p95 = describe(alert_timings)
+    evaluation_median, evaluation_p95 = describe(evaluation_timings)
+    overhead = alert_median - plain_median
+    print(f"history              : {args.rows:,} expenses, {args.writes:,} timed single-expense commits")
+    print(f"insert, no alerts    : median {plain_median:8.1f} us   p95 {plain_p95:8.1f} us")
+    print(f"insert + alerts      : median {alert_median:8.1f} us   p95 {alert_p95:8.1f} us   "
+          f"({overhead:+.1f} us, {overhead / plain_median:+.1%})")
+    print(f"evaluation alone     : median {evaluation_median:8.1f} us   p95 {evaluation_p95:8.1f} us")
+    print(f"writes with alerts   : {alerted:,}")
+    print(f"statistics error     : {error:.2e} (relative, after updates, deletes, bulk edits and undo)")
+    sys.exit(0 if overhead <= args.max_overhead * plain_median and error < 1e-6 else 1)
+
+
+if __name__ == "__main__":
+    main()
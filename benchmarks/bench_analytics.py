@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_expenses
+from repository import ExpenseRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the vectorized analytics over a synthetic ledger")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = ExpenseRepository(os.path.join(tmp, "analytics.db"))
+        repository.add_expenses(synthetic_expenses(args.rows, years=args.years), 100000)
+
+        start = time.perf_counter()
+        analytics = repository.spending_analytics()
+        loaded = time.perf_counter()
+        rows = analytics.summary()
+        computed = time.perf_counter()
+
+        report_start = time.perf_counter()
+        repository.monthly_report(12, 2024)
+        report = time.perf_counter() - report_start
+        repository.close()
+
+    print(f"rows                 : {args.rows:,} over {args.years} years, {len(rows)} categories")
+    print(f"monthly series from rollup   : {(loaded - start) * 1000:8.1f} ms")
+    print(f"rolling/yoy/percentiles/forecast : {computed - loaded:8.2f}s ({args.rows / (computed - loaded):,.0f} rows/s)")
+    print(f"monthly report (trailing 12m) : {report * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
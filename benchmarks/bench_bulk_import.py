@@ -0,0 +1,75 @@
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import ExpenseTracker
+
+CATEGORIES = ["Food", "Rent", "Transport", "Entertainment", "Utilities", "Health"]
+TYPES = ["Card", "Cash", "Transfer"]
+
+
+def write_statement(path, rows):
+    start = date(2023, 1, 1)
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Date", "Amount", "Category", "Description", "Type"])
+        for i in range(rows):
+            writer.writerow([(start + timedelta(days=i % 365)).isoformat(), f"-{random.uniform(1, 500):.2f}",
+                             random.choice(CATEGORIES), f"Card payment {i}", random.choice(TYPES)])
+
+
+def bench_per_row(db_path, rows):
+    tracker = ExpenseTracker(db_path)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(rows):
+            tracker.add_expense(random.randint(100, 50000), random.choice(CATEGORIES), f"Card payment {i}",
+                                random.choice(TYPES))
+    elapsed = time.perf_counter() - start
+    tracker.connection.close()
+    return elapsed
+
+
+def bench_bulk(db_path, csv_path, batch_size):
+    tracker = ExpenseTracker(db_path)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inserted, _ = tracker.import_expenses(csv_path, batch_size, debits_negative=True)
+    elapsed = time.perf_counter() - start
+    tracker.connection.close()
+    return inserted, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row add_expense with the bulk CSV importer")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--per-row", type=int, default=2000, help="rows to time on the per-row path")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "statement.csv")
+        write_statement(csv_path, args.rows)
+
+        per_row_elapsed = bench_per_row(os.path.join(tmp, "per_row.db"), args.per_row)
+        per_row_rate = args.per_row / per_row_elapsed
+        inserted, bulk_elapsed = bench_bulk(os.path.join(tmp, "bulk.db"), csv_path, args.batch_size)
+        bulk_rate = inserted / bulk_elapsed
+
+    print(f"per-row add_expense : {args.per_row:>9} rows  {per_row_elapsed:8.2f}s  {per_row_rate:>12,.0f} rows/s")
+    print(f"bulk import (CSV)   : {inserted:>9} rows  {bulk_elapsed:8.2f}s  {bulk_rate:>12,.0f} rows/s")
+    print(f"speedup             : {bulk_rate / per_row_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
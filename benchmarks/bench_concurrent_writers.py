@@ -0,0 +1,177 @@
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dictionaries import Dictionary
+from importer import INSERT_EXPENSE_SQL
+from repository import ExpenseRepository
+from schema import SCHEMA_VERSION, migrate
+
+CATEGORIES = ["Food", "Rent", "Transport", "Entertainment", "Utilities", "Health"]
+
+
+class LegacyRepository:
+    # The pre-repository setup: default sqlite3.connect, rollback journal, synchronous=FULL
+    def __init__(self, db_name):
+        self.connection = sqlite3.connect(db_name)
+        self.categories = Dictionary(self.connection, "categories")
+        self.expense_types = Dictionary(self.connection, "expense_types")
+
+    def add_expense(self, amount, category, description, expense_type, date=None):
+        self.connection.execute(INSERT_EXPENSE_SQL, (amount, self.categories.intern(category), description,
+                                                     date or "2024-01-01", self.expense_types.intern(expense_type)))
+        self.connection.commit()
+
+    def monthly_expenses(self, month, year):
+        return self.connection.execute("SELECT category_id, SUM(amount) FROM expenses GROUP BY category_id").fetchall()
+
+
+def open_repository(db_name, legacy):
+    return LegacyRepository(db_name) if legacy else ExpenseRepository(db_name)
+
+
+def writer(db_name, legacy, worker, rows, started, results):
+    # Every process opens the database at the same moment, so in repository mode they race to migrate a new file
+    started.wait()
+    try:
+        repository = open_repository(db_name, legacy)
+    except sqlite3.Error:
+        # Counted as every write failing, rather than leaving the parent waiting for a result
+        results.put(("writer", rows))
+        return
+    errors = 0
+    for i in range(rows):
+        try:
+            repository.add_expense(1 + (i % 100), CATEGORIES[(worker + i) % len(CATEGORIES)], f"writer {worker}",
+                                   "Card", "2024-01-01")
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(("writer", errors))
+
+
+def reader(db_name, legacy, stop, started, results):
+    started.wait()
+    try:
+        repository = open_repository(db_name, legacy)
+    except sqlite3.Error:
+        results.put(("reader", 1, 0))
+        return
+    reads = errors = 0
+    while not stop.is_set():
+        try:
+            repository.monthly_expenses(1, 2024)
+            reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(("reader", errors, reads))
+
+
+def run(db_name, writers, readers, rows, legacy):
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    started = multiprocessing.Barrier(writers + readers)
+    reader_processes = [multiprocessing.Process(target=reader, args=(db_name, legacy, stop, started, results))
+                        for _ in range(readers)]
+    writer_processes = [multiprocessing.Process(target=writer, args=(db_name, legacy, worker, rows, started, results))
+                        for worker in range(writers)]
+
+    for process in reader_processes:
+        process.start()
+    start = time.perf_counter()
+    for process in writer_processes:
+        process.start()
+    for process in writer_processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for process in reader_processes:
+        process.join()
+
+    outcomes = [results.get() for _ in range(writers + readers)]
+    write_errors = sum(outcome[1] for outcome in outcomes if outcome[0] == "writer")
+    read_errors = sum(outcome[1] for outcome in outcomes if outcome[0] == "reader")
+    reads = sum(outcome[2] for outcome in outcomes if outcome[0] == "reader")
+    return elapsed, write_errors, read_errors, reads
+
+
+def opener(db_name, started, results):
+    started.wait()
+    try:
+        ExpenseRepository(db_name).close()
+        results.put(None)
+    except sqlite3.Error as error:
+        results.put(str(error))
+
+
+def open_together(directory, processes, rounds):
+    # Processes opening a new database at once must leave it fully migrated, whichever of them migrates each step.
+    # Returns the failed rounds.
+    failures = []
+    for attempt in range(rounds):
+        db_name = os.path.join(directory, f"fresh-{attempt}.db")
+        results = multiprocessing.Queue()
+        started = multiprocessing.Barrier(processes)
+        openers = [multiprocessing.Process(target=opener, args=(db_name, started, results)) for _ in range(processes)]
+        for process in openers:
+            process.start()
+        errors = [error for error in (results.get() for _ in openers) if error is not None]
+        for process in openers:
+            process.join()
+        connection = sqlite3.connect(db_name)
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        connection.close()
+        try:
+            ExpenseRepository(db_name).close()
+        except sqlite3.Error as error:
+            errors.append(f"reopen: {error}")
+        if errors or version != SCHEMA_VERSION:
+            failures.append(f"round {attempt}: version {version}, {errors[0] if errors else 'no errors'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer one database file with several writer processes")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=500, help="single-row commits per writer")
+    parser.add_argument("--legacy", action="store_true", help="use the old default connection settings")
+    parser.add_argument("--open-rounds", type=int, default=20,
+                        help="new databases opened by --writers + --readers processes at once")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "concurrent.db")
+        if args.legacy:
+            # The legacy setup never migrates, so the schema has to exist before it starts
+            connection = sqlite3.connect(db_name)
+            migrate(connection)
+            connection.close()
+
+        elapsed, write_errors, read_errors, reads = run(db_name, args.writers, args.readers, args.rows, args.legacy)
+
+        repository = ExpenseRepository(db_name)
+        stored = repository.connection.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        mismatches = repository.check_rollups()
+        repository.close()
+        open_failures = [] if args.legacy else open_together(tmp, args.writers + args.readers, args.open_rounds)
+
+    expected = args.writers * args.rows
+    print(f"mode            : {'legacy' if args.legacy else 'repository (WAL)'}")
+    print(f"commits         : {stored}/{expected} in {elapsed:.2f}s ({stored / elapsed:,.0f} commits/s)")
+    print(f"locked errors   : {write_errors} writes, {read_errors} reads ({reads} reads completed)")
+    print(f"rollup mismatch : {len(mismatches)}")
+    if not args.legacy:
+        print(f"opened together : {args.open_rounds - len(open_failures)}/{args.open_rounds} new databases fully "
+              f"migrated{''.join(chr(10) + '  ' + failure for failure in open_failures)}")
+    sys.exit(0 if stored == expected and not write_errors and not read_errors and not mismatches
+             and not open_failures else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tkinter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background import render_background
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def legacy_background(source, width, height):
+    # What ExpenseTrackerGUI.__init__ used to do before building any widget
+    from PIL import Image
+
+    return Image.open(source).resize((width, height), Image.Resampling.LANCZOS)
+
+
+def load_photo(path):
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        return None
+    root.withdraw()
+    _, elapsed = timed(lambda: tkinter.PhotoImage(master=root, file=path))
+    root.destroy()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the background image startup path, cold vs warm cache")
+    parser.add_argument("--source", default=os.path.join(ROOT, "bg2_image.jpg"))
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=800)
+    args = parser.parse_args()
+
+    _, pil_import = timed(__import__, "PIL.Image")
+    _, legacy = timed(legacy_background, args.source, args.width, args.height)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        (path, _), cold = timed(render_background, args.source, args.width, args.height, cache_dir)
+        _, warm = timed(render_background, args.source, args.width, args.height, cache_dir)
+        photo = load_photo(path)
+
+    print(f"PIL import                 : {pil_import * 1000:8.1f} ms (skipped entirely on a warm start)")
+    print(f"legacy decode + resize     : {legacy * 1000:8.1f} ms (blocked the main thread)")
+    print(f"cold cache (draft + write) : {cold * 1000:8.1f} ms (off the main thread)")
+    print(f"warm cache lookup          : {warm * 1000:8.1f} ms")
+    if photo is not None:
+        print(f"Tk PPM load (main thread)  : {photo * 1000:8.1f} ms")
+    else:
+        print("Tk PPM load (main thread)  :      n/a (no display)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from importer import iter_expenses
+
+# A bank statement with debits and credits, as a signed CSV, as the equivalent OFX and with debit and credit
+# columns: all three must import the same expenses and skip the same credits
+SIGNED_CSV = """Date,Amount,Description,Type
+2024-03-01,-12.50,Lunch,Card
+2024-03-01,+2500.00,Salary,Transfer
+2024-03-02,"-$1,234.56",Laptop,Card
+2024-03-03,40.00,Refund,Card
+2024-03-04,abc,Broken row,Card
+"""
+SIGNED_OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>Card<DTPOSTED>20240301<TRNAMT>-12.50<NAME>Lunch</STMTTRN>
+<STMTTRN><TRNTYPE>Transfer<DTPOSTED>20240301<TRNAMT>+2500.00<NAME>Salary</STMTTRN>
+<STMTTRN><TRNTYPE>Card<DTPOSTED>20240302<TRNAMT>-1234.56<NAME>Laptop</STMTTRN>
+<STMTTRN><TRNTYPE>Card<DTPOSTED>20240303<TRNAMT>40.00<NAME>Refund</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+COLUMNS_CSV = """Date,Description,Debit,Credit
+2024-03-01,Lunch,12.50,
+2024-03-01,Salary,,2500.00
+2024-03-02,Laptop,"1,234.56",
+2024-03-03,Refund,,40.00
+"""
+# A plain expense list, e.g. "list --format csv" output: money spent is positive and a negative amount is a refund
+PLAIN_CSV = """date,amount,category,description
+2024-03-01,12.50,Food,Lunch
+2024-03-01,40.00,Food,Dinner
+2024-03-02,-5.00,Food,Refund
+2024-03-02,300.00,Shopping,Laptop
+"""
+STATEMENT_EXPENSES = [(1250, "2024-03-01", "Lunch"), (123456, "2024-03-02", "Laptop")]
+PLAIN_EXPENSES = [(1250, "2024-03-01", "Lunch"), (4000, "2024-03-01", "Dinner"), (30000, "2024-03-02", "Laptop")]
+# name, content, debits_negative, expected expenses, credits skipped, rejected lines
+CASES = [
+    ("signed.csv", SIGNED_CSV, True, STATEMENT_EXPENSES, 2, [6]),
+    ("signed.ofx", SIGNED_OFX, False, STATEMENT_EXPENSES, 2, []),
+    ("columns.csv", COLUMNS_CSV, False, STATEMENT_EXPENSES, 2, []),
+    ("plain.csv", PLAIN_CSV, False, PLAIN_EXPENSES, 1, []),
+]
+
+
+def imported(tmp, name, content, debits_negative):
+    path = os.path.join(tmp, name)
+    with open(path, "w", encoding="utf-8") as statement:
+        statement.write(content)
+    errors, skipped = [], []
+    expenses = [(amount, date, description)
+                for amount, _, description, date, _ in iter_expenses(path, errors, skipped, debits_negative)]
+    return expenses, skipped, errors
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, content, debits_negative, expected, expected_skipped, expected_errors in CASES:
+            expenses, skipped, errors = imported(tmp, name, content, debits_negative)
+            print(f"{name:<12} {len(expenses)} expenses, {len(skipped)} credits skipped, {len(errors)} rejected")
+            if expenses != expected:
+                failures.append(f"{name}: imported {expenses}, expected {expected}")
+            if len(skipped) != expected_skipped:
+                failures.append(f"{name}: skipped {len(skipped)} credits, expected {expected_skipped}")
+            if [line for line, _ in errors] != expected_errors:
+                failures.append(f"{name}: rejected lines {errors}, expected {expected_errors}")
+    print(f"differences: {', '.join(failures) or 'none'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
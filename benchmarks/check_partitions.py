@@ -0,0 +1,104 @@
+import argparse
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import END_DATE, build_ledger
+from partitions import ArchiveError
+from repository import ExpenseRepository
+
+
+def snapshot(repository):
+    # Everything a reader can see, timed where partitioning is meant to help
+    timings = {}
+    state = {}
+    state["reports"] = [repository.monthly_report(month, year)
+                        for year in range(END_DATE.year - 4, END_DATE.year + 1) for month in (1, 6, 12)]
+    listing = io.StringIO()
+    start = time.perf_counter()
+    repository.write_expenses(listing, "csv")
+    timings["list"] = time.perf_counter() - start
+    state["listing"] = listing.getvalue()
+    state["page"] = [expense.as_tuple() for expense in repository.list_expenses((f"{END_DATE.year - 2}-06-30", 0), 50)]
+    state["search"] = sorted(expense.id for expense in repository.search_expenses(
+        "rent", (f"{END_DATE.year - 3}-06-01", f"{END_DATE.year - 1}-06-30"), 100000))
+    start = time.perf_counter()
+    state["years"] = repository.yearly_totals()
+    timings["years"] = time.perf_counter() - start
+    start = time.perf_counter()
+    repository.report_cache.clear()
+    for year in range(END_DATE.year - 4, END_DATE.year + 1):
+        repository.monthly_report(6, year)
+    timings["reports"] = time.perf_counter() - start
+    return state, timings
+
+
+def check_archive_limit(tmp):
+    # With room for two attached databases, archiving two years works and a third is refused before anything moves
+    db_name = os.path.join(tmp, "limit.db")
+    build_ledger(db_name, 5000)
+    repository = ExpenseRepository(db_name)
+    repository.connection.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 2)
+    first = END_DATE.year - 4
+    failures = []
+    try:
+        list(repository.archive_years(first + 3))
+        failures.append("archiving 3 years with room for 2 was not refused")
+    except ArchiveError as error:
+        print(f"refused: {error}")
+    if list(repository.connection.execute("SELECT year FROM partitions")):
+        failures.append("a refused archive run moved a year")
+    if [year for year, *_ in repository.archive_years(first + 2)] != [first, first + 1]:
+        failures.append("archiving 2 years with room for 2 failed")
+    try:
+        list(repository.archive_years(first + 3))
+        failures.append("a third archive with room for 2 was not refused")
+    except ArchiveError:
+        pass
+    repository.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed years and fail if any read sees a difference")
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--keep", type=int, default=2, help="years left in the main database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "ledger.db")
+        build_ledger(db_name, args.rows)
+        repository = ExpenseRepository(db_name)
+        before, before_timings = snapshot(repository)
+        main_size = os.path.getsize(db_name)
+
+        start = time.perf_counter()
+        archived = list(repository.archive_years(END_DATE.year - args.keep + 1, vacuum=True))
+        elapsed = time.perf_counter() - start
+        print(f"archived {len(archived)} years ({sum(moved for _, moved, _, _ in archived):,} rows) in {elapsed:.2f}s; "
+              f"main database {main_size / 2 ** 20:.1f} MB -> {os.path.getsize(db_name) / 2 ** 20:.1f} MB")
+
+        after, after_timings = snapshot(repository)
+        # A fresh connection must find the archives through the registry alone
+        repository.close()
+        repository = ExpenseRepository(db_name)
+        reopened, _ = snapshot(repository)
+        mismatches = [key for key in before if before[key] != after[key] or before[key] != reopened[key]]
+        rollups = repository.check_rollups()
+        repository.close()
+        mismatches += check_archive_limit(tmp)
+
+    for name in before_timings:
+        print(f"{name:<8} {before_timings[name] * 1000:>9.1f} ms -> {after_timings[name] * 1000:>9.1f} ms")
+    print(f"rollup mismatches: {len(rollups)}")
+    print(f"differences: {', '.join(mismatches) or 'none'}")
+    sys.exit(1 if mismatches or rollups else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dictionaries import Dictionary
+from importer import insert_expenses
+from schema import REPORT_QUERIES, migrate, month_bounds
+
+CATEGORIES = ["Food", "Rent", "Transport", "Entertainment", "Utilities", "Health"]
+
+
+def populate(connection, rows):
+    start = date(2015, 1, 1)
+    categories = Dictionary(connection, "categories")
+    card = Dictionary(connection, "expense_types").intern("Card")
+    expenses = ((random.randint(100, 50000), categories.intern(random.choice(CATEGORIES)), f"Expense {i}",
+                 (start + timedelta(days=random.randrange(3650))).isoformat(), card) for i in range(rows))
+    insert_expenses(connection, expenses, 50000)
+    connection.execute("ANALYZE")
+
+
+def query_plan(connection, sql, params):
+    return [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a monthly report query stops being index-only")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = sqlite3.connect(os.path.join(tmp, "plans.db"))
+        migrate(connection)
+        populate(connection, args.rows)
+
+        params = month_bounds(2020, 12)
+        for sql in REPORT_QUERIES:
+            plan = query_plan(connection, sql, params)
+            # Every table access must be a covering-index or primary-key search, never a table scan
+            table_steps = [step for step in plan if "expenses" in step or "monthly_category_totals" in step]
+            index_only = bool(table_steps) and all(
+                step.startswith("SEARCH") and ("COVERING INDEX" in step or "PRIMARY KEY" in step)
+                for step in table_steps)
+            print(f"{'ok  ' if index_only else 'FAIL'} {sql}")
+            for step in plan:
+                print(f"       {step}")
+            failures += not index_only
+        connection.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
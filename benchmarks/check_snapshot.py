@@ -0,0 +1,92 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import END_DATE, build_ledger, synthetic_expenses
+from bulk_edit import ExpenseFilter
+from listing import OUTPUT_FORMATS
+from repository import ExpenseRepository
+
+
+def outputs(source, timings=None):
+    # Everything the snapshot can answer, from the database or the snapshot, timed per kind of read
+    timings = {} if timings is None else timings
+    state = {}
+    start = time.perf_counter()
+    state["reports"] = [source.monthly_report(month, year)
+                        for year in range(END_DATE.year - 4, END_DATE.year + 1) for month in range(1, 13)]
+    timings["reports"] = time.perf_counter() - start
+    start = time.perf_counter()
+    state["years"] = source.yearly_totals()
+    timings["years"] = time.perf_counter() - start
+    for output_format in OUTPUT_FORMATS:
+        listing = io.StringIO()
+        start = time.perf_counter()
+        source.write_expenses(listing, output_format)
+        timings[f"list.{output_format}"] = time.perf_counter() - start
+        state[f"list.{output_format}"] = listing.getvalue()
+    return state
+
+
+def compare(step, repository, expected_appended, expected_rebuilt, failures):
+    start = time.perf_counter()
+    appended, total, last_id, rebuilt = repository.export_snapshot()
+    elapsed = time.perf_counter() - start
+    print(f"{step:<14} export {elapsed * 1000:>8.1f} ms: {appended:,} appended, {total:,} in all, last id {last_id}, "
+          f"{'rewritten' if rebuilt else 'incremental'}")
+    if expected_appended is not None and appended != expected_appended:
+        failures.append(f"{step}: appended {appended}, expected {expected_appended}")
+    if rebuilt != expected_rebuilt:
+        failures.append(f"{step}: {'rewritten' if rebuilt else 'incremental'}, expected the other")
+    repository.report_cache.clear()
+    database_timings, snapshot_timings = {}, {}
+    expected = outputs(repository, database_timings)
+    start = time.perf_counter()
+    snapshot = repository.open_snapshot()
+    opened = time.perf_counter() - start
+    actual = outputs(snapshot, snapshot_timings)
+    failures += [f"{step}: {key} differs" for key in expected if expected[key] != actual[key]]
+    return opened, database_timings, snapshot_timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a synthetic ledger to a columnar snapshot, keep it up to "
+                                                 "date through inserts, a bulk edit and archiving, and fail if any "
+                                                 "report, total or listing read from it differs from the database")
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--added", type=int, default=5000)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "ledger.db")
+        build_ledger(db_name, args.rows)
+        repository = ExpenseRepository(db_name)
+        opened, database_timings, snapshot_timings = compare("full", repository, args.rows, True, failures)
+
+        repository.add_expenses(synthetic_expenses(args.added, seed=7))
+        compare("inserts", repository, args.added, False, failures)
+
+        repository.bulk_update(ExpenseFilter(category="Food", start=f"{END_DATE.year}-01-01"), category="Restaurants")
+        compare("bulk edit", repository, None, True, failures)
+
+        # Moving rows to archives changes nothing the snapshot holds
+        list(repository.archive_years(END_DATE.year - 1))
+        compare("archive", repository, 0, False, failures)
+        repository.close()
+
+    print(f"snapshot opened in {opened * 1000:.2f} ms")
+    for name in database_timings:
+        print(f"{name:<11} database {database_timings[name] * 1000:>9.1f} ms   "
+              f"snapshot {snapshot_timings[name] * 1000:>9.1f} ms")
+    print(f"differences: {', '.join(failures) or 'none'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
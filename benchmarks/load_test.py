@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import CATEGORIES, build_ledger, synthetic_expenses
+from money import format_cents
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative weight of each request kind in the generated traffic
+DEFAULT_MIX = "add=30,list=30,report=25,update=10,delete=5"
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection speaking just enough of the protocol for the JSON API
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length) if length else b""
+        return status, json.loads(data) if data else None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def random_expense(rng):
+    amount, category, description, date, expense_type = next(synthetic_expenses(1, rng.getrandbits(32)))
+    return {"amount": format_cents(amount), "category": category, "description": description, "date": date,
+            "expense_type": expense_type}
+
+
+async def worker(client, rng, kinds, weights, deadline, ids, latencies, failures):
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "add":
+            request = ("POST", "/expenses", random_expense(rng))
+        elif kind == "list":
+            request = ("GET", f"/expenses?limit=50&after=2023-{rng.randint(1, 12):02d}-01,0", None)
+        elif kind == "report":
+            request = ("GET", f"/reports/{rng.randint(2022, 2024)}/{rng.randint(1, 12)}", None)
+        elif kind == "update" and ids:
+            request = ("PUT", f"/expenses/{rng.choice(ids)}",
+                       {"amount": format_cents(rng.randint(100, 20000)), "category": rng.choice(CATEGORIES)[0],
+                        "description": "Load test", "expense_type": "Card"})
+        elif kind == "delete" and ids:
+            request = ("DELETE", f"/expenses/{ids.pop(rng.randrange(len(ids)))}", None)
+        else:
+            continue
+        start = time.perf_counter()
+        status, body = await client.request(*request)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        if status >= 500 or (status >= 400 and kind not in ("report", "update")):
+            failures.append((kind, status, body))
+        elif kind == "add":
+            ids.append(body["id"])
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_load(host, port, connections, duration, mix, id_range, seed):
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    ids = list(range(1, id_range + 1))
+    latencies, failures = {}, []
+    clients = [Client(host, port) for _ in range(connections)]
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(worker(client, random.Random(rng.random()), kinds, weights, deadline, ids, latencies,
+                                  failures) for client in clients))
+    elapsed = time.perf_counter() - start
+    stats_client = Client(host, port)
+    _, server_stats = await stats_client.request("GET", "/stats")
+    await stats_client.close()
+    for client in clients:
+        await client.close()
+    return latencies, failures, elapsed, server_stats
+
+
+def start_server(db_name, port, pool_size):
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "api_server.py"), "--db", db_name,
+                               "--port", str(port), "--pool-size", str(pool_size)],
+                              stdout=subprocess.PIPE, text=True)
+    # The server prints its address once the pool is open and the socket is listening
+    server.stdout.readline()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the JSON API with concurrent keep-alive clients")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a server on a fresh synthetic database instead of using a running one")
+    parser.add_argument("--rows", type=int, default=100000, help="ledger size when spawning")
+    parser.add_argument("--pool-size", type=int, default=4, help="read connections when spawning")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        id_range = args.rows
+        if args.spawn:
+            db_name = os.path.join(tmp, "load.db")
+            id_range = build_ledger(db_name, args.rows, args.seed)
+            server = start_server(db_name, args.port, args.pool_size)
+        try:
+            latencies, failures, elapsed, server_stats = asyncio.run(
+                run_load(args.host, args.port, args.connections, args.duration, parse_mix(args.mix), id_range,
+                         args.seed))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total:,} requests in {elapsed:.1f}s over {args.connections} connections: {total / elapsed:,.0f} req/s")
+    print(f"{'request':<10} {'count':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for kind, values in sorted(latencies.items()):
+        print(f"{kind:<10} {len(values):>8,} {len(values) / elapsed:>9,.0f} {percentile(values, 0.5) * 1000:>9.2f} "
+              f"{percentile(values, 0.99) * 1000:>9.2f}")
+    everything = [value for values in latencies.values() for value in values]
+    if everything:
+        print(f"{'all':<10} {total:>8,} {total / elapsed:>9,.0f} {percentile(everything, 0.5) * 1000:>9.2f} "
+              f"{percentile(everything, 0.99) * 1000:>9.2f}")
+    if server_stats and server_stats.get("write_batches"):
+        print(f"write batching: {server_stats['writes']:,} writes in {server_stats['write_batches']:,} commits "
+              f"({server_stats['writes'] / server_stats['write_batches']:.1f} per commit)")
+    print(f"failures: {len(failures)}")
+    for kind, status, body in failures[:5]:
+        print(f"  {kind}: {status} {body}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
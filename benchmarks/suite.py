@@ -0,0 +1,156 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import DEFAULT_SEED, DEFAULT_YEARS, END_DATE, synthetic_expenses
+from classes import ExpenseTracker
+
+DEFAULT_THRESHOLD = 0.2
+REPORT_MONTHS = 12
+
+
+def percentile(durations, fraction):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def result(operations, seconds, durations=None):
+    # ops_per_second is the compared metric; per-operation latencies are kept for context
+    entry = {"operations": operations, "seconds": round(seconds, 6),
+             "ops_per_second": round(operations / seconds, 3) if seconds > 0 else None}
+    if durations:
+        entry["p50_ms"] = round(percentile(durations, 0.5) * 1000, 4)
+        entry["p99_ms"] = round(percentile(durations, 0.99) * 1000, 4)
+    return entry
+
+
+def timed_each(function, arguments):
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        durations.append(time.perf_counter() - start)
+    return result(len(durations), sum(durations), durations)
+
+
+def report_months(years=DEFAULT_YEARS):
+    # The most recent months of the synthetic range are also the busiest ones
+    last = END_DATE.year * 12 + END_DATE.month - 1
+    return [((index % 12) + 1, index // 12) for index in range(last - min(REPORT_MONTHS, years * 12) + 1, last + 1)]
+
+
+def run_suite(db_name, rows, operations, seed=DEFAULT_SEED):
+    tracker = ExpenseTracker(db_name)
+    repository = tracker.repository
+    rng = random.Random(seed)
+    scenarios = {}
+
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        start = time.perf_counter()
+        inserted = tracker.add_expenses_bulk(synthetic_expenses(rows, seed), 100000)
+        scenarios["bulk_insert"] = result(inserted, time.perf_counter() - start)
+
+        scenarios["add_expense"] = timed_each(
+            lambda i: tracker.add_expense(rng.randint(100, 20000), "Food", f"Benchmark {i}", "Card"),
+            range(operations))
+
+        start = time.perf_counter()
+        listed = tracker.view_expenses("table", os.devnull)
+        scenarios["view_expenses"] = result(listed, time.perf_counter() - start)
+
+        months = report_months()
+        calls = [months[i % len(months)] for i in range(max(operations // 10, len(months)))]
+
+        def cold_report(month_year):
+            repository.report_cache.clear()
+            tracker.get_monthly_expenses(*month_year)
+
+        scenarios["monthly_report"] = timed_each(cold_report, calls)
+        scenarios["monthly_report_cached"] = timed_each(lambda month_year: tracker.get_monthly_expenses(*month_year),
+                                                        calls)
+
+        ids = rng.sample(range(1, inserted + 1), min(operations * 2, inserted))
+        scenarios["update_expense"] = timed_each(
+            lambda expense_id: repository.update_expense(expense_id, rng.randint(100, 20000), "Food",
+                                                         "Updated by benchmark", "Card"), ids[:operations])
+        scenarios["delete_expense"] = timed_each(repository.delete_expense, ids[operations:])
+
+    repository.close()
+    return scenarios
+
+
+def compare(scenarios, baseline, threshold):
+    # A scenario regresses when its throughput drops more than `threshold` below the baseline
+    regressions = []
+    for name, entry in scenarios.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous.get("ops_per_second") or not entry["ops_per_second"]:
+            continue
+        ratio = entry["ops_per_second"] / previous["ops_per_second"]
+        entry["baseline_ops_per_second"] = previous["ops_per_second"]
+        entry["change"] = round(ratio - 1, 4)
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_summary(scenarios, regressions, output):
+    for name, entry in scenarios.items():
+        line = f"{name:<22} {entry['ops_per_second'] or 0:>14,.1f} ops/s"
+        if "p50_ms" in entry:
+            line += f"   p50 {entry['p50_ms']:8.3f} ms   p99 {entry['p99_ms']:8.3f} ms"
+        if "change" in entry:
+            line += f"   {entry['change']:+.1%} vs baseline"
+        if name in regressions:
+            line += "   REGRESSION"
+        print(line, file=output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the tracker's hot paths on a synthetic ledger and emit JSON")
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic ledger size (10k to 10M)")
+    parser.add_argument("--operations", type=int, default=1000, help="single-row operations per scenario")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed throughput drop before a scenario counts as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scenarios = run_suite(os.path.join(tmp, "benchmark.db"), args.rows, args.operations, args.seed)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("rows") != args.rows or baseline.get("operations") != args.operations:
+            print(f"warning: baseline ran with {baseline.get('rows')} rows / {baseline.get('operations')} "
+                  f"operations", file=sys.stderr)
+        regressions = compare(scenarios, baseline, args.threshold)
+
+    results = {"rows": args.rows, "operations": args.operations, "seed": args.seed,
+               "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+               "machine": platform.machine(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "scenarios": scenarios, "regressions": regressions}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    print_summary(scenarios, regressions, sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
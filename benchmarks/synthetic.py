@@ -0,0 +1,87 @@
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from money import CENTS
+
+# (category, relative frequency, median amount, spread): a few categories dominate the row count,
+# while rare ones like Rent carry most of the money
+CATEGORIES = [
+    ("Food", 34, 18.0, 0.7),
+    ("Transport", 18, 12.0, 0.6),
+    ("Entertainment", 11, 35.0, 0.8),
+    ("Utilities", 6, 85.0, 0.4),
+    ("Health", 5, 60.0, 0.9),
+    ("Shopping", 12, 45.0, 1.0),
+    ("Travel", 3, 320.0, 0.9),
+    ("Gifts", 3, 50.0, 0.7),
+    ("Education", 2, 150.0, 0.8),
+    ("Rent", 1, 1250.0, 0.1),
+]
+TYPES = [("Card", 70), ("Cash", 20), ("Transfer", 10)]
+DESCRIPTIONS = {
+    "Food": ["Groceries", "Lunch", "Coffee", "Dinner out", "Bakery", "Takeaway pizza"],
+    "Transport": ["Bus ticket", "Train pass", "Taxi", "Fuel", "Parking"],
+    "Entertainment": ["Cinema", "Concert tickets", "Streaming subscription", "Board game", "Museum"],
+    "Utilities": ["Electricity bill", "Water bill", "Internet", "Phone plan", "Gas bill"],
+    "Health": ["Pharmacy", "Dentist", "Gym membership", "Doctor visit"],
+    "Shopping": ["Clothes", "Shoes", "Electronics", "Home supplies", "Books"],
+    "Travel": ["Hotel", "Flight", "Car rental", "Travel insurance"],
+    "Gifts": ["Birthday present", "Wedding gift", "Flowers"],
+    "Education": ["Online course", "Textbooks", "Tuition"],
+    "Rent": ["Monthly rent"],
+}
+DEFAULT_SEED = 42
+DEFAULT_YEARS = 5
+END_DATE = date(2024, 12, 31)
+
+
+def synthetic_expenses(rows, seed=DEFAULT_SEED, years=DEFAULT_YEARS, end=END_DATE):
+    # Deterministic (amount in cents, category, description, date, expense_type) tuples for a given seed.
+    # Dates lean towards the end of the range, as a ledger that has been in use longer grows busier.
+    rng = random.Random(seed)
+    span = years * 365
+    start = end - timedelta(days=span - 1)
+    category_weights = list(accumulate(weight for _, weight, _, _ in CATEGORIES))
+    type_weights = list(accumulate(weight for _, weight in TYPES))
+    type_names = [name for name, _ in TYPES]
+    for _ in range(rows):
+        category, _, median, spread = rng.choices(CATEGORIES, cum_weights=category_weights)[0]
+        day = int(rng.triangular(0, span, span))
+        yield (round(max(0.5, rng.lognormvariate(math.log(median), spread)) * CENTS), category,
+               rng.choice(DESCRIPTIONS[category]), (start + timedelta(days=min(day, span - 1))).isoformat(),
+               rng.choices(type_names, cum_weights=type_weights)[0])
+
+
+def build_ledger(db_name, rows, seed=DEFAULT_SEED, years=DEFAULT_YEARS, batch_size=100000):
+    from repository import ExpenseRepository
+
+    repository = ExpenseRepository(db_name)
+    try:
+        return repository.add_expenses(synthetic_expenses(rows, seed, years), batch_size)
+    finally:
+        repository.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic ledger to a database file")
+    parser.add_argument("database")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f"{args.database} already exists")
+    inserted = build_ledger(args.database, args.rows, args.seed, args.years)
+    print(f"Wrote {inserted:,} expenses over {args.years} years to {args.database} (seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
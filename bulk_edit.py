@@ -0,0 +1,191 @@
+import json
+import re
+from datetime import datetime
+
+from dictionaries import name_key
+from importer import batched
+from schema import fts_query
+
+BULK_CHUNK_SIZE = 10000
+# Columns a bulk update may set, in SET clause order; names are interned to ids by the repository beforehand
+UPDATABLE_COLUMNS = ("amount", "category_id", "description", "expense_type_id")
+
+PREVIEW_SQL = "SELECT COUNT(*), IFNULL(SUM(amount), 0), MIN(date), MAX(date) FROM expenses WHERE {where}"
+START_EDIT_SQL = "INSERT INTO bulk_edits (action, summary, expense_count, created_at) VALUES (?, ?, 0, ?)"
+COUNT_EDIT_SQL = "UPDATE bulk_edits SET expense_count = expense_count + ? WHERE id = ?"
+MATCHING_IDS_SQL = "SELECT id FROM expenses WHERE {where} ORDER BY id"
+JOURNAL_COLUMNS = "id, amount, category_id, description, date, expense_type_id"
+# One chunk of the matching ids, journaled as the rows are before the edit. The filter is checked again, so a row
+# changed by another connection since the ids were read is left alone.
+JOURNAL_CHUNK_SQL = (f"INSERT INTO bulk_edit_rows (edit_id, {JOURNAL_COLUMNS}) SELECT ?, {JOURNAL_COLUMNS} "
+                     "FROM expenses WHERE id IN (SELECT value FROM json_each(?)) AND {where}")
+CHUNK_IDS = "SELECT id FROM bulk_edit_rows WHERE edit_id = ? AND id >= ? AND id <= ?"
+UPDATE_CHUNK_SQL = "UPDATE expenses SET {assignments} WHERE id IN (" + CHUNK_IDS + ")"
+DELETE_CHUNK_SQL = "DELETE FROM expenses WHERE id IN (" + CHUNK_IDS + ")"
+EDIT_MONTHS_SQL = "SELECT DISTINCT substr(date, 1, 7) FROM bulk_edit_rows WHERE edit_id = ?"
+
+LIST_EDITS_SQL = ("SELECT id, action, summary, expense_count, created_at, undone_at FROM bulk_edits "
+                  "ORDER BY id DESC LIMIT ?")
+LATEST_EDIT_SQL = "SELECT id, action, undone_at FROM bulk_edits WHERE undone_at IS NULL ORDER BY id DESC LIMIT 1"
+EDIT_SQL = "SELECT id, action, undone_at FROM bulk_edits WHERE id = ?"
+# Undo puts every journaled row back exactly as it was, ids included; AUTOINCREMENT never hands a deleted id out again
+RESTORE_UPDATED_SQL = ("UPDATE expenses SET (amount, category_id, description, date, expense_type_id) = "
+                       "(SELECT amount, category_id, description, date, expense_type_id FROM bulk_edit_rows "
+                       "WHERE edit_id = ? AND bulk_edit_rows.id = expenses.id) "
+                       "WHERE id IN (SELECT id FROM bulk_edit_rows WHERE edit_id = ?)")
+RESTORE_DELETED_SQL = (f"INSERT INTO expenses ({JOURNAL_COLUMNS}) SELECT {JOURNAL_COLUMNS} FROM bulk_edit_rows "
+                       "WHERE edit_id = ?")
+FINISH_UNDO_SQL = "UPDATE bulk_edits SET undone_at = ? WHERE id = ?"
+DROP_JOURNAL_SQL = "DELETE FROM bulk_edit_rows WHERE edit_id = ?"
+
+
+class BulkEditError(Exception):
+    pass
+
+
+def parse_ids(text):
+    # "12, 15-18 20" -> [12, 15, 16, 17, 18, 20]
+    ids = []
+    for part in re.split(r"[\s,]+", text.strip()):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first, last = int(first), int(last or first)
+        except ValueError:
+            raise BulkEditError(f"Invalid expense id or range: {part!r}")
+        ids.extend(range(first, last + 1))
+    return ids
+
+
+class ExpenseFilter:
+    # The expenses a bulk edit applies to: every given criterion has to match. Dates are inclusive YYYY-MM-DD,
+    # names match like the lookup tables do, text is a full-text match and ids a selection from the list.
+    __slots__ = ("start", "end", "category", "expense_type", "text", "ids")
+
+    def __init__(self, start=None, end=None, category=None, expense_type=None, text=None, ids=None):
+        self.start = start or None
+        self.end = end or None
+        self.category = category if category is not None and category.strip() else None
+        self.expense_type = expense_type
+        self.text = text or None
+        self.ids = list(ids) if ids is not None else None
+
+    def is_empty(self):
+        return all(getattr(self, name) is None for name in self.__slots__)
+
+    def where(self):
+        # (SQL condition over expenses, parameters)
+        clauses, params = [], []
+        if self.start:
+            clauses.append("date >= ?")
+            params.append(self.start)
+        if self.end:
+            clauses.append("date <= ?")
+            params.append(self.end)
+        if self.category is not None:
+            clauses.append("category_id = (SELECT id FROM categories WHERE name_key = ?)")
+            params.append(name_key(self.category))
+        if self.expense_type is not None:
+            clauses.append("expense_type_id = (SELECT id FROM expense_types WHERE name_key = ?)")
+            params.append(name_key(self.expense_type))
+        if self.text:
+            # Text without a single word matches nothing rather than everything
+            clauses.append("id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)")
+            params.append(fts_query(self.text) or '""')
+        if self.ids is not None:
+            # One JSON parameter instead of one bound variable per selected id
+            clauses.append("id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(self.ids))
+        return " AND ".join(clauses) or "1", params
+
+    def __str__(self):
+        parts = []
+        if self.start or self.end:
+            parts.append(f"{self.start or '...'} to {self.end or '...'}")
+        if self.category is not None:
+            parts.append(f"category {self.category!r}")
+        if self.expense_type is not None:
+            parts.append(f"type {self.expense_type!r}")
+        if self.text:
+            parts.append(f"matching {self.text!r}")
+        if self.ids is not None:
+            parts.append(f"{len(self.ids)} selected")
+        return ", ".join(parts) or "all expenses"
+
+
+def require_filter(expense_filter):
+    # An empty filter would match the whole ledger; deleting everything has to be asked for explicitly
+    if expense_filter.is_empty():
+        raise BulkEditError("A bulk edit needs at least one filter or selected expense")
+
+
+def preview(connection, expense_filter):
+    # (expense count, total cents, first date, last date) of what a bulk edit with this filter would touch
+    where, params = expense_filter.where()
+    return connection.execute(PREVIEW_SQL.format(where=where), params).fetchone()
+
+
+def _apply(connection, expense_filter, action, summary, chunk_sql, chunk_params, chunk_size, transaction):
+    # The matching ids are read once; then, in one transaction, chunk by chunk in id order, each chunk's rows are
+    # journaled and changed with one set-based statement. Chunks keep every statement and its id list bounded; the
+    # single commit makes the edit all or nothing, so an interrupted edit leaves the ledger as it was.
+    require_filter(expense_filter)
+    where, params = expense_filter.where()
+    ids = [expense_id for expense_id, in connection.execute(MATCHING_IDS_SQL.format(where=where), params)]
+    if not ids:
+        return None, 0, []
+    journal_sql = JOURNAL_CHUNK_SQL.format(where=where)
+    edited = 0
+    with transaction() if transaction is not None else connection:
+        edit_id = connection.execute(START_EDIT_SQL, (action, summary,
+                                                      datetime.now().isoformat(timespec="seconds"))).lastrowid
+        for chunk in batched(ids, chunk_size):
+            journaled = connection.execute(journal_sql, (edit_id, json.dumps(chunk), *params)).rowcount
+            connection.execute(chunk_sql, (*chunk_params, edit_id, chunk[0], chunk[-1]))
+            connection.execute(COUNT_EDIT_SQL, (journaled, edit_id))
+            edited += journaled
+        months = [month for month, in connection.execute(EDIT_MONTHS_SQL, (edit_id,))]
+    return edit_id, edited, months
+
+
+def bulk_update(connection, expense_filter, changes, summary=None, chunk_size=BULK_CHUNK_SIZE, transaction=None):
+    # changes maps UPDATABLE_COLUMNS to new values. Returns (edit id, expenses updated, touched YYYY-MM months).
+    columns = [column for column in UPDATABLE_COLUMNS if column in changes]
+    if not columns:
+        raise BulkEditError("Nothing to change")
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    summary = f"{summary or 'set ' + ', '.join(columns)} where {expense_filter}"
+    return _apply(connection, expense_filter, "update", summary, UPDATE_CHUNK_SQL.format(assignments=assignments),
+                  [changes[column] for column in columns], chunk_size, transaction)
+
+
+def bulk_delete(connection, expense_filter, chunk_size=BULK_CHUNK_SIZE, transaction=None):
+    return _apply(connection, expense_filter, "delete", f"delete where {expense_filter}", DELETE_CHUNK_SQL, [],
+                  chunk_size, transaction)
+
+
+def list_edits(connection, limit=20):
+    return connection.execute(LIST_EDITS_SQL, (limit,)).fetchall()
+
+
+def undo_edit(connection, edit_id=None, transaction=None):
+    # Restores the rows of one bulk edit (by default the latest not yet undone) as they were before it, in one
+    # transaction.
+    # Returns (edit id, expenses restored, touched months). Writes made to those rows since are overwritten.
+    with transaction() if transaction is not None else connection:
+        edit = connection.execute(LATEST_EDIT_SQL if edit_id is None else EDIT_SQL,
+                                  () if edit_id is None else (edit_id,)).fetchone()
+        if edit is None:
+            raise BulkEditError("No bulk edit to undo" if edit_id is None else f"Bulk edit {edit_id} was not found")
+        edit_id, action, undone_at = edit
+        if undone_at is not None:
+            raise BulkEditError(f"Bulk edit {edit_id} was already undone at {undone_at}")
+        months = [month for month, in connection.execute(EDIT_MONTHS_SQL, (edit_id,))]
+        if action == "delete":
+            restored = connection.execute(RESTORE_DELETED_SQL, (edit_id,)).rowcount
+        else:
+            restored = connection.execute(RESTORE_UPDATED_SQL, (edit_id, edit_id)).rowcount
+        connection.execute(FINISH_UNDO_SQL, (datetime.now().isoformat(timespec="seconds"), edit_id))
+        connection.execute(DROP_JOURNAL_SQL, (edit_id,))
+    return edit_id, restored, months
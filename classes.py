@@ -1,108 +1,302 @@
 import sqlite3
+import sys
+import time
 from datetime import datetime
 
+from bulk_edit import BulkEditError, require_filter
+from importer import DEFAULT_BATCH_SIZE, InvalidExpense, iter_expenses, parse_amount, parse_date
+from listing import OUTPUT_FORMATS
+from money import format_cents, format_percentage
+from partitions import ARCHIVE_BATCH_SIZE
+from repository import DEFAULT_DB, ExpenseRepository
+
+
+def ask(prompt, convert=str):
+    # Re-prompts instead of crashing the menu loop on a typo. Its converters, int, parse_amount and optional_date,
+    # report bad input as ValueError (InvalidExpense is one), amounts too large to store included
+    while True:
+        try:
+            return convert(input(prompt))
+        except ValueError as error:
+            print(f"Invalid value ({error}). Please try again!")
+
+
+def optional_date(value):
+    # For ask(): an empty answer leaves the bound open
+    return parse_date(value) if value.strip() else None
+
 
 class ExpenseTracker:
-    def __init__(self, db_name="expense_tracker.db"):
-        self.connection = sqlite3.connect(db_name)
-        self.curr = self.connection.cursor()
-        self.create_table()
-
-    def create_table(self):
-        self.curr.execute("""
-            CREATE TABLE IF NOT EXISTS expenses(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            amount REAL,
-            category TEXT,
-            description TEXT,
-            date DATE,
-            expense_type TEXT
-            )
-        """)
-        self.connection.commit()
-
-    def add_expense(self, amount, category, description, expense_type):
-        date = datetime.now().strftime('%Y-%m-%d')
-        self.curr.execute(
-            'INSERT INTO expenses (amount, category, description, date, expense_type) VALUES (?, ?, ?, ?, ?)',
-            (amount, category, description, date, expense_type))
-        self.connection.commit()
+    def __init__(self, db_name=DEFAULT_DB, profiler=None):
+        self.repository = ExpenseRepository(db_name, profiler=profiler)
+        self.connection = self.repository.connection
+        self.profiler = self.repository.profiler
+
+    def add_expense(self, amount, category, description, expense_type, date=None):
+        expense_id = self.repository.add_expense(amount, category, description, expense_type, date)
         print("Expense has been added successfully!")
+        return expense_id
+
+    def update_expense(self, expense_id, amount, category, description, expense_type):
+        updated = self.repository.update_expense(expense_id, amount, category, description, expense_type)
+        print("Expense has been updated successfully!" if updated else f"Expense {expense_id} was not found!")
+        return updated
+
+    def delete_expense(self, expense_id):
+        deleted = self.repository.delete_expense(expense_id)
+        print("Expense has been deleted successfully!" if deleted else f"Expense {expense_id} was not found!")
+        return deleted
+
+    def show_alerts(self):
+        # Alerts from the last add or update, which stay silent so scripts and benchmarks can call them. The menu and
+        # the CLI print them on stderr, so they still show when -q hides the success messages.
+        for alert in self.repository.last_alerts:
+            print(f"Alert: {alert}", file=sys.stderr)
+
+    def set_budget(self, category, amount):
+        self.repository.set_budget(category, amount)
+        print(f"Monthly budget for {category} set to ${format_cents(amount)}.")
+
+    def remove_budget(self, category):
+        removed = self.repository.remove_budget(category)
+        print(f"Budget for {category} has been removed." if removed else f"{category} has no budget!")
+        return removed
+
+    def show_budgets(self, month=None):
+        budgets = self.repository.budgets(month)
+        if not budgets:
+            print("No budgets yet.")
+            return budgets
+        width = max(len(category) for category, _, _ in budgets) + 3
+        print(f"Budgets for {month or datetime.now().strftime('%Y-%m')}:")
+        for category, budget, spent in budgets:
+            state = "over budget" if spent > budget else f"${format_cents(budget - spent)} left"
+            print(f"  {category:<{width}} ${format_cents(spent):>12} of ${format_cents(budget):>12}   "
+                  f"{format_percentage(spent, budget):>8}   {state}")
+        return budgets
+
+    def add_expenses_bulk(self, expenses, batch_size=DEFAULT_BATCH_SIZE):
+        # expenses yields (amount, category, description, date, expense_type) tuples
+        return self.repository.add_expenses(expenses, batch_size)
 
-    def get_monthly_expenses(self, month, year):
-        start_date = datetime(year, month, 1).strftime('%Y-%m-%d')
-        end_date = datetime(year, month + 1, 1).strftime('%Y-%m-%d')
-
-        # Total monthly expenses
-        self.curr.execute("SELECT SUM(amount) FROM expenses WHERE date >= ? AND date < ?", (start_date, end_date))
-        total_monthly_expense = self.curr.fetchone()[0]
-
-        # Total annual expenses
-        start_year = datetime(year, 1, 1).strftime('%Y-%m-%d')
-        end_year = datetime(year + 1, 1, 1).strftime('%Y-%m-%d')
-        self.curr.execute("SELECT category, SUM(amount) FROM expenses WHERE date >= ? AND date < ? GROUP BY category",
-                          (start_year, end_year))
-        annual_expenses_by_category = self.curr.fetchall()
-
-        # Average expenses for each category for the year
-        average_expenses_by_category = {category: total / 12 for category, total in annual_expenses_by_category}
-
-        # Total expenses for the month by category
-        self.curr.execute("SELECT category, SUM(amount) FROM expenses WHERE date >= ? AND date < ? GROUP BY category",
-                          (start_date, end_date))
-        monthly_expenses_by_category = self.curr.fetchall()
-
-        # Display monthly expense report
-        print(f"Monthly Expense Report for {datetime(year, month, 1).strftime('%B %Y')}:")
-        print("Category      |   Total Expense   |   Percentage   |   Annual Avg   |   Comparison")
-
-        # Calculate maximum column widths
-        max_category_width = max(len(category) for category, _ in monthly_expenses_by_category) + 3
-        max_total_width = max(len(f"${total:.2f}") for _, total in monthly_expenses_by_category) + 3
-        max_percentage_width = max(
-            len(f"{(total / total_monthly_expense) * 100:.2f}%") for _, total in monthly_expenses_by_category) + 3
-        max_annual_avg_width = max(len(f"${average_expenses_by_category.get(category, 0):.2f}") for category, _ in
-                                   monthly_expenses_by_category) + 3
-
-        # Print table header
-        print(
-            "-" * (max_category_width + max_total_width + max_percentage_width + max_annual_avg_width + len(" | ") * 4))
-
-        # Print table rows
-        for category, total in monthly_expenses_by_category:
-            category_percentage = (total / total_monthly_expense) * 100
-            annual_avg = average_expenses_by_category.get(category, 0)
-            comparison = "Higher" if total > annual_avg else "Lower" if total < annual_avg else "Equal"
+    def import_expenses(self, path, batch_size=DEFAULT_BATCH_SIZE, debits_negative=False):
+        # debits_negative: the CSV records money spent as negative amounts (see importer.iter_csv_expenses)
+        errors, skipped = [], []
+        start = time.perf_counter()
+        expenses = iter_expenses(path, errors, skipped, debits_negative, self.repository.first_open_date())
+        inserted = self.add_expenses_bulk(expenses, batch_size)
+        elapsed = time.perf_counter() - start
+        rate = inserted / elapsed if elapsed > 0 else 0
+        print(f"Imported {inserted} expenses in {elapsed:.2f}s ({rate:,.0f} rows/s), {len(skipped)} credits skipped, "
+              f"{len(errors)} rows rejected.")
+        for line_number, error in errors[:10]:
+            print(f"  Row {line_number}: {error}")
+        return inserted, errors
 
+    def get_monthly_expenses(self, month, year, snapshot=None):
+        # Total monthly expenses, by category, and each category's trailing 12-month average, from the database or
+        # from a columnar snapshot (snapshot.Snapshot)
+        total_monthly_expense, monthly_expenses_by_category, average_expenses_by_category = \
+            (snapshot or self.repository).monthly_report(month, year)
+        if total_monthly_expense is None:
+            print("No expenses found! Please try again...")
+            return
+
+        with self.profiler.span("format.monthly_report"):
+            # Display monthly expense report
+            print(f"Monthly Expense Report for {datetime(year, month, 1).strftime('%B %Y')}:")
+            print("Category      |   Total Expense   |   Percentage   |   Annual Avg   |   Comparison")
+
+            # Calculate maximum column widths
+            max_category_width = max(len(category) for category, _ in monthly_expenses_by_category) + 3
+            max_total_width = max(len(f"${format_cents(total)}") for _, total in monthly_expenses_by_category) + 3
+            max_percentage_width = max(
+                len(format_percentage(total, total_monthly_expense)) for _, total in monthly_expenses_by_category) + 3
+            max_annual_avg_width = max(len(f"${format_cents(average_expenses_by_category.get(category, 0))}")
+                                       for category, _ in monthly_expenses_by_category) + 3
+
+            # Print table header
             print(
-                f"{category:<{max_category_width}} |   ${total:>{max_total_width - 1}.2f}   |   {category_percentage:>{max_percentage_width - 1}.2f}%  |   ${annual_avg:>{max_annual_avg_width - 1}.2f}  |   {comparison}")
-
-        # Print bottom line of table
-        print(
-            "-" * (max_category_width + max_total_width + max_percentage_width + max_annual_avg_width + len(" | ") * 4))
-
-    def view_expenses(self):
-        self.curr.execute("SELECT * FROM expenses ORDER BY date")
-        expenses = self.curr.fetchall()
-        if expenses:
-            # Define column names
-            columns = ["ID", "Amount", "Category", "Description", "Expense Type", "Date"]
-            # Calculate maximum width for each column
-            max_widths = [max(len(str(expense[i])) for expense in expenses) for i in range(len(columns))]
-            # Add some extra padding
-            max_widths = [max_width + 3 for max_width in max_widths]
-
-            # Print header
-            header = " | ".join(f"{column:<{max_widths[i]}}" for i, column in enumerate(columns))
-            print(header)
-            print("-" * sum(max_widths))
-
-            # Print expenses
-            for expense in expenses:
-                row = " | ".join(f"{str(expense[i]):<{max_widths[i]}}" for i in range(len(columns)))
-                print(row)
+                "-" * (max_category_width + max_total_width + max_percentage_width + max_annual_avg_width + len(" | ") * 4))
+
+            # Print table rows
+            for category, total in monthly_expenses_by_category:
+                category_percentage = format_percentage(total, total_monthly_expense)
+                annual_avg = average_expenses_by_category.get(category, 0)
+                comparison = "Higher" if total > annual_avg else "Lower" if total < annual_avg else "Equal"
+
+                print(
+                    f"{category:<{max_category_width}} |   ${format_cents(total):>{max_total_width - 1}}   |   {category_percentage:>{max_percentage_width}}  |   ${format_cents(annual_avg):>{max_annual_avg_width - 1}}  |   {comparison}")
+
+            # Print bottom line of table
+            print(
+                "-" * (max_category_width + max_total_width + max_percentage_width + max_annual_avg_width + len(" | ") * 4))
+
+    def show_spending_trends(self):
+        with self.profiler.span("analytics.summary"):
+            analytics = self.repository.spending_analytics()
+            rows = analytics.summary()
+        if not rows:
+            print("No expenses found! Please try again...")
+            return
+
+        print(f"Spending Trends up to {analytics.latest_month}:")
+        columns = ["Category", "Month", "Avg 3m", "Avg 6m", "Avg 12m", "YoY", "Median", "P90", "Forecast"]
+        width = max(len(row[0]) for row in rows) + 3
+        print(f"{columns[0]:<{width}}" + "".join(f"{column:>12}" for column in columns[1:]))
+        print("-" * (width + 12 * (len(columns) - 1)))
+        for category, *values in rows:
+            print(f"{category:<{width}}" + "".join("           -" if value != value else f"{value:>12.2f}"
+                                                   for value in values))
+
+    def search_expenses(self, query, date_range=None):
+        expenses = self.repository.search_expenses(query, date_range)
+        if not expenses:
+            print("No matching expenses found! Please try again...")
+            return expenses
+
+        columns = ["ID", "Amount", "Category", "Description", "Date", "Expense Type"]
+        rows = [(str(expense.id), format_cents(expense.amount), expense.category, expense.description, expense.date,
+                 expense.expense_type) for expense in expenses]
+        max_widths = [max(len(column), *(len(row[i]) for row in rows)) + 3 for i, column in enumerate(columns)]
+        print(" | ".join(f"{column:<{max_widths[i]}}" for i, column in enumerate(columns)))
+        print("-" * sum(max_widths))
+        for row in rows:
+            print(" | ".join(f"{row[i]:<{max_widths[i]}}" for i in range(len(columns))))
+        return expenses
+
+    def rebuild_rollups(self):
+        rows = self.repository.rebuild_rollups()
+        print(f"Monthly totals have been rebuilt ({rows} month/category rows).")
+
+    def check_rollups(self):
+        mismatches = self.repository.check_rollups()
+        if not mismatches:
+            print("Monthly totals are consistent with the expenses table.")
+        for month, category, actual, expected in mismatches:
+            print(f"  {month} {category}: rollup ${format_cents(actual[0] or 0)} ({actual[1]} rows), "
+                  f"expenses ${format_cents(expected[0] or 0)} ({expected[1]} rows)")
+        return mismatches
+
+    def preview_bulk_edit(self, expense_filter):
+        count, total, first_date, last_date = self.repository.preview_bulk_edit(expense_filter)
+        if not count:
+            print(f"No expenses match {expense_filter}.")
         else:
+            print(f"{count} expenses match {expense_filter}: ${format_cents(total)} from {first_date} to {last_date}.")
+        return count
+
+    def bulk_update(self, expense_filter, amount=None, category=None, description=None, expense_type=None,
+                    dry_run=False):
+        require_filter(expense_filter)
+        if amount is None and category is None and description is None and expense_type is None:
+            raise BulkEditError("Nothing to change")
+        if not self.preview_bulk_edit(expense_filter) or dry_run:
+            return 0
+        start = time.perf_counter()
+        edit_id, updated = self.repository.bulk_update(expense_filter, amount, category, description, expense_type)
+        print(f"Updated {updated} expenses in {time.perf_counter() - start:.2f}s (undo with: undo {edit_id}).")
+        return updated
+
+    def bulk_delete(self, expense_filter, dry_run=False):
+        require_filter(expense_filter)
+        if not self.preview_bulk_edit(expense_filter) or dry_run:
+            return 0
+        start = time.perf_counter()
+        edit_id, deleted = self.repository.bulk_delete(expense_filter)
+        print(f"Deleted {deleted} expenses in {time.perf_counter() - start:.2f}s (undo with: undo {edit_id}).")
+        return deleted
+
+    def undo_bulk_edit(self, edit_id=None):
+        edit_id, restored = self.repository.undo_bulk_edit(edit_id)
+        print(f"Bulk edit {edit_id} has been undone, {restored} expenses restored.")
+        return restored
+
+    def show_bulk_edits(self):
+        edits = self.repository.bulk_edits()
+        if not edits:
+            print("No bulk edits yet.")
+        for edit_id, action, summary, count, created_at, undone_at in edits:
+            state = f"undone {undone_at}" if undone_at else "can be undone"
+            print(f"  {edit_id}: {created_at} {action} of {count} expenses, {summary} ({state})")
+        return edits
+
+    def archive_years(self, before, batch_size=ARCHIVE_BATCH_SIZE, vacuum=False):
+        start = time.perf_counter()
+        archived = 0
+        for year, moved, count, total in self.repository.archive_years(before, batch_size, vacuum):
+            archived += 1
+            print(f"Archived {year}: {moved} expenses moved, {count} expenses totalling ${format_cents(total)}.")
+        if not archived:
+            print(f"Nothing to archive before {before}.")
+        else:
+            print(f"Archived {archived} years in {time.perf_counter() - start:.2f}s.")
+        self.show_partitions()
+        return archived
+
+    def show_partitions(self):
+        partitions = self.repository.list_partitions()
+        if not partitions:
+            print("No archived years; every expense is in the main database.")
+        for year, path, count, total, archived_at in partitions:
+            print(f"  {year}: {path}, {count} expenses, ${format_cents(total)}, archived {archived_at}")
+
+    def show_yearly_totals(self, start=None, end=None, snapshot=None):
+        # Per-year category totals over [start, end); each partition is summed in its own process, a snapshot in one
+        with self.profiler.span("snapshot.yearly_totals" if snapshot else "partitions.yearly_totals"):
+            totals = (snapshot or self.repository).yearly_totals(start, end)
+        if not totals:
             print("No expenses found! Please try again...")
+            return totals
+
+        width = max(len(category) for rows in totals.values() for category, _, _ in rows) + 3
+        for year, rows in totals.items():
+            year_total = sum(cents for _, cents, _ in rows)
+            year_count = sum(count for _, _, count in rows)
+            print(f"{year}: ${format_cents(year_total)} over {year_count} expenses")
+            for category, cents, count in rows:
+                print(f"  {category:<{width}} ${format_cents(cents):>14}   {format_percentage(cents, year_total):>8}"
+                      f"   {count:>8} expenses")
+        return totals
+
+    def export_snapshot(self, path=None, full=False):
+        start = time.perf_counter()
+        appended, total, last_id, rebuilt = self.repository.export_snapshot(path, full)
+        elapsed = time.perf_counter() - start
+        if rebuilt:
+            print(f"Snapshot written in full: {total} expenses up to id {last_id} in {elapsed:.2f}s.")
+        elif appended:
+            print(f"Snapshot updated: {appended} new expenses appended, {total} in all up to id {last_id} "
+                  f"in {elapsed:.2f}s.")
+        else:
+            print(f"Snapshot is up to date: {total} expenses up to id {last_id}.")
+        return appended
+
+    def show_diagnostics(self):
+        # Query and formatting timings, recorded when profiling is enabled
+        print(self.profiler.report())
+        print(self.repository.report_cache.summary())
+        print(self.repository.categories.summary())
+        print(self.repository.expense_types.summary())
+
+    def export_diagnostics(self, path):
+        self.profiler.export(path)
+        print(f"Diagnostics have been written to {path}.")
+
+    def view_expenses(self, output_format="table", output=None, snapshot=None):
+        # Rows are streamed with fetchmany, so listing memory stays bounded regardless of table size
+        # The span covers fetching and formatting together; the SQL share shows up under the listing query
+        source = snapshot or self.repository
+        with self.profiler.span(f"cli.view_expenses.{output_format}"):
+            if output is None:
+                count = source.write_expenses(sys.stdout, output_format)
+                sys.stdout.flush()
+            else:
+                with open(output, "w", newline="", encoding="utf-8", buffering=1 << 20) as output_file:
+                    count = source.write_expenses(output_file, output_format)
+        if not count and output_format == "table":
+            print("No expenses found! Please try again...")
+        return count
 
     def main(self):
         while True:
@@ -110,35 +304,81 @@ class ExpenseTracker:
             print("1. 💷Add expense💷")
             print("2. 🔍View expenses🔍")
             print("3. 📅View total expenses for a month📅")
-            print("4. 👀Exit👀")
+            print("4. 📥Import expenses from CSV/OFX📥")
+            print("5. 🧮Check and repair monthly totals🧮")
+            print("6. 📈View spending trends📈")
+            print("7. 🔎Search expenses🔎")
+            print("8. 🩺Diagnostics🩺")
+            print("9. 👀Exit👀")
 
-            choice = int(input("Enter your choice: "))
+            choice = ask("Enter your choice: ", int)
 
             if choice == 1:
-                amount = float(input("Enter the amount of money spent: $"))
+                amount = ask("Enter the amount of money spent: $", parse_amount)
                 category = input("Enter the category name: ")
                 description = input("Provide a small description: ")
                 expense_type = input("Enter the expense type: ")
                 self.add_expense(amount, category, description, expense_type)
+                self.show_alerts()
 
             elif choice == 2:
-                self.view_expenses()
+                output_format = input(f"Output format ({'/'.join(OUTPUT_FORMATS)}) [table]: ").strip() or "table"
+                output = input("Write to file (leave empty for screen): ").strip() or None
+                if output_format in OUTPUT_FORMATS:
+                    self.view_expenses(output_format, output)
+                else:
+                    print("Invalid output format. Please try again!")
 
             elif choice == 3:
-                year = int(input("Enter the year: "))
-                month = int(input("Enter a month: "))
+                year = ask("Enter the year: ", int)
+                month = ask("Enter a month: ", int)
+                if not 1 <= year <= 9999:
+                    print("Invalid year. Please try again!")
+                    continue
+                if not 1 <= month <= 12:
+                    print("Invalid month. Please try again!")
+                    continue
                 self.get_monthly_expenses(month, year)
 
             elif choice == 4:
+                path = input("Enter the path of the CSV/OFX file: ").strip()
+                debits_negative = input("Is money spent written as negative amounts (CSV only)? [y/N]: ")
+                try:
+                    self.import_expenses(path, debits_negative=debits_negative.strip().lower().startswith("y"))
+                except (OSError, InvalidExpense, sqlite3.Error) as error:
+                    print(f"Import failed: {error}")
+
+            elif choice == 5:
+                if self.check_rollups():
+                    self.rebuild_rollups()
+
+            elif choice == 6:
+                self.show_spending_trends()
+
+            elif choice == 7:
+                query = input("Search for: ")
+                start = ask("From date (YYYY-MM-DD, optional): ", optional_date)
+                end = ask("To date (YYYY-MM-DD, optional): ", optional_date)
+                self.search_expenses(query, (start, end))
+
+            elif choice == 8:
+                self.show_diagnostics()
+                path = input("Export as JSON to (leave empty to skip): ").strip()
+                if path:
+                    self.export_diagnostics(path)
+
+            elif choice == 9:
                 print("Initializing exit...")
                 break
 
             else:
                 print("Invalid choice. Please try again!")
 
-        self.connection.close()
+        self.repository.close()
 
 
 if __name__ == "__main__":
-    tracker = ExpenseTracker()
-    tracker.main()
+    # Subcommands and batch files are handled by cli.py; with no arguments it starts the menu above
+    from cli import main
+
+    sys.exit(main())
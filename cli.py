@@ -0,0 +1,308 @@
+import argparse
+import contextlib
+import os
+import shlex
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from bulk_edit import BulkEditError, ExpenseFilter, parse_ids
+from classes import ExpenseTracker
+from importer import DEFAULT_BATCH_SIZE, InvalidExpense, parse_amount, parse_date
+from listing import OUTPUT_FORMATS
+from partitions import ARCHIVE_BATCH_SIZE, ArchiveError
+from profiling import Profiler
+from repository import DEFAULT_DB
+from snapshot import SnapshotError
+
+WRITE_COMMANDS = {"add", "import", "update", "delete", "bulk-update", "bulk-delete", "undo", "budget"}
+
+
+class CommandError(Exception):
+    pass
+
+
+class CommandParser(argparse.ArgumentParser):
+    # Raise instead of exiting, so one bad line in a batch does not end the whole run
+    def error(self, message):
+        raise CommandError(f"{self.prog}: {message}")
+
+
+def amount_argument(value):
+    # parse_amount turns every unusable amount, including ones too large to store, into InvalidExpense (a ValueError)
+    try:
+        return parse_amount(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def positive_int_argument(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Must be at least 1: {value!r}")
+    return number
+
+
+def date_argument(value):
+    try:
+        return parse_date(value)
+    except InvalidExpense as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def month_argument(value):
+    try:
+        year, month = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid month: {value!r} (expected YYYY-MM)")
+    if not 1 <= year <= 9999 or not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError(f"Invalid month: {value!r} (expected YYYY-MM)")
+    return year, month
+
+
+def ids_argument(value):
+    try:
+        return parse_ids(value)
+    except BulkEditError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--from", dest="start", type=date_argument, help="first date included")
+    parser.add_argument("--to", dest="end", type=date_argument, help="last date included")
+    parser.add_argument("--category")
+    parser.add_argument("--type", dest="expense_type")
+    parser.add_argument("--match", help="full-text match on description, category and type")
+    parser.add_argument("--ids", type=ids_argument, help="expense ids, e.g. 12,15-20")
+    parser.add_argument("--dry-run", action="store_true", help="only show how many expenses would change")
+
+
+def expense_filter(args):
+    return ExpenseFilter(args.start, args.end, args.category, args.expense_type, args.match, args.ids)
+
+
+def add_snapshot_argument(parser):
+    parser.add_argument("--snapshot", nargs="?", const="", metavar="PATH",
+                        help="read from the columnar snapshot instead of the database (default: next to --db)")
+
+
+def open_snapshot(tracker, args):
+    # Batch lines carry no --db of their own, so the default path comes from the open database
+    if args.snapshot is None:
+        return None
+    return tracker.repository.open_snapshot(args.snapshot or None)
+
+
+def build_parser():
+    parser = CommandParser(prog="expense-tracker", description="Expense tracker. Run without a command for the menu.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database file")
+    parser.add_argument("--profile", action="store_true", help="record query and formatting timings")
+    parser.add_argument("-q", "--quiet", action="store_true", help="hide per-command success messages")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    add = commands.add_parser("add", help="add one expense")
+    add.add_argument("amount", type=amount_argument)
+    add.add_argument("category")
+    add.add_argument("-d", "--description", default="")
+    add.add_argument("-t", "--type", dest="expense_type", default="")
+    add.add_argument("--date", type=date_argument, help="defaults to today")
+
+    import_parser = commands.add_parser("import", help="import a CSV or OFX statement")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=positive_int_argument, default=DEFAULT_BATCH_SIZE)
+    import_parser.add_argument("--debits-negative", action="store_true",
+                               help="the CSV records money spent as negative amounts; other rows are skipped as credits")
+
+    list_parser = commands.add_parser("list", help="list every expense")
+    list_parser.add_argument("-f", "--format", dest="output_format", choices=OUTPUT_FORMATS, default="table")
+    list_parser.add_argument("-o", "--output", help="write to this file instead of stdout")
+    add_snapshot_argument(list_parser)
+
+    report = commands.add_parser("report", help="monthly report, e.g. report 2024-03")
+    report.add_argument("month", type=month_argument, metavar="YYYY-MM")
+    add_snapshot_argument(report)
+
+    update = commands.add_parser("update", help="replace an expense's amount, category, description and type")
+    update.add_argument("id", type=int)
+    update.add_argument("amount", type=amount_argument)
+    update.add_argument("category")
+    update.add_argument("-d", "--description", default="")
+    update.add_argument("-t", "--type", dest="expense_type", default="")
+
+    delete = commands.add_parser("delete", help="delete an expense")
+    delete.add_argument("id", type=int)
+
+    bulk_update = commands.add_parser("bulk-update", help="change every expense matching a filter, undoably")
+    add_filter_arguments(bulk_update)
+    bulk_update.add_argument("--set-amount", type=amount_argument)
+    bulk_update.add_argument("--set-category")
+    bulk_update.add_argument("--set-description")
+    bulk_update.add_argument("--set-type")
+
+    bulk_delete = commands.add_parser("bulk-delete", help="delete every expense matching a filter, undoably")
+    add_filter_arguments(bulk_delete)
+
+    undo = commands.add_parser("undo", help="undo a bulk update or delete (default: the latest)")
+    undo.add_argument("edit_id", type=int, nargs="?")
+    commands.add_parser("edits", help="list recent bulk updates and deletes")
+
+    budget = commands.add_parser("budget", help="set or remove a category's monthly budget, e.g. budget Food 400")
+    budget.add_argument("category")
+    budget.add_argument("amount", type=amount_argument, nargs="?")
+    budget.add_argument("--remove", action="store_true", help="remove the category's budget")
+    budgets = commands.add_parser("budgets", help="budgets and spending per category for a month")
+    budgets.add_argument("month", type=month_argument, metavar="YYYY-MM", nargs="?", help="defaults to this month")
+
+    years = commands.add_parser("years", help="per-year category totals across archived and current years")
+    years.add_argument("--from", dest="start", type=date_argument, help="first date included")
+    years.add_argument("--to", dest="end", type=date_argument, help="first date excluded")
+    add_snapshot_argument(years)
+
+    archive = commands.add_parser("archive", help="move closed years into read-only per-year archive files")
+    archive.add_argument("--before", type=int, default=datetime.now().year,
+                         help="archive every year before this one (default: the current year)")
+    archive.add_argument("--batch-size", type=positive_int_argument, default=ARCHIVE_BATCH_SIZE)
+    archive.add_argument("--vacuum", action="store_true", help="also compact the main database afterwards")
+
+    snapshot = commands.add_parser("snapshot", help="export new expenses to a memory-mappable columnar snapshot")
+    snapshot.add_argument("--path", help="snapshot directory (default: next to --db)")
+    snapshot.add_argument("--full", action="store_true", help="rewrite the whole snapshot instead of appending")
+
+    batch = commands.add_parser("batch", help="run commands from a file, one per line ('-' for stdin)")
+    batch.add_argument("file", nargs="?", default="-")
+    batch.add_argument("--stop-on-error", action="store_true", help="roll back everything at the first error")
+    return parser
+
+
+def run_command(tracker, args):
+    # Returns False when the command could not do what was asked
+    if args.command == "add":
+        tracker.add_expense(args.amount, args.category.strip() or "Uncategorized", args.description,
+                            args.expense_type, args.date)
+        tracker.show_alerts()
+    elif args.command == "import":
+        inserted, errors = tracker.import_expenses(args.path, args.batch_size, args.debits_negative)
+        return not errors
+    elif args.command == "list":
+        tracker.view_expenses(args.output_format, args.output, open_snapshot(tracker, args))
+    elif args.command == "report":
+        year, month = args.month
+        tracker.get_monthly_expenses(month, year, open_snapshot(tracker, args))
+    elif args.command == "update":
+        updated = tracker.update_expense(args.id, args.amount, args.category.strip() or "Uncategorized",
+                                         args.description, args.expense_type)
+        tracker.show_alerts()
+        return bool(updated)
+    elif args.command == "delete":
+        return bool(tracker.delete_expense(args.id))
+    elif args.command == "bulk-update":
+        tracker.bulk_update(expense_filter(args), args.set_amount, args.set_category, args.set_description,
+                            args.set_type, args.dry_run)
+    elif args.command == "bulk-delete":
+        tracker.bulk_delete(expense_filter(args), args.dry_run)
+    elif args.command == "undo":
+        tracker.undo_bulk_edit(args.edit_id)
+    elif args.command == "edits":
+        tracker.show_bulk_edits()
+    elif args.command == "budget":
+        if args.remove:
+            return bool(tracker.remove_budget(args.category))
+        if args.amount is None:
+            raise CommandError("budget: expected an amount, or --remove")
+        tracker.set_budget(args.category, args.amount)
+    elif args.command == "budgets":
+        tracker.show_budgets(f"{args.month[0]:04d}-{args.month[1]:02d}" if args.month else None)
+    elif args.command == "years":
+        tracker.show_yearly_totals(args.start, args.end, open_snapshot(tracker, args))
+    elif args.command == "archive":
+        tracker.archive_years(args.before, args.batch_size, args.vacuum)
+    elif args.command == "snapshot":
+        tracker.export_snapshot(args.path, args.full)
+    return True
+
+
+def run_quietly(tracker, args, quiet):
+    if quiet and args.command in WRITE_COMMANDS:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return run_command(tracker, args)
+    return run_command(tracker, args)
+
+
+def run_batch(tracker, parser, lines, quiet=False, stop_on_error=False):
+    # One process, one transaction, one commit for the whole file; each write still runs in its own savepoint,
+    # so a failing line is undone on its own unless stop_on_error asks for all or nothing
+    executed = failed = 0
+    start = time.perf_counter()
+    with tracker.repository.transaction():
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command in (None, "batch", "archive", "snapshot"):
+                    raise CommandError("expected a command other than batch, archive or snapshot")
+                succeeded = run_quietly(tracker, args, quiet)
+            except SystemExit as error:
+                # -h/--help prints its text and exits; in a batch that only ends this line, not the transaction
+                succeeded = not error.code
+            except (BulkEditError, CommandError, InvalidExpense, OSError, SnapshotError, ValueError,
+                    sqlite3.Error) as error:
+                succeeded = False
+                print(f"Line {line_number}: {error}", file=sys.stderr)
+            else:
+                if not succeeded:
+                    print(f"Line {line_number}: {line} did not complete", file=sys.stderr)
+            executed += 1
+            if not succeeded:
+                failed += 1
+                if stop_on_error:
+                    raise CommandError(f"Stopped at line {line_number}; nothing was committed")
+    elapsed = time.perf_counter() - start
+    print(f"Batch: {executed} commands in {elapsed:.2f}s, {failed} failed, committed once.", file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except CommandError as error:
+        parser.print_usage(sys.stderr)
+        print(error, file=sys.stderr)
+        return 2
+
+    tracker = ExpenseTracker(args.db, Profiler(enabled=True) if args.profile else None)
+    try:
+        if args.command is None:
+            tracker.main()
+            return 0
+        if args.command == "batch":
+            if args.file == "-":
+                failed = run_batch(tracker, parser, sys.stdin, args.quiet, args.stop_on_error)
+            else:
+                with open(args.file, encoding="utf-8") as batch_file:
+                    failed = run_batch(tracker, parser, batch_file, args.quiet, args.stop_on_error)
+            return 1 if failed else 0
+        return 0 if run_quietly(tracker, args, args.quiet) else 1
+    except BrokenPipeError:
+        # Output piped into e.g. head, which stopped reading; silence the flush at interpreter exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (ArchiveError, BulkEditError, CommandError, InvalidExpense, OSError, SnapshotError, ValueError,
+            sqlite3.Error) as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        if args.profile and args.command is not None:
+            print(tracker.profiler.report(), file=sys.stderr)
+        if args.command is not None:
+            tracker.repository.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
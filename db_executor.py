@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from profiling import Profiler
+from repository import ExpenseRepository
+
+POLL_INTERVAL_MS = 15
+STALL_INTERVAL_MS = 16
+STALL_THRESHOLD_MS = 50
+
+
+class DatabaseRequest:
+    def __init__(self, function, args, callback, error_callback, key, generation):
+        self.function = function
+        self.args = args
+        self.callback = callback
+        self.error_callback = error_callback
+        self.key = key
+        self.generation = generation
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+
+class DatabaseExecutor:
+    # Runs all database work on one worker thread that owns its own repository connection.
+    # Results are handed back to the Tk main loop through master.after polling.
+    def __init__(self, master, db_name, poll_interval=POLL_INTERVAL_MS, profiler=None):
+        self.master = master
+        self.poll_interval = poll_interval
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.repository = None
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.generations = {}
+        # The request the worker is running. Read and written only under running_lock, so an interrupt aimed at it
+        # can never land on the next request instead.
+        self.running = None
+        self.running_lock = threading.Lock()
+        self.latencies = deque(maxlen=1000)
+        self.closed = False
+
+        self.worker = threading.Thread(target=self._work, name="database-worker", daemon=True)
+        self.worker.start()
+        self._poll_id = self.master.after(self.poll_interval, self._poll)
+        # Opening and migrating the database is the worker's first request
+        self.submit(self._open, db_name)
+
+    def _open(self, _, db_name):
+        self.repository = ExpenseRepository(db_name, profiler=self.profiler)
+
+    def _interrupt_running(self, key):
+        # Holding the lock keeps the worker on this request until interrupt() has been delivered
+        with self.running_lock:
+            running = self.running
+            if running is not None and running.key == key:
+                running.cancelled = True
+                if self.repository is not None:
+                    self.repository.connection.interrupt()
+
+    def submit(self, function, *args, callback=None, error_callback=None, key=None):
+        # A new request with the same key makes any queued or running one with that key stale
+        generation = None
+        if key is not None:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+            self._interrupt_running(key)
+        request = DatabaseRequest(function, args, callback, error_callback, key, generation)
+        self.requests.put(request)
+        return request
+
+    def cancel(self, key):
+        self.generations[key] = self.generations.get(key, 0) + 1
+        self._interrupt_running(key)
+
+    def _is_stale(self, request):
+        return request.cancelled or (request.key is not None and self.generations.get(request.key) != request.generation)
+
+    def _work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            with self.running_lock:
+                if self._is_stale(request):
+                    continue
+                self.running = request
+            request.started = time.perf_counter()
+            try:
+                result, error = request.function(self.repository, *request.args), None
+            except Exception as exception:
+                if self.repository is not None and self.repository.connection.in_transaction:
+                    self.repository.connection.rollback()
+                result, error = None, exception
+            finally:
+                with self.running_lock:
+                    self.running = None
+            request.finished = time.perf_counter()
+            self.results.put((request, result, error))
+        if self.repository is not None:
+            self.repository.close()
+
+    def _poll(self):
+        while True:
+            try:
+                request, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.latencies.append((request.finished - request.submitted) * 1000)
+            if self._is_stale(request):
+                continue
+            if error is not None:
+                if request.error_callback is not None:
+                    request.error_callback(error)
+                else:
+                    self.master.report_callback_exception(type(error), error, error.__traceback__)
+            elif request.callback is not None:
+                request.callback(result)
+        if not self.closed:
+            self._poll_id = self.master.after(self.poll_interval, self._poll)
+
+    def summary(self):
+        if not self.latencies:
+            return "Database requests: none"
+        latencies = sorted(self.latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return f"Database requests: {len(latencies)}, p50 {p50:.1f}ms, p99 {p99:.1f}ms"
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.master.after_cancel(self._poll_id)
+        self.requests.put(None)
+        self.worker.join()
+
+
+class FrameStallMonitor:
+    # Schedules a tick every frame and records how late the main loop ran it
+    def __init__(self, master, interval=STALL_INTERVAL_MS, threshold=STALL_THRESHOLD_MS):
+        self.master = master
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=1000)
+        self.ticks = 0
+        self.expected = time.perf_counter() + interval / 1000
+        self._tick_id = self.master.after(self.interval, self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        lateness = (now - self.expected) * 1000
+        self.ticks += 1
+        if lateness > self.threshold:
+            self.stalls.append(lateness)
+        self.expected = now + self.interval / 1000
+        self._tick_id = self.master.after(self.interval, self._tick)
+
+    def stop(self):
+        self.master.after_cancel(self._tick_id)
+
+    def summary(self):
+        if not self.stalls:
+            return f"UI frames: {self.ticks} ticks, no stalls over {self.threshold}ms"
+        return (f"UI frames: {self.ticks} ticks, {len(self.stalls)} stalls over {self.threshold}ms, "
+                f"worst {max(self.stalls):.0f}ms")
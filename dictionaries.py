@@ -0,0 +1,63 @@
+def clean_name(name, default=""):
+    # Surrounding and repeated whitespace never makes a different category
+    return " ".join((name or "").split()) or default
+
+
+def name_key(name, default=""):
+    # "Food", "food " and "FOOD" share one key and so one dictionary id
+    return clean_name(name, default).casefold()
+
+
+class Dictionary:
+    # Interning cache over one lookup table (categories or expense_types): normalized name -> id, id -> name.
+    # Ids are never reused or renamed, so a cached entry can only go stale when the insert that created it is
+    # rolled back; the repository clears the cache whenever that happens.
+    def __init__(self, connection, table, default=""):
+        self.connection = connection
+        self.table = table
+        self.default = default
+        self.select_sql = f"SELECT id, name FROM {table} WHERE name_key = ?"
+        self.insert_sql = (f"INSERT INTO {table} (name, name_key) VALUES (?, ?) ON CONFLICT (name_key) DO NOTHING "
+                           "RETURNING id, name")
+        self.load_sql = f"SELECT id, name, name_key FROM {table}"
+        self.hits = self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.ids = {}
+        self.names = {}
+        self.data_version = None
+
+    def intern(self, name):
+        # The first spelling seen becomes the display name; later variants map onto its id
+        key = name_key(name, self.default)
+        dictionary_id = self.ids.get(key)
+        if dictionary_id is not None:
+            self.hits += 1
+            return dictionary_id
+        self.misses += 1
+        row = self.connection.execute(self.select_sql, (key,)).fetchone()
+        if row is None:
+            # Another connection may insert the same name between the lookup and the insert
+            inserted = self.connection.execute(self.insert_sql, (clean_name(name, self.default), key)).fetchall()
+            row = inserted[0] if inserted else self.connection.execute(self.select_sql, (key,)).fetchone()
+        self.ids[key] = row[0]
+        self.names[row[0]] = row[1]
+        return row[0]
+
+    def refresh(self):
+        # Reloads the whole (small) table when another connection may have added names
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        for dictionary_id, name, key in self.connection.execute(self.load_sql):
+            self.ids[key] = dictionary_id
+            self.names[dictionary_id] = name
+        self.data_version = data_version
+
+    def all_names(self):
+        self.refresh()
+        return sorted(self.names.values(), key=str.casefold)
+
+    def summary(self):
+        return f"{self.table}: {len(self.ids)} cached names, {self.hits} hits, {self.misses} misses"
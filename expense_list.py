@@ -0,0 +1,162 @@
+import re
+from tkinter import TclError
+
+import customtkinter as tk
+
+from money import expense_rows, format_cents
+from schema import EXPENSE_COUNT_SQL, FIRST_PAGE_SQL, NEXT_PAGE_SQL, PAGE_FROM_SQL, PREVIOUS_PAGE_SQL, SEEK_PAGE_SQL
+
+DEFAULT_PAGE_SIZE = 100
+PAGE_SIZES = ["50", "100", "250", "500", "1000"]
+
+
+def format_expense(expense):
+    return (f"👾 ID: {expense.id}\n🤠 Amount: ${format_cents(expense.amount)}\n"
+            f"🤖 Category: {expense.category}\n🧐 Description: {expense.description}\n"
+            f"👻 Date: {expense.date}\n"
+            f"🥷 Expense Type: {expense.expense_type}\n\n")
+
+
+class ExpensePager:
+    # Keeps a sliding window of at most a few pages of Expense records around the visible rows,
+    # fetched by (date, id) keyset
+    def __init__(self, page_size=DEFAULT_PAGE_SIZE, max_pages=3):
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.rows = []
+        self.start = 0
+        self.total = 0
+
+    def reset(self, connection, page_size=None):
+        if page_size:
+            self.page_size = page_size
+        self.total = connection.execute(EXPENSE_COUNT_SQL).fetchone()[0]
+        self.rows = expense_rows(connection.execute(FIRST_PAGE_SQL, (self.page_size,)))
+        self.start = 0
+
+    @property
+    def max_rows(self):
+        return self.page_size * self.max_pages
+
+    @property
+    def end(self):
+        return self.start + len(self.rows)
+
+    def window(self, connection, first, count):
+        # Returns the rows [first, first + count), fetching and evicting pages as needed
+        last = min(first + count, self.total)
+        if first < self.start - self.page_size or last > self.end + self.page_size:
+            self._seek(connection, first)
+        while first < self.start and self._fetch_previous(connection):
+            pass
+        while last > self.end and self._fetch_next(connection):
+            pass
+        return self.rows[first - self.start:last - self.start]
+
+    def _seek(self, connection, first):
+        anchor = connection.execute(SEEK_PAGE_SQL, (first,)).fetchone()
+        self.rows = expense_rows(connection.execute(PAGE_FROM_SQL, (*anchor, self.page_size))) if anchor else []
+        self.start = first
+
+    def _fetch_next(self, connection):
+        if not self.rows:
+            return False
+        last = self.rows[-1]
+        page = expense_rows(connection.execute(NEXT_PAGE_SQL, (last.date, last.id, self.page_size)))
+        self.rows.extend(page)
+        overflow = len(self.rows) - self.max_rows
+        if overflow > 0:
+            del self.rows[:overflow]
+            self.start += overflow
+        return bool(page)
+
+    def _fetch_previous(self, connection):
+        if not self.rows or self.start == 0:
+            return False
+        first = self.rows[0]
+        page = expense_rows(connection.execute(PREVIOUS_PAGE_SQL, (first.date, first.id, self.page_size)))
+        page.reverse()
+        self.rows[:0] = page
+        self.start -= len(page)
+        overflow = len(self.rows) - self.max_rows
+        if overflow > 0:
+            del self.rows[-overflow:]
+        return bool(page)
+
+
+class ExpenseListView(tk.CTkFrame):
+    # Only the visible expenses are formatted and inserted into the textbox.
+    # The pager is only ever touched from the database worker thread.
+    def __init__(self, master, executor, visible_rows=5, **kwargs):
+        super().__init__(master, **kwargs)
+        self.executor = executor
+        self.pager = ExpensePager()
+        self.visible_rows = visible_rows
+        self.top = 0
+
+        self.textbox = tk.CTkTextbox(self, height=250, width=380, activate_scrollbars=False)
+        self.textbox.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = tk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.textbox.bind(sequence, self.on_mouse_wheel)
+
+    def refresh(self, page_size=None):
+        self.top = 0
+        self.executor.submit(self.load, 0, True, page_size, callback=self.render, key=id(self))
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, self.pager.total - self.visible_rows))
+        # Superseded scroll requests are cancelled, only the latest position is fetched
+        self.executor.submit(self.load, self.top, False, None, callback=self.render, key=id(self))
+
+    def load(self, repository, top, reset, page_size):
+        if reset:
+            # Another process may have archived a year since; attach it before counting
+            repository.partitions.refresh()
+            self.pager.reset(repository.connection, page_size)
+        return top, self.pager.total, self.pager.window(repository.connection, top, self.visible_rows)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.pager.total))
+        elif unit == "pages":
+            self.scroll_to(self.top + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.top + int(amount))
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.top - 1)
+        else:
+            self.scroll_to(self.top + 1)
+        return "break"
+
+    def selected_ids(self):
+        # Ids of the expenses whose text is selected in the list, even partly, for bulk edits
+        try:
+            before = self.textbox.get("1.0", "sel.first")
+            selected = self.textbox.get("sel.first", "sel.last")
+        except TclError:
+            return []
+        # A selection starting inside an expense's lines still includes that expense
+        start = before.rfind("ID: ")
+        if start != -1 and "\n\n" not in before[start:]:
+            selected = before[start:] + selected
+        return [int(expense_id) for expense_id in re.findall(r"ID: (\d+)", selected)]
+
+    def render(self, result):
+        top, total, rows = result
+        profiler = self.executor.profiler
+        with profiler.span("format.expense_list"):
+            text = "".join(format_expense(expense) for expense in rows) if rows else \
+                "No expenses found! Please try again..."
+        with profiler.span("widget.expense_list"):
+            self.textbox.delete(1.0, tk.END)
+            self.textbox.insert(tk.END, text)
+
+        if total:
+            self.scrollbar.set(top / total, min(1.0, (top + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
@@ -1,7 +1,26 @@
 import customtkinter as tk
 import sqlite3
+import time
 from datetime import datetime
-from PIL import Image, ImageTk
+from tkinter import filedialog, messagebox
+
+from autocomplete import AutocompleteComboBox
+from background import BackgroundImage
+from bulk_edit import BulkEditError, ExpenseFilter, parse_ids
+from db_executor import DatabaseExecutor, FrameStallMonitor
+from expense_list import DEFAULT_PAGE_SIZE, PAGE_SIZES, ExpenseListView, format_expense
+from importer import InvalidExpense, iter_expenses, parse_amount, parse_date
+from money import format_cents, format_percentage
+from profiling import Profiler
+from repository import DEFAULT_DB
+from schema import month_bounds
+
+
+def load_report_if_exists(repository, month, year):
+    # The cached report doubles as the existence check, so a repeat lookup costs no query at all
+    report = repository.monthly_report(month, year)
+    return report if report[0] is not None else None
+
 
 class ExpenseTrackerGUI:
     def __init__(self, master):
@@ -9,92 +28,162 @@ class ExpenseTrackerGUI:
         self.master.title("Ripple Expense Tracker")
         self.master.geometry("1600x800")
 
-        # Load the background image
-        bg_image = Image.open("bg2_image.jpg")
-        resized_image = bg_image.resize((1600, 800), Image.ADAPTIVE)
-
-        # Convert the resized image to a Tkinter PhotoImage
-        bg_photo = ImageTk.PhotoImage(resized_image)
+        # The background is decoded off the main thread and painted behind the widgets once ready
+        self.background = BackgroundImage(self.master, "bg2_image.jpg")
 
-        # Create a label with the background image
-        bg_label = tk.CTkLabel(self.master, image=bg_photo, text="")
-        bg_label.place(relwidth=1, relheight=1)
-
-        # Ensure the image is retained by tkinter
-        bg_label.image = bg_photo
-
-        self.connection = sqlite3.connect("expense_tracker.db")
-        self.curr = self.connection.cursor()
-        self.create_table()
+        # All database work runs on a worker thread so the main loop never blocks
+        self.profiler = Profiler()
+        self.db = DatabaseExecutor(self.master, DEFAULT_DB, profiler=self.profiler)
+        self.stall_monitor = FrameStallMonitor(self.master)
+        # The month whose report is on screen, re-run once after a bulk edit
+        self.report_month = None
+        self.suggestion_names = ([], [])
+        self.bulk_entries = None
 
         self.create_widgets()
+        self.refresh_suggestions()
+        self.background.load(1600, 800)
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
 
-    def create_table(self):
-        self.curr.execute("""
-            CREATE TABLE IF NOT EXISTS expenses(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            amount REAL,
-            category TEXT,
-            description TEXT,
-            date DATE,
-            expense_type TEXT
-            )
-        """)
-        self.connection.commit()
-
     def add_expense(self):
-        amount = float(self.amount_entry.get())
+        amount = parse_amount(self.amount_entry.get())
         category = self.category_entry.get()
         description = self.description_entry.get()
         expense_type = self.expense_type_entry.get()
 
         date = datetime.now().strftime('%Y-%m-%d')
-        self.curr.execute(
-            'INSERT INTO expenses (amount, category, description, date, expense_type) VALUES (?, ?, ?, ?, ?)',
-            (amount, category, description, date, expense_type))
-        self.connection.commit()
+        # The alerts are read in the same request as the write, before any other request can replace them
+        self.db.submit(lambda repository: (repository.add_expense(amount, category, description, expense_type, date),
+                                           repository.last_alerts),
+                       callback=self.on_expense_added)
+
+    def show_status(self, label, text, alerts, text_color, size=22):
+        # Budget and spike alerts from the write replace the plain success message
+        if alerts:
+            label.configure(text="\n".join(f"🚨 {alert} 🚨" for alert in alerts), text_color="#C1121F",
+                            font=("Helvetica", 16), wraplength=420)
+        else:
+            label.configure(text=text, text_color=text_color, font=("Helvetica", size))
 
+    def on_expense_added(self, result):
+        _, alerts = result
         # Update status label
-        self.status_label.configure(text="👽Expense has been added successfully👽", text_color="black", font=("Helvetica", 22))
+        self.show_status(self.status_label, "👽Expense has been added successfully👽", alerts, "black")
 
         # Clear input fields
         self.amount_entry.delete(0, tk.END)
-        self.category_entry.delete(0, tk.END)
+        self.category_entry.clear()
         self.description_entry.delete(0, tk.END)
-        self.expense_type_entry.delete(0, tk.END)
+        self.expense_type_entry.clear()
+        self.refresh_suggestions()
+
+    def refresh_suggestions(self):
+        # Category and type names for the autocomplete drop-downs, from the repository's interned dictionaries
+        self.db.submit(lambda repository: repository.dictionary_names(), key="suggestions",
+                       callback=self.show_suggestions)
+
+    def show_suggestions(self, names):
+        self.suggestion_names = names
+        categories, expense_types = names
+        category_entries = [self.category_entry, self.update_category_entry]
+        type_entries = [self.expense_type_entry, self.update_expense_type_entry]
+        if self.bulk_entries is not None:
+            category_entries += [self.bulk_entries["category"], self.bulk_entries["new_category"]]
+            type_entries += [self.bulk_entries["expense_type"], self.bulk_entries["new_expense_type"]]
+        for entry in category_entries:
+            entry.set_names(categories)
+        for entry in type_entries:
+            entry.set_names(expense_types)
+
+    def add_expenses_bulk(self, expenses, callback=None):
+        return self.db.submit(lambda repository: repository.add_expenses(expenses), callback=callback)
+
+    def import_expenses(self):
+        path = filedialog.askopenfilename(title="Import expenses",
+                                          filetypes=[("Bank statements", "*.csv *.ofx *.qfx"), ("All files", "*.*")])
+        if not path:
+            return
+        # OFX says which transactions are debits; a CSV needs to be told how its amounts are signed
+        debits_negative = False
+        if not path.lower().endswith((".ofx", ".qfx")):
+            debits_negative = messagebox.askyesnocancel(
+                "Import expenses", "Does this statement write money spent as negative amounts?\n\n"
+                                   "Yes: positive amounts are credits and are skipped.\n"
+                                   "No: negative amounts are refunds and are skipped.")
+            if debits_negative is None:
+                return
+
+        def run_import(repository):
+            errors, skipped = [], []
+            start = time.perf_counter()
+            expenses = iter_expenses(path, errors, skipped, debits_negative, repository.first_open_date())
+            inserted = repository.add_expenses(expenses)
+            return inserted, errors, skipped, time.perf_counter() - start
+
+        self.status_label.configure(text="📥 Importing... 📥", text_color="black", font=("Helvetica", 16))
+        self.db.submit(run_import, callback=self.on_expenses_imported, error_callback=self.on_import_failed)
+
+    def on_expenses_imported(self, result):
+        inserted, errors, skipped, elapsed = result
+        rate = inserted / elapsed if elapsed > 0 else 0
 
-    def view_expenses(self):
-        self.curr.execute("SELECT * FROM expenses ORDER BY date")
-        expenses = self.curr.fetchall()
-
-        self.expenses_text.delete(1.0, tk.END)
-        if expenses:
-            for expense in expenses:
-                expense_info = (f"👾 ID: {expense[0]}\n🤠 Amount: ${expense[1]}\n"
-                                f"🤖 Category: {expense[2]}\n🧐 Description: {expense[3]}\n"
-                                f"👻 Date: {expense[4]}\n"
-                                f"🥷 Expense Type: {expense[5]}\n\n")
-                self.expenses_text.insert(tk.END, expense_info)
-        else:
-            self.expenses_text.insert(tk.END, "No expenses found! Please try again...")
-
-    def get_monthly_expenses(self, month, year):
-        start_date = datetime(year, month, 1).strftime('%Y-%m-%d')
-        end_date = datetime(year, month + 1, 1).strftime('%Y-%m-%d')
+        # Update status label
+        self.status_label.configure(text=f"📥 Imported {inserted} expenses ({rate:,.0f} rows/s), "
+                                         f"{len(skipped)} credits skipped, {len(errors)} rejected 📥",
+                                    text_color="black", font=("Helvetica", 16))
+        self.refresh_suggestions()
 
-        self.curr.execute("SELECT SUM(amount) FROM expenses WHERE date >= ? AND date < ?", (start_date, end_date))
-        total_monthly_expense = self.curr.fetchone()[0]
+    def on_import_failed(self, error):
+        if not isinstance(error, (OSError, InvalidExpense)):
+            raise error
+        self.status_label.configure(text=f"💀 Import failed: {error} 💀", text_color="black", font=("Helvetica", 16))
 
-        self.curr.execute("SELECT category, SUM(amount) FROM expenses WHERE date >= ? AND date < ? GROUP BY category",
-                          (start_date, end_date))
-        monthly_expenses_by_category = self.curr.fetchall()
+    def view_expenses(self):
+        self.expenses_list.refresh(int(self.page_size_menu.get()))
+
+    def search_expenses(self):
+        query = self.search_entry.get()
+        if not query.strip():
+            return
+        self.db.submit(lambda repository: repository.search_expenses(query), key="search",
+                       callback=lambda expenses: self.show_search_results(query, expenses))
+
+    def show_search_results(self, query, expenses):
+        results_window = tk.CTkToplevel(self.master)
+        results_window.title(f"Search results for '{query}'")
+        results_window.geometry("450x400")
+
+        results_text = tk.CTkTextbox(results_window, height=380, width=430)
+        results_text.pack(padx=10, pady=10, fill="both", expand=True)
+        with self.profiler.span("format.search_results"):
+            text = "".join(format_expense(expense) for expense in expenses) if expenses else \
+                "No matching expenses found! Please try again..."
+        with self.profiler.span("widget.search_results"):
+            results_text.insert(tk.END, text)
 
+    def get_monthly_expenses(self, month, year):
+        self.db.submit(lambda repository: repository.monthly_report(month, year), key="report",
+                       callback=lambda result: self.show_monthly_expenses(month, year, *result))
+
+    def show_monthly_expenses(self, month, year, total_monthly_expense, monthly_expenses_by_category,
+                              average_expenses_by_category):
+        self.report_month = (month, year)
+        with self.profiler.span("format.monthly_report"):
+            report = self.format_monthly_report(month, year, total_monthly_expense, monthly_expenses_by_category,
+                                                average_expenses_by_category)
+        with self.profiler.span("widget.monthly_report"):
+            self.report_text.delete(1.0, tk.END)
+            self.report_text.insert(tk.END, report)
+
+    def format_monthly_report(self, month, year, total_monthly_expense, monthly_expenses_by_category,
+                              average_expenses_by_category):
         max_category_width = max(len(category) for category, _ in monthly_expenses_by_category) + 8
-        max_total_width = max(len(f"${total:.2f}") for _, total in monthly_expenses_by_category) + 8
+        max_total_width = max(len(f"${format_cents(total)}") for _, total in monthly_expenses_by_category) + 8
         max_percentage_width = max(
-            len(f"{(total / total_monthly_expense) * 100:.2f}%") for _, total in monthly_expenses_by_category) + 8
-        max_annual_avg_width = max(len(f"${total / 12:.2f}") for _, total in monthly_expenses_by_category) + 8
+            len(format_percentage(total, total_monthly_expense)) for _, total in monthly_expenses_by_category) + 8
+        max_annual_avg_width = max(len(f"${format_cents(average_expenses_by_category.get(category, 0))}")
+                                   for category, _ in monthly_expenses_by_category) + 8
 
         report = f"Monthly Expense Report for {datetime(year, month, 1).strftime('%B %Y')}:\n"
         report += "🏺 Category      |  🪤 Total Expense   |  💷 Percentage   | 💲 Annual Avg   |  ⚖️ Comparison\n"
@@ -102,15 +191,14 @@ class ExpenseTrackerGUI:
             " | ") * 8) + "\n"
 
         for category, total in monthly_expenses_by_category:
-            category_percentage = (total / total_monthly_expense) * 100
-            annual_avg = total / 12
+            category_percentage = format_percentage(total, total_monthly_expense)
+            annual_avg = average_expenses_by_category.get(category, 0)
             comparison = "Higher" if total > annual_avg else "Lower" if total < annual_avg else "Equal"
-            report += f"{category:<{max_category_width}} |   ${total:>{max_total_width - 1}.2f}   |   {category_percentage:>{max_percentage_width - 1}.2f}%  |   ${annual_avg:>{max_annual_avg_width - 1}.2f}  |   {comparison}\n"
+            report += f"{category:<{max_category_width}} |   ${format_cents(total):>{max_total_width - 1}}   |   {category_percentage:>{max_percentage_width}}  |   ${format_cents(annual_avg):>{max_annual_avg_width - 1}}  |   {comparison}\n"
 
         report += "-" * (
                     max_category_width + max_total_width + max_percentage_width + max_annual_avg_width + len(" | ") * 8)
-        self.report_text.delete(1.0, tk.END)
-        self.report_text.insert(tk.END, report)
+        return report
 
 
     def create_widgets(self):
@@ -134,7 +222,7 @@ class ExpenseTrackerGUI:
         self.amount_entry.grid(row=1, column=1, pady=5)
 
         tk.CTkLabel(add_expense_frame, text="Category:", font=h3_headers).grid(row=2, column=0, sticky=tk.W, padx=20)
-        self.category_entry = tk.CTkEntry(add_expense_frame, width=250)
+        self.category_entry = AutocompleteComboBox(add_expense_frame, width=250)
         self.category_entry.grid(row=2, column=1, pady=5)
 
         tk.CTkLabel(add_expense_frame, text="Description:", font=h3_headers).grid(row=3, column=0, sticky=tk.W, padx=20)
@@ -142,13 +230,17 @@ class ExpenseTrackerGUI:
         self.description_entry.grid(row=3, column=1, pady=5, padx=20)
 
         tk.CTkLabel(add_expense_frame, text="Expense Type:", font=h3_headers).grid(row=4, column=0, sticky=tk.W, padx=20)
-        self.expense_type_entry = tk.CTkEntry(add_expense_frame, width=250)
+        self.expense_type_entry = AutocompleteComboBox(add_expense_frame, width=250)
         self.expense_type_entry.grid(row=4, column=1, pady=5)
 
         add_button = tk.CTkButton(add_expense_frame, text="Add Expense",
                                   command=self.add_expense, fg_color="#E43F6F", hover_color="#EC0B43", font=button_font)
         add_button.grid(row=5, column=1, columnspan=2, pady=10, padx=20)
 
+        import_button = tk.CTkButton(add_expense_frame, text="Import CSV/OFX",
+                                     command=self.import_expenses, fg_color="#E43F6F", hover_color="#EC0B43", font=button_font)
+        import_button.grid(row=5, column=0, pady=10, padx=20)
+
         self.status_label = tk.CTkLabel(add_expense_frame, text="")
         self.status_label.grid(row=6, column=0, columnspan=2)
 
@@ -160,10 +252,23 @@ class ExpenseTrackerGUI:
 
         view_button = tk.CTkButton(view_expenses_frame, text="View Expenses", command=self.view_expenses, font=button_font, fg_color="#E43F6F",
                                    hover_color="#EC0B43")
-        view_button.grid(row=1, column=0, columnspan=2, pady=10, padx=20)
+        view_button.grid(row=1, column=0, pady=10, padx=20)
+
+        self.page_size_menu = tk.CTkOptionMenu(view_expenses_frame, values=PAGE_SIZES, width=90,
+                                               fg_color="#E43F6F", button_color="#E43F6F", button_hover_color="#EC0B43")
+        self.page_size_menu.set(str(DEFAULT_PAGE_SIZE))
+        self.page_size_menu.grid(row=1, column=1, pady=10, padx=20)
 
-        self.expenses_text = tk.CTkTextbox(view_expenses_frame, height=250, width=400)
-        self.expenses_text.grid(row=2, column=0, columnspan=2, padx=20, pady=20)
+        self.expenses_list = ExpenseListView(view_expenses_frame, self.db, fg_color="transparent")
+        self.expenses_list.grid(row=2, column=0, columnspan=2, padx=20, pady=20)
+
+        self.search_entry = tk.CTkEntry(view_expenses_frame, width=250, placeholder_text="Search descriptions...")
+        self.search_entry.grid(row=3, column=0, pady=(0, 20), padx=20)
+        self.search_entry.bind("<Return>", lambda _: self.search_expenses())
+
+        search_button = tk.CTkButton(view_expenses_frame, text="Search", command=self.search_expenses, width=90,
+                                     font=button_font, fg_color="#E43F6F", hover_color="#EC0B43")
+        search_button.grid(row=3, column=1, pady=(0, 20), padx=20)
 
         # Monthly expense report widgets
         monthly_report_frame = tk.CTkFrame(self.master, width=400, height=200, fg_color="#EAE151")
@@ -178,6 +283,10 @@ class ExpenseTrackerGUI:
         self.report_text = tk.CTkTextbox(monthly_report_frame, height=250, width=500)
         self.report_text.grid(row=2, column=0, columnspan=2, padx=20, pady=20)
 
+        diagnostics_button = tk.CTkButton(monthly_report_frame, text="Diagnostics", command=self.show_diagnostics,
+                                          font=button_font, fg_color="#E43F6F", hover_color="#EC0B43")
+        diagnostics_button.grid(row=3, column=0, columnspan=2, pady=(0, 10))
+
         # Update and delete expenses widgets
         update_delete_frame = tk.CTkFrame(self.master, width=400, height=400, fg_color="#EAE151")
         update_delete_frame.grid(row=0, column=2, rowspan=2, padx=10, pady=10, sticky=tk.N)
@@ -196,7 +305,7 @@ class ExpenseTrackerGUI:
         self.update_amount_entry.grid(row=3, column=1, pady=5)
 
         tk.CTkLabel(update_delete_frame, text="Category:", font=h3_headers).grid(row=4, column=0, sticky=tk.W, padx=20)
-        self.update_category_entry = tk.CTkEntry(update_delete_frame, width=250)
+        self.update_category_entry = AutocompleteComboBox(update_delete_frame, width=250)
         self.update_category_entry.grid(row=4, column=1, pady=5)
 
         tk.CTkLabel(update_delete_frame, text="Description:", font=h3_headers).grid(row=5, column=0, sticky=tk.W, padx=20)
@@ -204,7 +313,7 @@ class ExpenseTrackerGUI:
         self.update_description_entry.grid(row=5, column=1, pady=5, padx=20)
 
         tk.CTkLabel(update_delete_frame, text="Expense Type:", font=h3_headers).grid(row=6, column=0, sticky=tk.W, padx=20)
-        self.update_expense_type_entry = tk.CTkEntry(update_delete_frame, width=250)
+        self.update_expense_type_entry = AutocompleteComboBox(update_delete_frame, width=250)
         self.update_expense_type_entry.grid(row=6, column=1, pady=5)
 
         update_button = tk.CTkButton(update_delete_frame, text="Update Expense", command=self.update_expense, font=button_font, fg_color="#E43F6F",
@@ -228,6 +337,10 @@ class ExpenseTrackerGUI:
         self.delete_status_label = tk.CTkLabel(update_delete_frame, text="")
         self.delete_status_label.grid(row=12, column=0, columnspan=2)
 
+        bulk_button = tk.CTkButton(update_delete_frame, text="Bulk Edit", command=self.show_bulk_edit, font=button_font,
+                                   fg_color="#E43F6F", hover_color="#EC0B43")
+        bulk_button.grid(row=13, column=0, columnspan=2, pady=10)
+
     def show_monthly_report(self):
         text_font = tk.CTkFont(family="Lobster", size=18, weight="bold", slant="roman", underline=False,
                                overstrike=False)
@@ -255,70 +368,112 @@ class ExpenseTrackerGUI:
         generate_button.grid(row=2, columnspan=2, padx=10, pady=10)
 
     def generate_report(self, input_window, month, year):
+        try:
+            month, year = int(month), int(year)
+            month_bounds(year, month)
+        except ValueError:
+            self.show_report_not_found(input_window)
+            return
+
+        self.db.submit(load_report_if_exists, month, year, key="report",
+                       callback=lambda result: self.on_report_loaded(input_window, month, year, result))
+
+    def on_report_loaded(self, input_window, month, year, result):
+        if result is not None:
+            # Generate the report
+            self.show_monthly_expenses(month, year, *result)
+        else:
+            self.show_report_not_found(input_window)
+
+    def show_report_not_found(self, input_window):
         text_font = tk.CTkFont(family="Lobster", size=18, weight="bold", slant="roman", underline=False,
                                 overstrike=False)
         button_font = tk.CTkFont(family="Lobster", size=14, weight="bold", slant="roman", underline=False,
                                  overstrike=False)
 
-        # Check if records exist for the given month and year
-        self.curr.execute("SELECT COUNT(*) FROM expenses WHERE strftime('%m', date) = ? AND strftime('%Y', date) = ?",
-                          (month.zfill(2), year))
-        records_exist = self.curr.fetchone()[0] > 0
-
-        if records_exist:
-            # Generate the report
-            self.get_monthly_expenses(int(month), int(year))
-        else:
-            input_window.geometry("465x150")
-            # Display error message
-            error_message = "🥷 Such records weren't found. Please try again 🥷"
-
-            # Remove previous error message and entry fields
-            for widget in input_window.winfo_children():
-                widget.destroy()
-
-            # Display error message
-            tk.CTkLabel(input_window, text=error_message, font=text_font).grid(row=0, columnspan=2, padx=10, pady=5)
-
-            # Button to go back to the entry window
-            retry_button = tk.CTkButton(input_window, text="💀 Retry 💀", command=self.show_monthly_report, font=button_font, hover_color="#EC0B43", fg_color="#E43F6F")
-            retry_button.grid(row=1, columnspan=2, padx=10, pady=10)
+        input_window.geometry("465x150")
+        # Display error message
+        error_message = "🥷 Such records weren't found. Please try again 🥷"
+
+        # Remove previous error message and entry fields
+        for widget in input_window.winfo_children():
+            widget.destroy()
+
+        # Display error message
+        tk.CTkLabel(input_window, text=error_message, font=text_font).grid(row=0, columnspan=2, padx=10, pady=5)
+
+        # Button to go back to the entry window
+        retry_button = tk.CTkButton(input_window, text="💀 Retry 💀", command=self.show_monthly_report, font=button_font, hover_color="#EC0B43", fg_color="#E43F6F")
+        retry_button.grid(row=1, columnspan=2, padx=10, pady=10)
+
+    def show_diagnostics(self):
+        diagnostics_window = tk.CTkToplevel(self.master)
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("900x500")
+
+        diagnostics_text = tk.CTkTextbox(diagnostics_window, font=("Courier", 12), wrap="none")
+        diagnostics_text.pack(padx=10, pady=10, fill="both", expand=True)
+
+        def show(cache_summaries):
+            if not diagnostics_window.winfo_exists():
+                return
+            diagnostics_text.delete(1.0, tk.END)
+            diagnostics_text.insert(tk.END, "\n".join([self.profiler.report(), "", self.db.summary(),
+                                                       self.stall_monitor.summary(), *cache_summaries]))
+
+        def refresh():
+            # The report cache and the name caches belong to the worker's repository, so they are read there
+            self.db.submit(lambda repository: [repository.report_cache.summary(), repository.categories.summary(),
+                                               repository.expense_types.summary()], callback=show)
+
+        def export():
+            path = filedialog.asksaveasfilename(title="Export diagnostics", defaultextension=".json",
+                                                filetypes=[("JSON", "*.json")])
+            if path:
+                self.profiler.export(path)
+
+        buttons = tk.CTkFrame(diagnostics_window, fg_color="transparent")
+        buttons.pack(pady=(0, 10))
+        tk.CTkButton(buttons, text="Refresh", command=refresh, fg_color="#E43F6F",
+                     hover_color="#EC0B43").grid(row=0, column=0, padx=10)
+        tk.CTkButton(buttons, text="Export JSON", command=export, fg_color="#E43F6F",
+                     hover_color="#EC0B43").grid(row=0, column=1, padx=10)
+        refresh()
 
     def update_expense(self):
         # Retrieve data from entry fields
         expense_id = int(self.update_id_entry.get())
-        amount = float(self.update_amount_entry.get())
+        amount = parse_amount(self.update_amount_entry.get())
         category = self.update_category_entry.get()
         description = self.update_description_entry.get()
         expense_type = self.update_expense_type_entry.get()
 
         # Update the expense in the database
-        self.curr.execute("""
-            UPDATE expenses
-            SET amount=?, category=?, description=?, expense_type=?
-            WHERE id=?
-        """, (amount, category, description, expense_type, expense_id))
-        self.connection.commit()
+        self.db.submit(lambda repository: (repository.update_expense(expense_id, amount, category, description,
+                                                                     expense_type), repository.last_alerts),
+                       callback=self.on_expense_updated)
 
+    def on_expense_updated(self, result):
+        _, alerts = result
         # Update status label
-        self.update_status_label.configure(text="⚖️ Expense has been updated successfully ⚖️", text_color="#420039",
-                                           font=("Helvetica", 22))
+        self.show_status(self.update_status_label, "⚖️ Expense has been updated successfully ⚖️", alerts, "#420039")
 
         # Clear input fields
         self.update_id_entry.delete(0, tk.END)
         self.update_amount_entry.delete(0, tk.END)
-        self.update_category_entry.delete(0, tk.END)
+        self.update_category_entry.clear()
         self.update_description_entry.delete(0, tk.END)
-        self.update_expense_type_entry.delete(0, tk.END)
+        self.update_expense_type_entry.clear()
+        self.refresh_suggestions()
 
     def delete_expense(self):
         # Retrieve expense ID to delete
         expense_id = int(self.delete_id_entry.get())
 
         # Delete the expense from the database
-        self.curr.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
-        self.connection.commit()
+        self.db.submit(lambda repository: repository.delete_expense(expense_id), callback=self.on_expense_deleted)
 
+    def on_expense_deleted(self, _):
         # Update status label
         self.delete_status_label.configure(text="🥷 Expense has been deleted successfully 🥷", text_color="#420039",
                                            font=("Helvetica", 22))
@@ -326,6 +481,149 @@ class ExpenseTrackerGUI:
         # Clear input field
         self.delete_id_entry.delete(0, tk.END)
 
+    def show_bulk_edit(self):
+        # One filter (or a selection from the expense list), a preview of what it matches, then a set-based update
+        # or delete of all of it with undo
+        if self.bulk_entries is not None:
+            self.bulk_entries["window"].focus()
+            return
+        text_font = tk.CTkFont(family="Lobster", size=16, weight="bold", slant="roman", underline=False,
+                               overstrike=False)
+        bulk_window = tk.CTkToplevel(self.master)
+        bulk_window.title("Bulk Edit Expenses")
+        bulk_window.geometry("520x620")
+        entries = {"window": bulk_window}
+
+        fields = [("From (YYYY-MM-DD):", "start", tk.CTkEntry), ("To (YYYY-MM-DD):", "end", tk.CTkEntry),
+                  ("Category:", "category", AutocompleteComboBox), ("Expense Type:", "expense_type", AutocompleteComboBox),
+                  ("Text:", "text", tk.CTkEntry), ("Expense IDs:", "ids", tk.CTkEntry),
+                  ("New Category:", "new_category", AutocompleteComboBox),
+                  ("New Expense Type:", "new_expense_type", AutocompleteComboBox),
+                  ("New Description:", "new_description", tk.CTkEntry)]
+        for row, (label, name, widget) in enumerate(fields):
+            tk.CTkLabel(bulk_window, text=label, font=text_font).grid(row=row, column=0, sticky=tk.W, padx=20, pady=5)
+            entries[name] = widget(bulk_window, width=250)
+            entries[name].grid(row=row, column=1, pady=5)
+
+        buttons = tk.CTkFrame(bulk_window, fg_color="transparent")
+        buttons.grid(row=len(fields), column=0, columnspan=2, pady=10)
+        for column, (text, command) in enumerate([("Use List Selection", self.use_list_selection),
+                                                  ("Preview", self.preview_bulk_edit),
+                                                  ("Update All", self.bulk_update),
+                                                  ("Delete All", self.bulk_delete),
+                                                  ("Undo Last", self.undo_bulk_edit)]):
+            tk.CTkButton(buttons, text=text, command=command, width=90, fg_color="#E43F6F",
+                         hover_color="#EC0B43").grid(row=column // 3, column=column % 3, padx=5, pady=5)
+
+        entries["status"] = tk.CTkLabel(bulk_window, text="", wraplength=480)
+        entries["status"].grid(row=len(fields) + 1, column=0, columnspan=2, pady=10)
+        self.bulk_entries = entries
+        self.show_suggestions(self.suggestion_names)
+
+        def close():
+            self.bulk_entries = None
+            bulk_window.destroy()
+
+        bulk_window.protocol("WM_DELETE_WINDOW", close)
+
+    def show_bulk_status(self, text):
+        if self.bulk_entries is not None:
+            self.bulk_entries["status"].configure(text=text, text_color="#420039", font=("Helvetica", 16))
+
+    def on_bulk_edit_failed(self, error):
+        if not isinstance(error, (BulkEditError, InvalidExpense, sqlite3.Error)):
+            raise error
+        self.show_bulk_status(f"💀 {error} 💀")
+
+    def use_list_selection(self):
+        ids = self.expenses_list.selected_ids()
+        self.bulk_entries["ids"].delete(0, tk.END)
+        self.bulk_entries["ids"].insert(0, ", ".join(str(expense_id) for expense_id in ids))
+        self.show_bulk_status(f"{len(ids)} expenses selected in the list" if ids else
+                              "Select expenses in the View Expenses list first")
+
+    def bulk_filter(self):
+        entries = self.bulk_entries
+        start, end = entries["start"].get().strip(), entries["end"].get().strip()
+        ids = entries["ids"].get().strip()
+        return ExpenseFilter(parse_date(start) if start else None, parse_date(end) if end else None,
+                             entries["category"].get().strip() or None, entries["expense_type"].get().strip() or None,
+                             entries["text"].get().strip() or None, parse_ids(ids) if ids else None)
+
+    def preview_bulk_edit(self):
+        try:
+            expense_filter = self.bulk_filter()
+        except (BulkEditError, InvalidExpense) as error:
+            self.show_bulk_status(f"💀 {error} 💀")
+            return
+        self.db.submit(lambda repository: repository.preview_bulk_edit(expense_filter), key="bulk-preview",
+                       callback=lambda result: self.show_bulk_preview(expense_filter, *result),
+                       error_callback=self.on_bulk_edit_failed)
+
+    def show_bulk_preview(self, expense_filter, count, total, first_date, last_date):
+        if not count:
+            self.show_bulk_status(f"No expenses match {expense_filter}")
+        else:
+            self.show_bulk_status(f"🔍 {count} expenses match {expense_filter}: ${format_cents(total)} "
+                                  f"from {first_date} to {last_date} 🔍")
+
+    def bulk_update(self):
+        entries = self.bulk_entries
+        category = entries["new_category"].get().strip() or None
+        expense_type = entries["new_expense_type"].get().strip() or None
+        description = entries["new_description"].get().strip() or None
+        if category is None and expense_type is None and description is None:
+            self.show_bulk_status("💀 Enter a new category, expense type or description 💀")
+            return
+        self.run_bulk_edit("updated", lambda repository, expense_filter: repository.bulk_update(
+            expense_filter, category=category, description=description, expense_type=expense_type))
+
+    def bulk_delete(self):
+        self.run_bulk_edit("deleted", lambda repository, expense_filter: repository.bulk_delete(expense_filter))
+
+    def run_bulk_edit(self, verb, edit):
+        # Nothing changes until the matching expenses have been counted and the edit confirmed, like --dry-run
+        try:
+            expense_filter = self.bulk_filter()
+        except (BulkEditError, InvalidExpense) as error:
+            self.show_bulk_status(f"💀 {error} 💀")
+            return
+        self.db.submit(lambda repository: repository.preview_bulk_edit(expense_filter), key="bulk-preview",
+                       callback=lambda result: self.confirm_bulk_edit(verb, edit, expense_filter, *result),
+                       error_callback=self.on_bulk_edit_failed)
+
+    def confirm_bulk_edit(self, verb, edit, expense_filter, count, total, first_date, last_date):
+        self.show_bulk_preview(expense_filter, count, total, first_date, last_date)
+        # The Bulk Edit window may have been closed while counting
+        if not count or self.bulk_entries is None:
+            return
+        action = "Delete" if verb == "deleted" else "Update"
+        if not messagebox.askyesno(f"{action} expenses",
+                                   f"{action} {count} expenses matching {expense_filter} (${format_cents(total)} "
+                                   f"from {first_date} to {last_date})?\n\nUndo Last can restore them.",
+                                   parent=self.bulk_entries["status"].winfo_toplevel()):
+            return
+        self.show_bulk_status("⏳ Working... ⏳")
+        self.db.submit(lambda repository: edit(repository, expense_filter),
+                       callback=lambda result: self.on_bulk_edit_done(verb, *result),
+                       error_callback=self.on_bulk_edit_failed)
+
+    def undo_bulk_edit(self):
+        self.db.submit(lambda repository: repository.undo_bulk_edit(),
+                       callback=lambda result: self.on_bulk_edit_done("restored", *result),
+                       error_callback=self.on_bulk_edit_failed)
+
+    def on_bulk_edit_done(self, verb, edit_id, count):
+        if edit_id is None:
+            self.show_bulk_status("No expenses matched, nothing was changed")
+            return
+        self.show_bulk_status(f"⚖️ {count} expenses {verb} (bulk edit {edit_id}) ⚖️")
+        # However many rows changed, the list, the report on screen and the suggestions refresh once
+        self.expenses_list.refresh(int(self.page_size_menu.get()))
+        if self.report_month is not None:
+            self.get_monthly_expenses(*self.report_month)
+        self.refresh_suggestions()
+
     def create_update_delete_widgets(self):
         # Update expense widgets
         update_label = tk.CTkLabel(self.master, text="Update Expense")
@@ -340,7 +638,7 @@ class ExpenseTrackerGUI:
         self.update_amount_entry.grid(row=12, column=1, pady=5)
 
         tk.CTkLabel(self.master, text="Category:").grid(row=13, column=0, sticky=tk.W)
-        self.update_category_entry = tk.CTkEntry(self.master)
+        self.update_category_entry = AutocompleteComboBox(self.master)
         self.update_category_entry.grid(row=13, column=1, pady=5)
 
         tk.CTkLabel(self.master, text="Description:").grid(row=14, column=0, sticky=tk.W)
@@ -348,7 +646,7 @@ class ExpenseTrackerGUI:
         self.update_description_entry.grid(row=14, column=1, pady=5)
 
         tk.CTkLabel(self.master, text="Expense Type:").grid(row=15, column=0, sticky=tk.W)
-        self.update_expense_type_entry = tk.CTkEntry(self.master)
+        self.update_expense_type_entry = AutocompleteComboBox(self.master)
         self.update_expense_type_entry.grid(row=15, column=1, pady=5)
 
         update_button = tk.CTkButton(self.master, text="Update Expense", command=self.update_expense)
@@ -371,8 +669,11 @@ class ExpenseTrackerGUI:
         self.delete_status_label = tk.CTkLabel(self.master, text="")
         self.delete_status_label.grid(row=21, column=0, columnspan=2)
 
-    def __del__(self):
-        self.connection.close()
+    def on_close(self):
+        self.stall_monitor.stop()
+        self.db.close()
+        self.background.close()
+        self.master.destroy()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+import csv
+import os
+from datetime import datetime
+from itertools import islice
+
+from money import to_cents
+
+INSERT_EXPENSE_SQL = ('INSERT INTO expenses (amount, category_id, description, date, expense_type_id) '
+                      'VALUES (?, ?, ?, ?, ?)')
+
+DEFAULT_BATCH_SIZE = 5000
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d.%m.%Y', '%m/%d/%Y', '%Y%m%d')
+
+# Header aliases used by common bank statement exports
+CSV_COLUMNS = {
+    "amount": ("amount", "debit", "value"),
+    # Statements with separate debit and credit columns leave the debit empty on a credit
+    "credit": ("credit", "credit amount"),
+    "category": ("category",),
+    "description": ("description", "memo", "details", "payee", "name"),
+    "date": ("date", "transaction date", "posted date", "posting date"),
+    "expense_type": ("expense_type", "expense type", "type", "transaction type"),
+}
+
+
+class InvalidExpense(ValueError):
+    pass
+
+
+def parse_amount(value):
+    # Returns integer cents, parsed as a decimal so "0.29" never passes through a float
+    if isinstance(value, str):
+        value = value.strip().replace("$", "").replace(",", "")
+    try:
+        amount = to_cents(value)
+    except (TypeError, ValueError):
+        raise InvalidExpense(f"Invalid amount: {value!r}")
+    if amount == 0:
+        raise InvalidExpense(f"Invalid amount: {value!r}")
+    # Bank statements record money spent as negative debits; the importers skip credits before getting here
+    return abs(amount)
+
+
+def parse_date(value):
+    value = (value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise InvalidExpense(f"Invalid date: {value!r}")
+
+
+def validate_expense(amount, category, description, date, expense_type, open_from=None):
+    # open_from: the first date still open for writes (ExpenseRepository.first_open_date); archived years are not
+    date = parse_date(date)
+    if open_from is not None and date < open_from:
+        raise InvalidExpense(f"Invalid date: {date} falls in an archived year")
+    return (parse_amount(amount), (category or "").strip() or "Uncategorized", (description or "").strip(),
+            date, (expense_type or "").strip())
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_expenses(connection, expenses, batch_size=DEFAULT_BATCH_SIZE, transaction=None):
+    # One transaction and one executemany per batch instead of a commit per row. Rows are
+    # (amount, category_id, description, date, expense_type_id); ExpenseRepository interns the names.
+    # transaction() can supply a different wrapper, e.g. a savepoint inside a caller's larger transaction.
+    inserted = 0
+    for batch in batched(expenses, batch_size):
+        with transaction() if transaction is not None else connection:
+            connection.executemany(INSERT_EXPENSE_SQL, batch)
+        inserted += len(batch)
+    return inserted
+
+
+def _match_columns(fieldnames):
+    normalized = {name.strip().lower(): name for name in fieldnames or []}
+    columns = {}
+    for column, aliases in CSV_COLUMNS.items():
+        columns[column] = next((normalized[alias] for alias in aliases if alias in normalized), None)
+    if columns["amount"] is None or columns["date"] is None:
+        raise InvalidExpense("CSV file needs at least an amount and a date column")
+    return columns
+
+
+def _is_negative(value):
+    # As written in the statement, e.g. "-$12.50" or "$-12.50"
+    return (value or "").strip().lstrip("$").strip().startswith("-")
+
+
+def iter_csv_expenses(path, errors=None, skipped=None, debits_negative=False, open_from=None):
+    # Like OFX, only debits are expenses; the line numbers of credits (salary, refunds) go to skipped. A statement
+    # with debit and credit columns says which rows are credits. Otherwise the caller says how amounts are signed:
+    # by default money spent is positive and a negative amount is a refund; with debits_negative, as in most bank
+    # exports, money spent is negative and every other amount is a credit.
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        reader = csv.DictReader(csv_file)
+        columns = _match_columns(reader.fieldnames)
+        for line_number, row in enumerate(reader, start=2):
+            values = [row.get(columns[column]) if columns[column] else None for column in
+                      ("amount", "category", "description", "date", "expense_type")]
+            if columns["credit"] is not None and not (values[0] or "").strip():
+                if (row.get(columns["credit"]) or "").strip():
+                    if skipped is not None:
+                        skipped.append(line_number)
+                    continue
+            try:
+                expense = validate_expense(*values, open_from)
+            except InvalidExpense as error:
+                if errors is None:
+                    raise
+                errors.append((line_number, str(error)))
+                continue
+            if columns["credit"] is None and _is_negative(values[0]) != debits_negative:
+                if skipped is not None:
+                    skipped.append(line_number)
+                continue
+            yield expense
+
+
+def _iter_ofx_tags(ofx_file, chunk_size=65536):
+    # OFX 1.x is SGML, leaf elements are not closed, so scan "<TAG>value" pairs
+    buffer = ""
+    while True:
+        chunk = ofx_file.read(chunk_size)
+        buffer += chunk
+        parts = buffer.split("<")
+        buffer = parts.pop() if chunk else ""
+        for part in parts:
+            tag, _, value = part.partition(">")
+            if tag:
+                yield tag.strip().upper(), value.strip()
+        if not chunk:
+            if buffer:
+                tag, _, value = buffer.partition(">")
+                yield tag.strip().upper(), value.strip()
+            return
+
+
+def iter_ofx_expenses(path, errors=None, skipped=None, open_from=None):
+    with open(path, encoding="utf-8", errors="replace") as ofx_file:
+        transaction = None
+        number = 0
+        for tag, value in _iter_ofx_tags(ofx_file):
+            if tag == "STMTTRN":
+                transaction = {}
+            elif tag == "/STMTTRN" and transaction is not None:
+                number += 1
+                amount = transaction.get("TRNAMT", "")
+                transaction, current = None, transaction
+                # OFX amounts are always signed: only debits are expenses, credits are skipped
+                if not amount.strip().startswith("-"):
+                    if skipped is not None:
+                        skipped.append(number)
+                else:
+                    description = " ".join(filter(None, (current.get("NAME"), current.get("MEMO"))))
+                    try:
+                        yield validate_expense(amount, "Uncategorized", description,
+                                               current.get("DTPOSTED", "")[:8], current.get("TRNTYPE", ""), open_from)
+                    except InvalidExpense as error:
+                        if errors is None:
+                            raise
+                        errors.append((number, str(error)))
+            elif transaction is not None and not tag.startswith("/"):
+                transaction[tag] = value
+
+
+def iter_expenses(path, errors=None, skipped=None, debits_negative=False, open_from=None):
+    # debits_negative only applies to CSV files; OFX says which transactions are debits
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".ofx", ".qfx"):
+        return iter_ofx_expenses(path, errors, skipped, open_from)
+    return iter_csv_expenses(path, errors, skipped, debits_negative, open_from)
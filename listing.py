@@ -0,0 +1,68 @@
+import csv
+import json
+
+from schema import LIST_COLUMN_WIDTHS_SQL, LIST_EXPENSES_SQL
+
+LIST_COLUMNS = ["ID", "Amount", "Category", "Description", "Expense Type", "Date"]
+JSON_KEYS = ["id", "amount", "category", "description", "expense_type", "date"]
+OUTPUT_FORMATS = ["table", "csv", "jsonl"]
+
+FETCH_SIZE = 2000
+
+
+def iter_batches(cursor, size=FETCH_SIZE):
+    while True:
+        batch = cursor.fetchmany(size)
+        if not batch:
+            return
+        yield batch
+
+
+# The writers take batches of (id, amount text, category, description, expense type, date) rows, so a listing reads
+# the same whether it streams from SQLite or from a columnar snapshot (snapshot.py)
+def write_table(batches, data_widths, output):
+    # Column widths come from an aggregate pass so rows never have to be held in memory
+    if data_widths[0] is None:
+        return 0
+    widths = [max(len(column), width or 0) + 3 for column, width in zip(LIST_COLUMNS, data_widths)]
+
+    output.write(" | ".join(f"{column:<{widths[i]}}" for i, column in enumerate(LIST_COLUMNS)) + "\n")
+    output.write("-" * sum(widths) + "\n")
+
+    count = 0
+    for batch in batches:
+        output.write("".join(" | ".join(f"{str(value):<{widths[i]}}" for i, value in enumerate(expense)) + "\n"
+                             for expense in batch))
+        count += len(batch)
+    return count
+
+
+def write_csv(batches, output):
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(JSON_KEYS)
+    count = 0
+    for batch in batches:
+        writer.writerows(batch)
+        count += len(batch)
+    return count
+
+
+def write_jsonl(batches, output):
+    count = 0
+    for batch in batches:
+        output.write("".join(json.dumps(dict(zip(JSON_KEYS, expense))) + "\n" for expense in batch))
+        count += len(batch)
+    return count
+
+
+def write_rows(batches, data_widths, output, output_format="table"):
+    # data_widths is only needed (and only computed by callers) for the table format
+    if output_format == "table":
+        return write_table(batches, data_widths(), output)
+    writers = {"csv": write_csv, "jsonl": write_jsonl}
+    return writers[output_format](batches, output)
+
+
+def write_expenses(connection, output, output_format="table"):
+    return write_rows(iter_batches(connection.execute(LIST_EXPENSES_SQL)),
+                      lambda: connection.execute(LIST_COLUMN_WIDTHS_SQL).fetchone(), output, output_format)
@@ -0,0 +1,67 @@
+from decimal import ROUND_HALF_UP, Decimal, DecimalException
+
+# Amounts are stored and summed as integer minor units (cents); only parsing and display know about decimals
+CENTS = 100
+# Cents are stored in SQLite INTEGER columns, which hold signed 64-bit values
+MAX_CENTS = 2 ** 63 - 1
+
+
+def to_cents(amount):
+    # Exact decimal rounding, half up: "12.345" -> 1235. Floats go through their shortest repr, so 0.1 -> 10.
+    # Anything that is not a finite amount SQLite can store raises ValueError.
+    try:
+        value = Decimal(str(amount).strip())
+        if not value.is_finite():
+            raise ValueError(f"Invalid amount: {amount!r}")
+        cents = int(value.scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except DecimalException:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount out of range: {amount!r}")
+    return cents
+
+
+def format_cents(cents):
+    major, minor = divmod(abs(cents), CENTS)
+    return f"{'-' if cents < 0 else ''}{major}.{minor:02d}"
+
+
+def format_percentage(part, whole):
+    # part / whole as a percentage with two decimals, rounded half up in integer arithmetic
+    if not whole:
+        return "0.00%"
+    hundredths = (part * 20000 + whole) // (2 * whole)
+    return f"{format_cents(hundredths)}%"
+
+
+def divide_cents(cents, count):
+    # Integer average rounded half up, e.g. a trailing monthly average
+    return (cents * 2 + count) // (2 * count) if count else 0
+
+
+class Expense:
+    # One expense row held in memory (pager windows, search results, API pages); amount is in cents
+    __slots__ = ("id", "amount", "category", "description", "date", "expense_type")
+
+    def __init__(self, id, amount, category, description, date, expense_type):
+        self.id = id
+        self.amount = amount
+        self.category = category
+        self.description = description
+        self.date = date
+        self.expense_type = expense_type
+
+    def as_tuple(self):
+        return self.id, self.amount, self.category, self.description, self.date, self.expense_type
+
+    def __eq__(self, other):
+        return isinstance(other, Expense) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return (f"Expense(id={self.id!r}, amount={format_cents(self.amount)}, category={self.category!r}, "
+                f"date={self.date!r})")
+
+
+def expense_rows(rows):
+    # Rows selected with schema.EXPENSE_COLUMNS into Expense records
+    return [Expense(*row) for row in rows]
@@ -0,0 +1,288 @@
+import os
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from schema import EXPENSE_INDEXES, ROLLUP_TABLE_SQL, year_bounds
+
+ARCHIVE_BATCH_SIZE = 20000
+MAX_WORKERS = 4
+
+# An archive file holds exactly one closed year: the rows with their original ids, the same indexes and rollup as
+# the main database, and a contentless full-text index (the names it indexes live in the main database)
+ARCHIVE_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS expenses(
+        id INTEGER PRIMARY KEY,
+        amount INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        date DATE,
+        expense_type_id INTEGER NOT NULL
+        )
+    """,
+    *EXPENSE_INDEXES,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(description, category, expense_type, content='')",
+]
+
+ARCHIVE_BATCH_SQL = ("SELECT id, amount, category_id, description, date, expense_type_id FROM expenses "
+                     "WHERE date >= ? AND date < ? ORDER BY date, id LIMIT ?")
+# REPLACE, so a batch copied by a run that stopped before deleting it from the main database is copied again as-is
+ARCHIVE_INSERT_SQL = "INSERT OR REPLACE INTO expenses VALUES (?, ?, ?, ?, ?, ?)"
+ARCHIVED_DELETE_SQL = "DELETE FROM expenses WHERE id = ?"
+ARCHIVE_ROLLUP_SQL = ("INSERT INTO monthly_category_totals (month, category_id, total, expense_count) "
+                      "SELECT substr(date, 1, 7), category_id, SUM(amount), COUNT(*) FROM expenses GROUP BY 1, 2")
+ARCHIVE_FTS_SQL = "SELECT id, description, category_id, expense_type_id FROM expenses"
+ARCHIVE_FTS_INSERT_SQL = "INSERT INTO expenses_fts (rowid, description, category, expense_type) VALUES (?, ?, ?, ?)"
+ARCHIVE_TOTALS_SQL = "SELECT COUNT(*), IFNULL(SUM(amount), 0) FROM expenses"
+
+PARTITIONS_SQL = "SELECT year, path, expense_count, total, archived_at FROM partitions ORDER BY year"
+REGISTER_PARTITION_SQL = "INSERT INTO partitions (year, path, expense_count, total, archived_at) VALUES (?, ?, ?, ?, ?)"
+OLDEST_YEAR_SQL = "SELECT CAST(substr(MIN(date), 1, 4) AS INTEGER) FROM expenses"
+YEAR_EXISTS_SQL = "SELECT EXISTS(SELECT 1 FROM expenses WHERE date >= ? AND date < ?)"
+
+# The same three views over every partition, recreated whenever an archive is attached; TEMP, so they live only in
+# the connection that attached the archives
+LEDGER_EXPENSES_ARM = "SELECT id, amount, category_id, description, date, expense_type_id FROM {schema}.expenses"
+LEDGER_DETAILS_ARM = ("SELECT e.id, e.amount, c.name AS category, e.description, e.date, t.name AS expense_type "
+                      "FROM {schema}.expenses AS e JOIN main.categories AS c ON c.id = e.category_id "
+                      "JOIN main.expense_types AS t ON t.id = e.expense_type_id")
+LEDGER_TOTALS_ARM = "SELECT month, category_id, total, expense_count FROM {schema}.monthly_category_totals"
+LEDGER_VIEWS = {"ledger_expenses": LEDGER_EXPENSES_ARM, "ledger_details": LEDGER_DETAILS_ARM,
+                "ledger_totals": LEDGER_TOTALS_ARM}
+
+# Per-partition partial sums of a cross-year report, one covering-index range scan each
+YEARLY_TOTALS_SQL = ("SELECT CAST(substr(date, 1, 4) AS INTEGER), category_id, SUM(amount), COUNT(*) FROM expenses "
+                     "WHERE date >= ? AND date < ? GROUP BY 1, 2")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_path(db_name, year):
+    # expense_tracker.db -> expense_tracker.2021.db, next to the main database
+    root, extension = os.path.splitext(db_name)
+    return f"{root}.{year}{extension or '.db'}"
+
+
+def read_only_uri(path):
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+
+def list_partitions(connection):
+    return connection.execute(PARTITIONS_SQL).fetchall()
+
+
+def _move_year(connection, archive, year, batch_size):
+    # Each batch is written to the archive and committed there before it is deleted from the main database, both
+    # under the main database's write lock, so a crash can leave a row in both files but never in neither
+    start, end = year_bounds(year)
+    moved = 0
+    while True:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(ARCHIVE_BATCH_SQL, (start, end, batch_size)).fetchall()
+            if rows:
+                with archive:
+                    archive.executemany(ARCHIVE_INSERT_SQL, rows)
+                connection.executemany(ARCHIVED_DELETE_SQL, ((row[0],) for row in rows))
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+        if not rows:
+            return moved
+        moved += len(rows)
+
+
+def _finish_archive(connection, archive):
+    # Rollup and full-text index are built once over the finished year, then the file is compacted
+    categories = dict(connection.execute("SELECT id, name FROM categories"))
+    expense_types = dict(connection.execute("SELECT id, name FROM expense_types"))
+    archive.execute("BEGIN")
+    try:
+        archive.execute("DROP TABLE IF EXISTS monthly_category_totals")
+        archive.execute(ROLLUP_TABLE_SQL)
+        archive.execute(ARCHIVE_ROLLUP_SQL)
+        archive.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('delete-all')")
+        rows = archive.execute(ARCHIVE_FTS_SQL).fetchall()
+        archive.executemany(ARCHIVE_FTS_INSERT_SQL, ((expense_id, description, categories[category_id],
+                                                       expense_types[type_id])
+                                                      for expense_id, description, category_id, type_id in rows))
+        archive.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('optimize')")
+    except BaseException:
+        archive.rollback()
+        raise
+    archive.commit()
+    archive.execute("ANALYZE")
+    archive.execute("VACUUM")
+    return archive.execute(ARCHIVE_TOTALS_SQL).fetchone()
+
+
+def archive_year(connection, db_name, year, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves one closed year out of the main database into its own archive file and registers it. Rows may still be
+    # added to the year while it is being moved, so it is only registered once the main database has none left.
+    if batch_size < 1:
+        raise ArchiveError(f"batch_size must be at least 1, not {batch_size}")
+    start, end = year_bounds(year)
+    path = archive_path(db_name, year)
+    archive = sqlite3.connect(path)
+    try:
+        archive.execute("PRAGMA journal_mode = DELETE")
+        for statement in ARCHIVE_SCHEMA:
+            archive.execute(statement)
+        archive.commit()
+        moved = 0
+        while True:
+            moved += _move_year(connection, archive, year, batch_size)
+            count, total = _finish_archive(connection, archive)
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if connection.execute(YEAR_EXISTS_SQL, (start, end)).fetchone()[0]:
+                    connection.rollback()
+                    continue
+                # From here the triggers of migration 8 refuse any write dated in this year or before
+                connection.execute(REGISTER_PARTITION_SQL, (year, os.path.basename(path), count, total,
+                                                            datetime.now().isoformat(timespec="seconds")))
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+            return moved, count, total
+    finally:
+        archive.close()
+
+
+def max_archives(connection):
+    # Every archive stays attached to every connection, and the tracker attaches nothing else, so there can be as
+    # many archives as SQLite lets one connection attach: SQLITE_MAX_ATTACHED, 10 in a default build (at most 125)
+    return connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+
+def archive_years(connection, db_name, before, batch_size=ARCHIVE_BATCH_SIZE, vacuum=False):
+    # Archives every year older than `before`, oldest first, so archived years always precede the main database.
+    # Yields (year, moved, expense_count, total) as each year is registered.
+    if db_name == ":memory:":
+        raise ArchiveError("An in-memory database cannot be partitioned")
+    if before > datetime.now().year:
+        raise ArchiveError(f"{before - 1} is not closed yet")
+    archived = len(list_partitions(connection))
+    oldest = connection.execute(OLDEST_YEAR_SQL).fetchone()[0]
+    if oldest is None or oldest >= before:
+        return
+    limit = max_archives(connection)
+    if archived + before - oldest > limit:
+        raise ArchiveError(f"Archiving {oldest}-{before - 1} would make {archived + before - oldest} archive files, "
+                           f"but SQLite attaches at most {limit} databases to a connection (SQLITE_MAX_ATTACHED); "
+                           f"archive fewer years")
+    for year in range(oldest, before):
+        moved, count, total = archive_year(connection, db_name, year, batch_size)
+        yield year, moved, count, total
+    if vacuum:
+        connection.execute("VACUUM")
+
+
+def partition_totals(uri, start, end):
+    # Runs in a worker process: one partition's (year, category id, cents, count) partial sums for [start, end)
+    connection = sqlite3.connect(uri, uri=True)
+    try:
+        return connection.execute(YEARLY_TOTALS_SQL, (start, end)).fetchall()
+    finally:
+        connection.close()
+
+
+class PartitionRouter:
+    # Keeps every registered archive attached read-only to one connection and routes date ranges to the partitions
+    # they cover. Archived years are all older than any row left in the main database.
+    def __init__(self, connection, db_name):
+        self.connection = connection
+        self.db_name = db_name
+        self.directory = os.path.dirname(os.path.abspath(db_name))
+        self.archives = {}
+        self.paths = {"main": os.path.abspath(db_name)}
+        self.data_version = None
+        self.pool = None
+        self._create_views()
+        self.refresh()
+
+    def refresh(self, force=False):
+        # Another connection may have archived a year since; ATTACH is not allowed inside a transaction, so a
+        # transaction in progress keeps the partitions it started with
+        if self.connection.in_transaction:
+            return
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version and not force:
+            return
+        self.data_version = data_version
+        attached = False
+        partitions = list_partitions(self.connection)
+        if len(partitions) > max_archives(self.connection):
+            raise ArchiveError(f"{self.db_name} has {len(partitions)} archive files, but SQLite attaches at most "
+                               f"{max_archives(self.connection)} databases to a connection (SQLITE_MAX_ATTACHED)")
+        for year, path, *_ in partitions:
+            if year not in self.archives:
+                schema = f"archive_{year}"
+                path = os.path.join(self.directory, path)
+                self.connection.execute(f"ATTACH DATABASE ? AS {schema}", (read_only_uri(path),))
+                self.archives[year] = schema
+                self.paths[schema] = path
+                attached = True
+        if attached:
+            self._create_views()
+
+    def _create_views(self):
+        schemas = self.all_schemas()
+        for name, arm in LEDGER_VIEWS.items():
+            self.connection.execute(f"DROP VIEW IF EXISTS temp.{name}")
+            self.connection.execute(f"CREATE TEMP VIEW {name} AS "
+                                    + " UNION ALL ".join(arm.format(schema=schema) for schema in schemas))
+
+    @property
+    def horizon(self):
+        # First year kept in the main database
+        return max(self.archives) + 1 if self.archives else None
+
+    def all_schemas(self):
+        return [self.archives[year] for year in sorted(self.archives)] + ["main"]
+
+    def schema_for_year(self, year):
+        self.refresh()
+        return self.archives.get(year, "main")
+
+    def schemas(self, start=None, end=None):
+        # Partitions holding dates in [start, end), oldest first; either bound may be None for open-ended
+        self.refresh()
+        first_year = int(start[:4]) if start else None
+        last_year = int(end[:4]) - (end[4:] <= "-01-01") if end else None
+        selected = [schema for year, schema in sorted(self.archives.items())
+                    if (first_year is None or year >= first_year) and (last_year is None or year <= last_year)]
+        if last_year is None or self.horizon is None or last_year >= self.horizon:
+            selected.append("main")
+        return selected
+
+    def yearly_totals(self, start=None, end=None):
+        # {year: {category id: (cents, count)}} over [start, end), each partition summed in its own process
+        start, end = start or "", end or "9999-12-31"
+        tasks = [(read_only_uri(self.paths[schema]), start, end) for schema in self.schemas(start, end)]
+        if len(tasks) > 1:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=min(MAX_WORKERS, os.cpu_count() or 1))
+            partials = self.pool.map(partition_totals, *zip(*tasks))
+        else:
+            partials = [partition_totals(*task) for task in tasks]
+        totals = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for rows in partials:
+            for year, category_id, cents, count in rows:
+                merged = totals[year][category_id]
+                merged[0] += cents
+                merged[1] += count
+        return {year: {category_id: tuple(merged) for category_id, merged in by_category.items()}
+                for year, by_category in sorted(totals.items())}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
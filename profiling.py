@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Instrumentation is opt-in: set EXPENSE_TRACKER_PROFILE=1 (or pass a Profiler) to turn it on
+PROFILE_ENV = "EXPENSE_TRACKER_PROFILE"
+SLOW_QUERY_MS = 50
+# Histogram bucket upper bounds in milliseconds; the last bucket catches everything slower
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def profiling_requested():
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows=0):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        index = 0
+        while index < len(BUCKETS_MS) and elapsed_ms > BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the fraction-th sample, so read it as "at most"
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= fraction * self.count:
+                return min(BUCKETS_MS[index], self.max_ms) if index < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "total_ms": round(self.total_ms, 3), "max_ms": round(self.max_ms, 3),
+                "rows": self.rows, "p50_ms": round(self.percentile(0.5), 3), "p90_ms": round(self.percentile(0.9), 3),
+                "p99_ms": round(self.percentile(0.99), 3),
+                "buckets": {f"<={bound}" if bound is not None else "slower": count
+                            for bound, count in zip(BUCKETS_MS + (None,), self.buckets)}}
+
+
+class Profiler:
+    # Collects per-statement SQL latency and rows, named timing spans, and plans of slow statements.
+    # Recording happens on whichever thread runs the work, so every update goes through one lock.
+    def __init__(self, enabled=None, slow_query_ms=SLOW_QUERY_MS):
+        self.enabled = profiling_requested() if enabled is None else enabled
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.queries = {}
+            self.spans = {}
+            self.plans = {}
+            self.statements = 0
+            self.nested = Counter()
+            self.started = time.time()
+
+    def attach(self, connection):
+        # The trace callback also sees statements SQLite runs internally, e.g. FTS5 shadow-table writes fired
+        # by the sync triggers, which the timing wrappers cannot
+        connection.profiler = self
+        connection.set_trace_callback(self.trace)
+
+    def trace(self, statement):
+        with self.lock:
+            self.statements += 1
+            if statement.startswith("-- "):
+                self.nested[normalize_sql(statement[3:])] += 1
+
+    def record_query(self, connection, sql, elapsed_ms, rows, parameters):
+        key = normalize_sql(sql)
+        with self.lock:
+            histogram = self.queries.get(key)
+            if histogram is None:
+                histogram = self.queries[key] = Histogram()
+            histogram.add(elapsed_ms, rows)
+            wants_plan = elapsed_ms >= self.slow_query_ms and key not in self.plans
+            if wants_plan:
+                self.plans[key] = None
+        if wants_plan and parameters is not None:
+            self.plans[key] = self.explain(connection, sql, parameters)
+
+    def explain(self, connection, sql, parameters):
+        # Runs on the same connection, bypassing the profiled cursor so the EXPLAIN itself is not recorded
+        connection.set_trace_callback(None)
+        try:
+            rows = sqlite3.Connection.execute(connection, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+            return [detail for *_, detail in rows]
+        except sqlite3.Error as error:
+            return [f"plan unavailable: {error}"]
+        finally:
+            connection.set_trace_callback(self.trace)
+
+    def record_span(self, name, elapsed_ms):
+        with self.lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = Histogram()
+            histogram.add(elapsed_ms)
+
+    @contextmanager
+    def span(self, name):
+        # Times the block, e.g. "format.monthly_report" or "widget.expense_list"
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, (time.perf_counter() - start) * 1000)
+
+    def to_dict(self):
+        with self.lock:
+            return {"enabled": self.enabled, "started": self.started, "slow_query_ms": self.slow_query_ms,
+                    "statements": self.statements, "nested": dict(self.nested),
+                    "queries": {sql: histogram.to_dict() for sql, histogram in self.queries.items()},
+                    "spans": {name: histogram.to_dict() for name, histogram in self.spans.items()},
+                    "plans": {sql: plan for sql, plan in self.plans.items() if plan}}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(self.to_dict(), output, indent=2)
+
+    def report(self, limit=15):
+        if not self.enabled:
+            return f"Instrumentation is off. Start with {PROFILE_ENV}=1 to record queries and timings."
+        data = self.to_dict()
+        header = f"{'calls':>7} {'rows':>9} {'total ms':>10} {'p50':>7} {'p99':>7} {'max':>8}  "
+        lines = [f"SQL: {data['statements']} statements traced, {sum(data['nested'].values())} run internally",
+                 header + "statement"]
+        queries = sorted(data["queries"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        for sql, stats in queries[:limit]:
+            lines.append(self._line(stats) + (sql if len(sql) <= 70 else sql[:67] + "..."))
+        for sql, count in Counter(data["nested"]).most_common(5):
+            lines.append(f"{'':>7} {count:>9} {'':>10} {'':>7} {'':>7} {'':>8}  (internal) {sql[:59]}")
+        lines += ["", header + "span"]
+        for name, stats in sorted(data["spans"].items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            lines.append(self._line(stats) + name)
+        if data["plans"]:
+            lines += ["", f"Plans of statements slower than {self.slow_query_ms} ms:"]
+            for sql, plan in data["plans"].items():
+                lines.append(f"  {sql[:100]}")
+                lines += [f"    {detail}" for detail in plan]
+        return "\n".join(lines)
+
+    @staticmethod
+    def _line(stats):
+        return (f"{stats['count']:>7} {stats['rows']:>9} {stats['total_ms']:>10.1f} {stats['p50_ms']:>7.2f} "
+                f"{stats['p99_ms']:>7.2f} {stats['max_ms']:>8.2f}  ")
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Times execute and every fetch; an execution is recorded once its rows are exhausted or the cursor goes away
+    _sql = None
+
+    def _begin(self, sql, parameters, elapsed):
+        self._finish()
+        self._sql, self._parameters, self._elapsed, self._rows = sql, parameters, elapsed, 0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self.connection.profiler.record_query(self.connection, sql, self._elapsed * 1000, self._rows,
+                                                  self._parameters)
+
+    def _timed(self, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self._elapsed += time.perf_counter() - start
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self._begin(sql, parameters, time.perf_counter() - start)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        self._begin(sql, None, time.perf_counter() - start)
+        return cursor
+
+    def fetchone(self):
+        if self._sql is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sql is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._sql is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __del__(self):
+        try:
+            self._finish()
+        except sqlite3.Error:
+            pass
+
+
+class ProfiledConnection(sqlite3.Connection):
+    # sqlite3.connect(factory=...) target; Connection.execute is re-routed so it goes through ProfiledCursor.execute
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,76 @@
+from collections import OrderedDict, defaultdict
+
+DEFAULT_CACHE_SIZE = 36
+
+# A month's report includes trailing 12-month averages, so it depends on itself and the 11 months before it, and
+# on the ledger's first month, which shortens the window of averages near the start of the ledger
+DEPENDENT_MONTHS = 12
+
+
+def month_of(date):
+    return int(date[:4]) * 12 + int(date[5:7]) - 1
+
+
+class ReportCache:
+    # LRU of computed monthly report data keyed by (year, month).
+    # Writes bump a per-month generation; an entry is stale once any month it depends on has moved on.
+    def __init__(self, connection, max_size=DEFAULT_CACHE_SIZE):
+        self.connection = connection
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.generations = defaultdict(int)
+        self.data_version = self._data_version()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _data_version(self):
+        # Changes whenever another connection commits to the database file
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _signature(self, year, month, ledger_start):
+        last = year * 12 + month - 1
+        return (ledger_start, *(self.generations[index] for index in range(last - DEPENDENT_MONTHS + 1, last + 1)))
+
+    def get(self, year, month, ledger_start=None):
+        data_version = self._data_version()
+        if data_version != self.data_version:
+            self.data_version = data_version
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+        entry = self.entries.get((year, month))
+        if entry is not None:
+            signature, value = entry
+            if signature == self._signature(year, month, ledger_start):
+                self.entries.move_to_end((year, month))
+                self.hits += 1
+                return value
+            del self.entries[(year, month)]
+            self.invalidations += 1
+        self.misses += 1
+        return None
+
+    def put(self, year, month, value, ledger_start=None):
+        self.entries[(year, month)] = (self._signature(year, month, ledger_start), value)
+        self.entries.move_to_end((year, month))
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_dates(self, dates):
+        for index in {month_of(date) for date in dates if date}:
+            self.generations[index] += 1
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                "invalidations": self.invalidations}
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Report cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+                f"{stats['evictions']} evictions, {stats['invalidations']} invalidations")
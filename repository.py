@@ -0,0 +1,343 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from alerts import category_stats, evaluate_insert, evaluate_write, list_budgets, remove_budget, set_budget
+from analytics import SpendingAnalytics, first_ledger_month, trailing_averages
+from bulk_edit import BULK_CHUNK_SIZE, bulk_delete, bulk_update, list_edits, preview, require_filter, undo_edit
+from dictionaries import Dictionary, name_key
+from importer import DEFAULT_BATCH_SIZE, INSERT_EXPENSE_SQL, insert_expenses
+from listing import write_expenses
+from money import expense_rows, format_cents
+from partitions import ARCHIVE_BATCH_SIZE, PartitionRouter, archive_years, list_partitions
+from profiling import ProfiledConnection, Profiler
+from report_cache import ReportCache
+from rollups import check_rollups, rebuild_rollups
+from schema import (CATEGORY_TOTALS_TEMPLATE, DEFAULT_CATEGORY, FIRST_PAGE_SQL, NEXT_PAGE_SQL,
+                    SEARCH_EXPENSES_TEMPLATE, TOTAL_EXPENSE_TEMPLATE, fts_query, migrate, month_bounds)
+from snapshot import Snapshot, export_snapshot, snapshot_path
+
+DEFAULT_DB = "expense_tracker.db"
+
+BUSY_TIMEOUT_MS = 10000
+STATEMENT_CACHE_SIZE = 256
+SEARCH_LIMIT = 50
+
+# WAL lets the CLI and the GUI read while the other one writes; with WAL, NORMAL sync only fsyncs on checkpoint
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("cache_size", -65536),
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+]
+
+# RETURNING hands back the touched month so only its cached reports are invalidated
+UPDATE_EXPENSE_SQL = ("UPDATE expenses SET amount=?, category_id=?, description=?, expense_type_id=? WHERE id=? "
+                      "RETURNING date")
+DELETE_EXPENSE_SQL = "DELETE FROM expenses WHERE id=? RETURNING date"
+
+
+def set_pragmas(connection):
+    # Switching a new file to WAL takes an exclusive lock that SQLite does not wait for through the busy timeout, so
+    # processes opening a new database together retry it within the same time budget
+    deadline = time.monotonic() + BUSY_TIMEOUT_MS / 1000
+    for name, value in PRAGMAS:
+        while True:
+            try:
+                connection.execute(f"PRAGMA {name} = {value}")
+                break
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error) or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+
+
+def connect(db_name=DEFAULT_DB, check_same_thread=True, profiler=None):
+    # SQL strings are module constants, so sqlite3's per-connection statement cache reuses the prepared statements
+    profiled = profiler is not None and profiler.enabled
+    # uri=True lets archives be attached read-only as file:...?mode=ro
+    connection = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread,
+                                 cached_statements=STATEMENT_CACHE_SIZE, uri=True,
+                                 factory=ProfiledConnection if profiled else sqlite3.Connection)
+    if profiled:
+        profiler.attach(connection)
+    set_pragmas(connection)
+    migrate(connection)
+    return connection
+
+
+class ExpenseRepository:
+    # The single place both front-ends go through to read and write expenses
+    def __init__(self, db_name=DEFAULT_DB, check_same_thread=True, profiler=None):
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.db_name = db_name
+        self.connection = connect(db_name, check_same_thread, self.profiler)
+        self.report_cache = ReportCache(self.connection)
+        # Archived years stay attached read-only; reads are routed to the partitions their dates need
+        self.partitions = PartitionRouter(self.connection, db_name)
+        # name -> id interning for the lookup tables; every write path goes through these
+        self.categories = Dictionary(self.connection, "categories", DEFAULT_CATEGORY)
+        self.expense_types = Dictionary(self.connection, "expense_types")
+        self.batching = False
+        # Budget and spike alerts raised by the last add_expense or update_expense (alerts.Alert)
+        self.last_alerts = []
+
+    @contextmanager
+    def transaction(self):
+        # Groups many writes into one commit. Each write inside runs in its own savepoint,
+        # so a write that fails is undone on its own and the rest of the batch still commits.
+        if self.batching:
+            yield self
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.batching = True
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            # Reports computed from the rolled-back writes may have been cached meanwhile
+            self.report_cache.clear()
+            self._forget_dictionaries()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self.batching = False
+
+    @contextmanager
+    def _write(self):
+        if not self.batching:
+            try:
+                with self.connection:
+                    yield
+            except BaseException:
+                self._forget_dictionaries()
+                raise
+            return
+        self.connection.execute("SAVEPOINT expense_write")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK TO expense_write")
+            self.connection.execute("RELEASE expense_write")
+            self._forget_dictionaries()
+            raise
+        self.connection.execute("RELEASE expense_write")
+
+    @contextmanager
+    def savepoint(self):
+        # Makes several writes all or nothing inside transaction(), e.g. one API request of a group commit
+        with self._write():
+            yield self
+
+    def _forget_dictionaries(self):
+        # A rollback may have undone names interned inside it, so their cached ids cannot be trusted
+        self.categories.clear()
+        self.expense_types.clear()
+
+    def _with_ids(self, amount, category, description, date, expense_type):
+        return amount, self.categories.intern(category), description, date, self.expense_types.intern(expense_type)
+
+    # Amounts are integer cents, e.g. importer.parse_amount("12.50") == 1250
+    def add_expense(self, amount, category, description, expense_type, date=None):
+        date = date or datetime.now().strftime('%Y-%m-%d')
+        self.last_alerts = []
+        with self._write():
+            values = self._with_ids(amount, category, description, date, expense_type)
+            cursor = self.connection.execute(INSERT_EXPENSE_SQL, values)
+            alerts = evaluate_insert(self.connection, amount, values[1], self.categories.names[values[1]], date)
+        self.report_cache.invalidate_dates([date])
+        self.last_alerts = alerts
+        return cursor.lastrowid
+
+    def add_expenses(self, expenses, batch_size=DEFAULT_BATCH_SIZE):
+        # expenses yields (amount, category, description, date, expense_type) tuples
+        dates = set()
+        try:
+            return insert_expenses(self.connection, (dates.add(expense[3]) or self._with_ids(*expense)
+                                                     for expense in expenses), batch_size, self._write)
+        finally:
+            self.report_cache.invalidate_dates(dates)
+
+    def first_open_date(self):
+        # Imports reject rows before this date up front: the triggers of migration 8 refuse writes in archived years
+        self.partitions.refresh()
+        horizon = self.partitions.horizon
+        return f"{horizon:04d}-01-01" if horizon else None
+
+    def update_expense(self, expense_id, amount, category, description, expense_type):
+        self.last_alerts = []
+        with self._write():
+            category_id = self.categories.intern(category)
+            stats = category_stats(self.connection, category_id)
+            dates = self.connection.execute(UPDATE_EXPENSE_SQL, (amount, category_id, description,
+                                                                 self.expense_types.intern(expense_type),
+                                                                 expense_id)).fetchall()
+            alerts = evaluate_write(self.connection, stats, amount, category_id, self.categories.names[category_id],
+                                    dates[0][0]) if dates else []
+        self.report_cache.invalidate_dates(date for date, in dates)
+        self.last_alerts = alerts
+        return len(dates)
+
+    def delete_expense(self, expense_id):
+        # Spending only goes down, so a delete raises no alerts
+        self.last_alerts = []
+        with self._write():
+            dates = self.connection.execute(DELETE_EXPENSE_SQL, (expense_id,)).fetchall()
+        self.report_cache.invalidate_dates(date for date, in dates)
+        return len(dates)
+
+    def set_budget(self, category, amount):
+        # Monthly budget in cents for a category, replacing any previous one
+        if amount <= 0:
+            raise ValueError("A budget must be more than zero")
+        with self._write():
+            set_budget(self.connection, self.categories.intern(category), amount,
+                       datetime.now().isoformat(timespec="seconds"))
+
+    def remove_budget(self, category):
+        with self._write():
+            return remove_budget(self.connection, name_key(category))
+
+    def budgets(self, month=None):
+        # (category, budget cents, cents spent) for each budgeted category in a YYYY-MM month, by default this one
+        return list_budgets(self.connection, month or datetime.now().strftime("%Y-%m"))
+
+    def preview_bulk_edit(self, expense_filter):
+        # (count, total cents, first date, last date) of the expenses a bulk edit with this filter would touch
+        return preview(self.connection, expense_filter)
+
+    def bulk_update(self, expense_filter, amount=None, category=None, description=None, expense_type=None,
+                    chunk_size=BULK_CHUNK_SIZE):
+        # Sets the given fields (None leaves a field as it is) on every matching expense.
+        # Returns (edit id for undo, expenses updated); cached reports are invalidated once, after the last chunk.
+        require_filter(expense_filter)
+        changes, labels = {}, []
+        if amount is not None:
+            changes["amount"] = amount
+            labels.append(f"amount {format_cents(amount)}")
+        if description is not None:
+            changes["description"] = description
+            labels.append(f"description {description!r}")
+        with self._write():
+            if category is not None:
+                changes["category_id"] = self.categories.intern(category)
+                labels.append(f"category {self.categories.names[changes['category_id']]!r}")
+            if expense_type is not None:
+                changes["expense_type_id"] = self.expense_types.intern(expense_type)
+                labels.append(f"type {self.expense_types.names[changes['expense_type_id']]!r}")
+        edit_id, updated, months = bulk_update(self.connection, expense_filter, changes,
+                                               "set " + ", ".join(labels), chunk_size, self._write)
+        self.report_cache.invalidate_dates(months)
+        return edit_id, updated
+
+    def bulk_delete(self, expense_filter, chunk_size=BULK_CHUNK_SIZE):
+        edit_id, deleted, months = bulk_delete(self.connection, expense_filter, chunk_size, self._write)
+        self.report_cache.invalidate_dates(months)
+        return edit_id, deleted
+
+    def undo_bulk_edit(self, edit_id=None):
+        # Returns (edit id, expenses restored)
+        edit_id, restored, months = undo_edit(self.connection, edit_id, self._write)
+        self.report_cache.invalidate_dates(months)
+        return edit_id, restored
+
+    def bulk_edits(self, limit=20):
+        return list_edits(self.connection, limit)
+
+    def monthly_expenses(self, month, year):
+        schema = self.partitions.schema_for_year(year)
+        start_date, end_date = month_bounds(year, month)
+        total = self.connection.execute(TOTAL_EXPENSE_TEMPLATE.format(schema=schema),
+                                        (start_date, end_date)).fetchone()[0]
+        by_category = self.connection.execute(CATEGORY_TOTALS_TEMPLATE.format(schema=schema),
+                                              (start_date, end_date)).fetchall()
+        return total, by_category
+
+    def monthly_report(self, month, year):
+        # Month totals plus each category's trailing 12-month average ending with that month
+        ledger_start = first_ledger_month(self.connection, self.partitions)
+        report = self.report_cache.get(year, month, ledger_start)
+        if report is None:
+            total, by_category = self.monthly_expenses(month, year)
+            report = (total, by_category,
+                      trailing_averages(self.connection, self.partitions, month, year, ledger_start=ledger_start))
+            self.report_cache.put(year, month, report, ledger_start)
+        return report
+
+    def list_expenses(self, after=None, limit=100):
+        # Keyset page in (date, id) order across every partition; `after` is the (date, id) of the last row seen
+        self.partitions.refresh()
+        if after is None:
+            return expense_rows(self.connection.execute(FIRST_PAGE_SQL, (limit,)))
+        return expense_rows(self.connection.execute(NEXT_PAGE_SQL, (*after, limit)))
+
+    def dictionary_names(self):
+        # Every category and expense type name seen so far, e.g. for autocomplete
+        return self.categories.all_names(), self.expense_types.all_names()
+
+    def spending_analytics(self):
+        return SpendingAnalytics(self.connection, self.partitions)
+
+    def search_expenses(self, query, date_range=None, limit=SEARCH_LIMIT):
+        # date_range is an inclusive (start, end) pair of YYYY-MM-DD strings, either end may be None
+        terms = fts_query(query)
+        if not terms:
+            return []
+        start, end = date_range or (None, None)
+        start, end = start or "", end or "9999-12-31"
+        # Each partition in the range returns its own best matches; bm25 ranks merge across them.
+        # "~" sorts after every date, turning the inclusive end into the exclusive bound schemas() expects.
+        matches = []
+        for schema in self.partitions.schemas(start, f"{end}~"):
+            matches += self.connection.execute(SEARCH_EXPENSES_TEMPLATE.format(schema=schema),
+                                               (terms, start, end, limit)).fetchall()
+        matches.sort(key=lambda row: row[-1])
+        return expense_rows(row[:-1] for row in matches[:limit])
+
+    def write_expenses(self, output, output_format="table"):
+        self.partitions.refresh()
+        return write_expenses(self.connection, output, output_format)
+
+    def rebuild_rollups(self):
+        self.report_cache.clear()
+        return rebuild_rollups(self.connection)
+
+    def check_rollups(self):
+        return check_rollups(self.connection)
+
+    def archive_years(self, before, batch_size=ARCHIVE_BATCH_SIZE, vacuum=False):
+        # Moves every year older than `before` into its own read-only archive file, yielding each as it is done
+        try:
+            yield from archive_years(self.connection, self.db_name, before, batch_size, vacuum)
+        finally:
+            self.partitions.refresh(force=True)
+            self.report_cache.clear()
+
+    def list_partitions(self):
+        return list_partitions(self.connection)
+
+    def yearly_totals(self, start=None, end=None):
+        # {year: [(category, cents, count), ...]} over [start, end), summed per partition in parallel
+        totals = self.partitions.yearly_totals(start, end)
+        self.categories.refresh()
+        names = self.categories.names
+        return {year: sorted([(names[category], cents, count) for category, (cents, count) in by_category.items()],
+                             key=lambda row: row[0].casefold())
+                for year, by_category in totals.items()}
+
+    def export_snapshot(self, path=None, full=False):
+        # Appends expenses added since the last export to the columnar snapshot next to the database (snapshot.py)
+        self.partitions.refresh()
+        return export_snapshot(self.connection, path or snapshot_path(self.db_name), full)
+
+    def open_snapshot(self, path=None):
+        # Read-only, memory-mapped; reports and listings from it never touch SQLite
+        return Snapshot(path or snapshot_path(self.db_name))
+
+    def close(self):
+        self.partitions.close()
+        self.connection.close()
@@ -0,0 +1,40 @@
+import sqlite3
+
+from schema import CATEGORY_NAMES_SQL, CATEGORY_STATS_BACKFILL_SQL
+
+RAW_MONTHLY_TOTALS_SQL = ("SELECT substr(date, 1, 7), category_id, SUM(amount), COUNT(*) FROM expenses "
+                          "GROUP BY 1, 2")
+ROLLUP_TOTALS_SQL = "SELECT month, category_id, total, expense_count FROM monthly_category_totals"
+
+
+def rebuild_rollups(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM monthly_category_totals")
+        connection.execute("INSERT INTO monthly_category_totals (month, category_id, total, expense_count) "
+                           + RAW_MONTHLY_TOTALS_SQL)
+        # The per-category amount statistics are trigger-maintained too, and rebuilt from the same rows
+        connection.execute("DELETE FROM category_stats")
+        connection.execute(CATEGORY_STATS_BACKFILL_SQL)
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    connection.commit()
+    return connection.execute("SELECT COUNT(*) FROM monthly_category_totals").fetchone()[0]
+
+
+def check_rollups(connection):
+    # Returns (month, category name, rollup (total, count), raw (total, count)) for every mismatch
+    raw = {(month, category_id): (total, count) for month, category_id, total, count in
+           connection.execute(RAW_MONTHLY_TOTALS_SQL)}
+    rollup = {(month, category_id): (total, count) for month, category_id, total, count in
+              connection.execute(ROLLUP_TOTALS_SQL)}
+    names = dict(connection.execute(CATEGORY_NAMES_SQL).fetchall())
+
+    mismatches = []
+    for key in sorted(raw.keys() | rollup.keys(), key=lambda key: (key[0] or "", key[1] or 0)):
+        expected, actual = raw.get(key, (0, 0)), rollup.get(key, (0, 0))
+        # Totals are integer cents, so the rollup has to match exactly
+        if expected[1] != actual[1] or (expected[0] or 0) != (actual[0] or 0):
+            mismatches.append((key[0], names.get(key[1], f"#{key[1]}"), actual, expected))
+    return mismatches
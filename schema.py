@@ -0,0 +1,574 @@
+import re
+import sqlite3
+from datetime import date
+
+from dictionaries import clean_name, name_key
+
+# Migrations 3-6 ran while category and expense_type were TEXT columns of expenses; their DDL is kept as it was,
+# so a database of any version still upgrades step by step
+TEXT_ROLLUP_TRIGGERS = [
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO monthly_category_totals (month, category, total, expense_count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+            ON CONFLICT (month, category) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+            UPDATE monthly_category_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND expense_count <= 0;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF amount, category, date ON expenses BEGIN
+            UPDATE monthly_category_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND expense_count <= 0;
+            INSERT INTO monthly_category_totals (month, category, total, expense_count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+            ON CONFLICT (month, category) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+    """,
+]
+
+TEXT_FTS_TRIGGERS = [
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, description, category, expense_type)
+            VALUES (NEW.id, NEW.description, NEW.category, NEW.expense_type);
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, category, expense_type)
+            VALUES ('delete', OLD.id, OLD.description, OLD.category, OLD.expense_type);
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF description, category, expense_type
+        ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, category, expense_type)
+            VALUES ('delete', OLD.id, OLD.description, OLD.category, OLD.expense_type);
+            INSERT INTO expenses_fts (rowid, description, category, expense_type)
+            VALUES (NEW.id, NEW.description, NEW.category, NEW.expense_type);
+        END
+    """,
+]
+
+TEXT_EXPENSE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_expenses_date_category_amount ON expenses(date, category, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_category_date_amount ON expenses(category, date, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_date_id ON expenses(date, id)",
+]
+
+MIGRATION_BATCH_SIZE = 50000
+# Amounts become integer cents; ROUND happens before the cast so 0.29 * 100 = 28.999... still lands on 29
+CENTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS expenses_cents(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    amount INTEGER NOT NULL,
+    category TEXT,
+    description TEXT,
+    date DATE,
+    expense_type TEXT
+    )
+"""
+COPY_AS_CENTS_SQL = ("INSERT INTO expenses_cents (id, amount, category, description, date, expense_type) "
+                     "SELECT id, CAST(ROUND(IFNULL(amount, 0) * 100) AS INTEGER), category, description, date, "
+                     "expense_type FROM expenses WHERE id > ? ORDER BY id LIMIT ?")
+CENTS_ROLLUP_TABLE_SQL = """
+    CREATE TABLE monthly_category_totals(
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    expense_count INTEGER NOT NULL,
+    PRIMARY KEY (month, category)
+    ) WITHOUT ROWID
+"""
+TEXT_ROLLUP_BACKFILL_SQL = """
+    INSERT INTO monthly_category_totals (month, category, total, expense_count)
+    SELECT substr(date, 1, 7), category, SUM(amount), COUNT(*) FROM expenses GROUP BY 1, 2
+"""
+
+# 7: expenses reference small lookup tables by integer id instead of repeating category and type text.
+# Names are matched case- and whitespace-insensitively through name_key, see dictionaries.py.
+DICTIONARY_TABLES_SQL = [
+    """
+        CREATE TABLE IF NOT EXISTS categories(
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL UNIQUE
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS expense_types(
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL UNIQUE
+        )
+    """,
+]
+# Missing categories fall back to the same default validate_expense uses for new rows
+DEFAULT_CATEGORY = "Uncategorized"
+NORMALIZED_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS expenses_normalized(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    amount INTEGER NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    description TEXT,
+    date DATE,
+    expense_type_id INTEGER NOT NULL REFERENCES expense_types(id)
+    )
+"""
+# The first spelling of a name in id order becomes its display name
+INTERN_BATCH_SQL = [
+    f"""
+        INSERT INTO categories (name, name_key)
+        SELECT clean_name(category, '{DEFAULT_CATEGORY}'), name_key(category, '{DEFAULT_CATEGORY}')
+        FROM (SELECT category FROM expenses WHERE id > ? ORDER BY id LIMIT ?) WHERE true
+        ON CONFLICT (name_key) DO NOTHING
+    """,
+    """
+        INSERT INTO expense_types (name, name_key)
+        SELECT clean_name(expense_type, ''), name_key(expense_type, '')
+        FROM (SELECT expense_type FROM expenses WHERE id > ? ORDER BY id LIMIT ?) WHERE true
+        ON CONFLICT (name_key) DO NOTHING
+    """,
+]
+COPY_NORMALIZED_SQL = f"""
+    INSERT INTO expenses_normalized (id, amount, category_id, description, date, expense_type_id)
+    SELECT expenses.id, amount, categories.id, description, date, expense_types.id FROM expenses
+    JOIN categories ON categories.name_key = name_key(category, '{DEFAULT_CATEGORY}')
+    JOIN expense_types ON expense_types.name_key = name_key(expense_type, '')
+    WHERE expenses.id > ? ORDER BY expenses.id LIMIT ?
+"""
+ROLLUP_TABLE_SQL = """
+    CREATE TABLE monthly_category_totals(
+    month TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    expense_count INTEGER NOT NULL,
+    PRIMARY KEY (month, category_id)
+    ) WITHOUT ROWID
+"""
+ROLLUP_BACKFILL_SQL = """
+    INSERT INTO monthly_category_totals (month, category_id, total, expense_count)
+    SELECT substr(date, 1, 7), category_id, SUM(amount), COUNT(*) FROM expenses GROUP BY 1, 2
+"""
+# Expenses with their names resolved; listings and search read this, and it is the FTS external content
+EXPENSE_DETAILS_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS expense_details AS
+    SELECT expenses.id, amount, categories.name AS category, description, date, expense_types.name AS expense_type
+    FROM expenses
+    JOIN categories ON categories.id = expenses.category_id
+    JOIN expense_types ON expense_types.id = expenses.expense_type_id
+"""
+FTS_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+    description, category, expense_type, content='expense_details', content_rowid='id'
+    )
+"""
+
+ROLLUP_TRIGGERS = [
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO monthly_category_totals (month, category_id, total, expense_count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category_id, NEW.amount, 1)
+            ON CONFLICT (month, category_id) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+            UPDATE monthly_category_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id AND expense_count <= 0;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF amount, category_id, date ON expenses
+        BEGIN
+            UPDATE monthly_category_totals SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id AND expense_count <= 0;
+            INSERT INTO monthly_category_totals (month, category_id, total, expense_count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category_id, NEW.amount, 1)
+            ON CONFLICT (month, category_id) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+    """,
+]
+
+# Dictionary names never change once assigned, so the names written to the index stay valid for 'delete'
+FTS_TRIGGERS = [
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, description, category, expense_type)
+            SELECT NEW.id, NEW.description, categories.name, expense_types.name FROM categories, expense_types
+            WHERE categories.id = NEW.category_id AND expense_types.id = NEW.expense_type_id;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, category, expense_type)
+            SELECT 'delete', OLD.id, OLD.description, categories.name, expense_types.name FROM categories, expense_types
+            WHERE categories.id = OLD.category_id AND expense_types.id = OLD.expense_type_id;
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF description, category_id, expense_type_id
+        ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, category, expense_type)
+            SELECT 'delete', OLD.id, OLD.description, categories.name, expense_types.name FROM categories, expense_types
+            WHERE categories.id = OLD.category_id AND expense_types.id = OLD.expense_type_id;
+            INSERT INTO expenses_fts (rowid, description, category, expense_type)
+            SELECT NEW.id, NEW.description, categories.name, expense_types.name FROM categories, expense_types
+            WHERE categories.id = NEW.category_id AND expense_types.id = NEW.expense_type_id;
+        END
+    """,
+]
+
+EXPENSE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_expenses_date_category_amount ON expenses(date, category_id, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_category_date_amount ON expenses(category_id, date, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_date_id ON expenses(date, id)",
+]
+
+
+def _schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def rebuild_expenses(connection, version, table, prepare, copy_sql, finish, batch_size=MIGRATION_BATCH_SIZE):
+    # SQLite cannot change column types, so these migrations build a new expenses table and swap it in.
+    # Rows are copied in id order, one committed batch at a time, so memory and WAL growth stay bounded and an
+    # interrupted upgrade resumes where it stopped. prepare and copy_sql take (last copied id, batch size).
+    # The swap itself, then finish(connection), run as a single transaction.
+    def copy_batch(size):
+        last_id = connection.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table}").fetchone()[0]
+        for statement in prepare:
+            connection.execute(statement, (last_id, size))
+        return connection.execute(copy_sql, (last_id, size)).rowcount
+
+    while True:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have finished the upgrade while this one waited for the lock
+            if _schema_version(connection) >= version:
+                connection.rollback()
+                return
+            copied = copy_batch(batch_size)
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        connection.commit()
+        if copied < batch_size:
+            break
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if _schema_version(connection) >= version:
+            connection.rollback()
+            return
+        # Anything inserted since the last batch, then keep AUTOINCREMENT from reusing ids of deleted rows
+        copy_batch(-1)
+        sequence = connection.execute("SELECT IFNULL(MAX(seq), 0) FROM sqlite_sequence WHERE name IN ('expenses', ?)",
+                                      (table,)).fetchone()[0]
+        connection.execute("DROP TABLE expenses")
+        connection.execute(f"ALTER TABLE {table} RENAME TO expenses")
+        connection.execute("DELETE FROM sqlite_sequence WHERE name = 'expenses'")
+        connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('expenses', ?)", (sequence,))
+        finish(connection)
+        connection.execute(f"PRAGMA user_version = {version}")
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def migrate_amounts_to_cents(connection, version, batch_size=MIGRATION_BATCH_SIZE):
+    # 6: REAL dollars -> INTEGER cents
+    def finish(connection):
+        connection.execute("DROP TABLE monthly_category_totals")
+        connection.execute(CENTS_ROLLUP_TABLE_SQL)
+        connection.execute(TEXT_ROLLUP_BACKFILL_SQL)
+        # Ids and text are unchanged, so the external-content FTS index stays valid; only the triggers went away
+        for statement in TEXT_EXPENSE_INDEXES + TEXT_ROLLUP_TRIGGERS + TEXT_FTS_TRIGGERS:
+            connection.execute(statement)
+
+    connection.execute(CENTS_TABLE_SQL)
+    rebuild_expenses(connection, version, "expenses_cents", [], COPY_AS_CENTS_SQL, finish, batch_size)
+
+
+def migrate_to_dictionaries(connection, version, batch_size=MIGRATION_BATCH_SIZE):
+    # 7: category and expense_type text -> ids into the categories and expense_types lookup tables
+    def finish(connection):
+        connection.execute("DROP TABLE monthly_category_totals")
+        connection.execute(ROLLUP_TABLE_SQL)
+        connection.execute(ROLLUP_BACKFILL_SQL)
+        connection.execute(EXPENSE_DETAILS_VIEW_SQL)
+        # Variants like "food " now index under their dictionary name, so the full-text index is rebuilt
+        connection.execute("DROP TABLE expenses_fts")
+        connection.execute(FTS_TABLE_SQL)
+        connection.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        for statement in EXPENSE_INDEXES + ROLLUP_TRIGGERS + FTS_TRIGGERS:
+            connection.execute(statement)
+
+    connection.create_function("clean_name", 2, clean_name, deterministic=True)
+    connection.create_function("name_key", 2, name_key, deterministic=True)
+    for statement in DICTIONARY_TABLES_SQL + [NORMALIZED_TABLE_SQL]:
+        connection.execute(statement)
+    rebuild_expenses(connection, version, "expenses_normalized", INTERN_BATCH_SQL, COPY_NORMALIZED_SQL, finish,
+                     batch_size)
+
+
+# Archived years live in their own files; the main database refuses writes dated in them, so a year's archive
+# never goes stale and every row left in the main database is newer than every archived one
+PARTITIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS partitions(
+    year INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    expense_count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    archived_at TEXT NOT NULL
+    )
+"""
+ARCHIVED_YEAR_TRIGGERS = [
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_archived_insert BEFORE INSERT ON expenses
+        WHEN EXISTS (SELECT 1 FROM partitions WHERE year >= CAST(substr(NEW.date, 1, 4) AS INTEGER)) BEGIN
+            SELECT RAISE(ABORT, 'expense date falls in an archived year');
+        END
+    """,
+    """
+        CREATE TRIGGER IF NOT EXISTS expenses_archived_update BEFORE UPDATE OF date ON expenses
+        WHEN EXISTS (SELECT 1 FROM partitions WHERE year >= CAST(substr(NEW.date, 1, 4) AS INTEGER)) BEGIN
+            SELECT RAISE(ABORT, 'expense date falls in an archived year');
+        END
+    """,
+]
+
+
+# One row per bulk update or delete, plus every touched expense as it was before the edit
+BULK_EDIT_TABLES_SQL = [
+    """
+        CREATE TABLE IF NOT EXISTS bulk_edits(
+        id INTEGER PRIMARY KEY,
+        action TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        expense_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        undone_at TEXT
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS bulk_edit_rows(
+        edit_id INTEGER NOT NULL REFERENCES bulk_edits(id),
+        id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        date DATE,
+        expense_type_id INTEGER NOT NULL,
+        PRIMARY KEY (edit_id, id)
+        ) WITHOUT ROWID
+    """,
+]
+
+
+# Monthly spending limits per category, checked against the rollup's running month total on each write. Next to them
+# a running mean and variance of expense amounts per category (Welford's online algorithm, M2 being the sum of
+# squared deviations), kept by triggers like the rollup so a spike check never re-reads history. A removal applies
+# the update in reverse.
+BUDGET_TABLES_SQL = [
+    """
+        CREATE TABLE IF NOT EXISTS budgets(
+        category_id INTEGER PRIMARY KEY REFERENCES categories(id),
+        amount INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS category_stats(
+        category_id INTEGER PRIMARY KEY,
+        expense_count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL
+        )
+    """,
+]
+CATEGORY_STATS_BACKFILL_SQL = """
+    INSERT INTO category_stats (category_id, expense_count, mean, m2)
+    SELECT expenses.category_id, means.expense_count, means.mean,
+           SUM((expenses.amount - means.mean) * (expenses.amount - means.mean))
+    FROM expenses JOIN (SELECT category_id, COUNT(*) AS expense_count, AVG(amount) AS mean FROM expenses
+                        GROUP BY category_id) AS means ON means.category_id = expenses.category_id
+    GROUP BY expenses.category_id
+"""
+_STATS_ADD_SQL = """
+    INSERT INTO category_stats (category_id, expense_count, mean, m2) VALUES (NEW.category_id, 1, NEW.amount, 0)
+    ON CONFLICT (category_id) DO UPDATE
+    SET expense_count = expense_count + 1, mean = mean + (NEW.amount - mean) / (expense_count + 1),
+        m2 = m2 + (NEW.amount - mean) * (NEW.amount - mean - (NEW.amount - mean) / (expense_count + 1));
+"""
+_STATS_REMOVE_SQL = """
+    UPDATE category_stats
+    SET expense_count = expense_count - 1,
+        mean = CASE WHEN expense_count > 1 THEN (mean * expense_count - OLD.amount) / (expense_count - 1) ELSE 0 END,
+        m2 = CASE WHEN expense_count > 1 THEN max(m2 - (OLD.amount - mean)
+                  * (OLD.amount - (mean * expense_count - OLD.amount) / (expense_count - 1)), 0) ELSE 0 END
+    WHERE category_id = OLD.category_id;
+    DELETE FROM category_stats WHERE category_id = OLD.category_id AND expense_count <= 0;
+"""
+CATEGORY_STATS_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS expenses_stats_insert AFTER INSERT ON expenses BEGIN {_STATS_ADD_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS expenses_stats_delete AFTER DELETE ON expenses BEGIN {_STATS_REMOVE_SQL} END",
+    "CREATE TRIGGER IF NOT EXISTS expenses_stats_update AFTER UPDATE OF amount, category_id ON expenses "
+    f"BEGIN {_STATS_REMOVE_SQL} {_STATS_ADD_SQL} END",
+]
+
+
+# Each entry upgrades the database by one version, tracked in PRAGMA user_version.
+# A callable entry runs its own transactions and sets user_version itself when it completes.
+MIGRATIONS = [
+    # 1: base expenses table
+    ["""
+        CREATE TABLE IF NOT EXISTS expenses(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount REAL,
+        category TEXT,
+        description TEXT,
+        date DATE,
+        expense_type TEXT
+        )
+    """],
+    # 2: covering indexes for the monthly report range scans
+    TEXT_EXPENSE_INDEXES[:2],
+    # 3: per month/category rollup kept in sync by triggers on every write path
+    ["""
+        CREATE TABLE IF NOT EXISTS monthly_category_totals(
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        expense_count INTEGER NOT NULL,
+        PRIMARY KEY (month, category)
+        ) WITHOUT ROWID
+    """,
+     *TEXT_ROLLUP_TRIGGERS,
+     TEXT_ROLLUP_BACKFILL_SQL],
+    # 4: keyset pagination order for the expense list
+    TEXT_EXPENSE_INDEXES[2:],
+    # 5: full-text index over the text columns, an external-content FTS5 table kept in sync by triggers
+    ["""
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+        description, category, expense_type, content='expenses', content_rowid='id'
+        )
+    """,
+     *TEXT_FTS_TRIGGERS,
+     "INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')"],
+    # 6: integer cents instead of REAL amounts, so sums are exact
+    migrate_amounts_to_cents,
+    # 7: category and expense type lookup tables referenced by id
+    migrate_to_dictionaries,
+    # 8: registry of closed years moved into archive files (see partitions.py); those years become read-only
+    [PARTITIONS_TABLE_SQL, *ARCHIVED_YEAR_TRIGGERS],
+    # 9: journal of bulk updates and deletes with the rows as they were before, for undo (see bulk_edit.py)
+    BULK_EDIT_TABLES_SQL,
+    # 10: category budgets and running amount statistics for write-time alerts (see alerts.py)
+    [*BUDGET_TABLES_SQL, CATEGORY_STATS_BACKFILL_SQL, *CATEGORY_STATS_TRIGGERS],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Report queries take half-open date ranges and read at most 12 x categories rollup rows. {schema} is the
+# partition holding the month: "main", or an attached archive such as archive_2021 (see partitions.py).
+TOTAL_EXPENSE_TEMPLATE = ("SELECT SUM(total) FROM {schema}.monthly_category_totals "
+                          "WHERE month >= substr(?, 1, 7) AND month < substr(?, 1, 7)")
+CATEGORY_TOTALS_TEMPLATE = ("SELECT categories.name, SUM(total) FROM {schema}.monthly_category_totals "
+                            "JOIN main.categories AS categories ON categories.id = category_id "
+                            "WHERE month >= substr(?, 1, 7) AND month < substr(?, 1, 7) "
+                            "GROUP BY category_id ORDER BY categories.name")
+TOTAL_EXPENSE_SQL = TOTAL_EXPENSE_TEMPLATE.format(schema="main")
+CATEGORY_TOTALS_SQL = CATEGORY_TOTALS_TEMPLATE.format(schema="main")
+
+REPORT_QUERIES = [TOTAL_EXPENSE_SQL, CATEGORY_TOTALS_SQL]
+
+CATEGORY_NAMES_SQL = "SELECT id, name FROM categories"
+
+# Expense listing is paged by the (date, id) key so every page costs the same regardless of position.
+# The ledger_* views are per-connection UNION ALLs over the main database and every attached archive.
+EXPENSE_COLUMNS = "id, amount, category, description, date, expense_type"
+EXPENSE_COUNT_SQL = "SELECT IFNULL(SUM(expense_count), 0) FROM ledger_totals"
+FIRST_PAGE_SQL = f"SELECT {EXPENSE_COLUMNS} FROM ledger_details ORDER BY date, id LIMIT ?"
+NEXT_PAGE_SQL = (f"SELECT {EXPENSE_COLUMNS} FROM ledger_details WHERE (date, id) > (?, ?) "
+                 "ORDER BY date, id LIMIT ?")
+PREVIOUS_PAGE_SQL = (f"SELECT {EXPENSE_COLUMNS} FROM ledger_details WHERE (date, id) < (?, ?) "
+                     "ORDER BY date DESC, id DESC LIMIT ?")
+SEEK_PAGE_SQL = "SELECT date, id FROM ledger_expenses ORDER BY date, id LIMIT 1 OFFSET ?"
+PAGE_FROM_SQL = (f"SELECT {EXPENSE_COLUMNS} FROM ledger_details WHERE (date, id) >= (?, ?) "
+                 "ORDER BY date, id LIMIT ?")
+
+# Full-text search in one partition, best bm25 match first, limited to an inclusive date range.
+# Archives keep a contentless index over their own rows, so every partition joins back to its own expenses.
+SEARCH_EXPENSES_TEMPLATE = ("SELECT e.id, e.amount, c.name, e.description, e.date, t.name, bm25(expenses_fts) AS rank "
+                            "FROM {schema}.expenses_fts JOIN {schema}.expenses AS e ON e.id = expenses_fts.rowid "
+                            "JOIN main.categories AS c ON c.id = e.category_id "
+                            "JOIN main.expense_types AS t ON t.id = e.expense_type_id "
+                            "WHERE expenses_fts MATCH ? AND e.date >= ? AND e.date <= ? ORDER BY rank LIMIT ?")
+
+
+def fts_query(text):
+    # Every word becomes a quoted prefix term, so user input can never hit FTS5 query syntax errors
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+# Cents rendered as "12.50" by SQLite itself, so listing millions of rows needs no per-row Python conversion
+AMOUNT_TEXT_SQL = "printf('%s%d.%02d', CASE WHEN amount < 0 THEN '-' ELSE '' END, abs(amount) / 100, abs(amount) % 100)"
+
+# CLI listing streams rows in index order; column widths come from one aggregate pass
+LIST_EXPENSES_SQL = (f"SELECT id, {AMOUNT_TEXT_SQL}, category, description, expense_type, date "
+                     "FROM ledger_details ORDER BY date, id")
+# Name widths come from the lookup tables, so the pass over expenses never has to join them
+LIST_COLUMN_WIDTHS_SQL = (f"SELECT MAX(LENGTH(id)), MAX(LENGTH({AMOUNT_TEXT_SQL})), "
+                          "(SELECT MAX(LENGTH(name)) FROM categories), MAX(LENGTH(description)), "
+                          "(SELECT MAX(LENGTH(name)) FROM expense_types), MAX(LENGTH(date)) FROM ledger_expenses")
+
+
+def month_bounds(year, month):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def year_bounds(year):
+    return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+
+
+def migrate(connection):
+    version = _schema_version(connection)
+    for new_version, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        if callable(statements):
+            statements(connection, new_version)
+            continue
+        # Like rebuild_expenses: take the write lock first, then skip the step if another process that opened the
+        # database at the same time has already applied it, so the version only ever goes up
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if _schema_version(connection) >= new_version:
+                connection.rollback()
+                continue
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {new_version}")
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        connection.commit()
@@ -0,0 +1,327 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from listing import FETCH_SIZE, write_rows
+from money import divide_cents, format_cents
+
+# A snapshot is a directory of plain NumPy .npy files that np.load can memory-map, one subdirectory per export:
+#
+#   expense_tracker.snapshot/
+#     manifest.json                  format, last exported id, row count, fingerprint, category and expense type
+#                                    names by id, and the segment list; rewritten last, so it is the commit point
+#     segments/00000/id.npy          int64            expense id
+#                    amount.npy      int64            cents
+#                    category.npy    int32            category id, a key into manifest["categories"]
+#                    expense_type.npy int32           expense type id, a key into manifest["expense_types"]
+#                    date.npy        datetime64[D]
+#                    description_offsets.npy int64    n + 1 byte offsets into description.npy
+#                    description.npy uint8            UTF-8 descriptions back to back
+#
+# Segments never change once written. An export appends one segment holding the rows with an id above the last
+# exported one; when there are more than MAX_SEGMENTS they are merged into one.
+SNAPSHOT_FORMAT = 1
+MAX_SEGMENTS = 8
+EXPORT_BATCH_SIZE = 100000
+COLUMN_TYPES = {"id": np.int64, "amount": np.int64, "category": np.int32, "expense_type": np.int32,
+                "date": "datetime64[D]", "description_offsets": np.int64, "description": np.uint8}
+
+EXPORT_ROWS_SQL = ("SELECT id, amount, category_id, expense_type_id, date, description FROM ledger_expenses "
+                   "WHERE id > ?")
+# Ids only ever grow, so new rows are found by id; an update, delete or undo of an older row is caught by comparing
+# this aggregate over the exported id range with the one stored at the last export, and forces a full rewrite
+FINGERPRINT_SQL = ("SELECT COUNT(*), IFNULL(SUM(amount), 0), IFNULL(SUM(id % 1009 * category_id), 0), "
+                   "IFNULL(SUM(id % 1013 * expense_type_id), 0), "
+                   "IFNULL(SUM(CAST(replace(date, '-', '') AS INTEGER)), 0), IFNULL(SUM(length(description)), 0) "
+                   "FROM ledger_expenses WHERE id > ? AND id <= ?")
+CATEGORY_NAMES_SQL = "SELECT id, name FROM categories"
+EXPENSE_TYPE_NAMES_SQL = "SELECT id, name FROM expense_types"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_path(db_name):
+    # expense_tracker.db -> expense_tracker.snapshot, next to the database
+    return f"{os.path.splitext(db_name)[0]}.snapshot"
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        raise SnapshotError(f"No snapshot at {path}; export one with: snapshot")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"{path} is snapshot format {manifest.get('format')}, expected {SNAPSHOT_FORMAT}")
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    temporary = os.path.join(path, "manifest.json.tmp")
+    with open(temporary, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(temporary, os.path.join(path, "manifest.json"))
+
+
+def _write_segment(path, name, columns):
+    # Written under a temporary name and renamed, so a segment directory is either complete or absent
+    segments = os.path.join(path, "segments")
+    os.makedirs(segments, exist_ok=True)
+    temporary = tempfile.mkdtemp(prefix=".tmp-", dir=segments)
+    for column, values in columns.items():
+        np.save(os.path.join(temporary, f"{column}.npy"), np.asarray(values, dtype=COLUMN_TYPES[column]))
+    os.replace(temporary, os.path.join(segments, name))
+
+
+def _load_segment(path, name):
+    # Every column memory-mapped read-only; nothing is read until a page is touched
+    return {column: np.load(os.path.join(path, "segments", name, f"{column}.npy"), mmap_mode="r")
+            for column in COLUMN_TYPES}
+
+
+def _segment_columns(rows):
+    # One fetched batch of EXPORT_ROWS_SQL rows as columns, plus its widest description
+    ids, amounts, categories, expense_types, dates, descriptions = zip(*rows)
+    encoded = [(description or "").encode() for description in descriptions]
+    offsets = np.zeros(len(encoded) + 1, np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), np.int64, len(encoded)), out=offsets[1:])
+    columns = {"id": np.array(ids, np.int64), "amount": np.array(amounts, np.int64),
+               "category": np.array(categories, np.int32), "expense_type": np.array(expense_types, np.int32),
+               "date": np.array(dates, dtype="datetime64[D]"), "description_offsets": offsets,
+               "description": np.frombuffer(b"".join(encoded), np.uint8)}
+    return columns, max(len(description or "") for description in descriptions)
+
+
+def _concatenate(parts):
+    # Column dicts into one, rebasing each description offset column onto the concatenated bytes
+    if len(parts) == 1:
+        return parts[0]
+    columns = {column: np.concatenate([part[column] for part in parts])
+               for column in COLUMN_TYPES if column != "description_offsets"}
+    bases = np.cumsum([0] + [part["description"].size for part in parts])
+    columns["description_offsets"] = np.concatenate(
+        [[0]] + [part["description_offsets"][1:] + base for part, base in zip(parts, bases)])
+    return columns
+
+
+def _next_segment_number(path):
+    # Never reuses a name still on disk: a reader may have the segment it replaces mapped
+    segments = os.path.join(path, "segments")
+    names = os.listdir(segments) if os.path.isdir(segments) else []
+    return 1 + max((int(name) for name in names if name.isdigit()), default=-1)
+
+
+def export_snapshot(connection, path, full=False, batch_size=EXPORT_BATCH_SIZE):
+    # Appends every expense with an id above the last exported one, across the main database and every archive.
+    # Returns (expenses appended, expenses in the snapshot, last exported id, whether it was rewritten in full).
+    try:
+        manifest = None if full else _read_manifest(path)
+    except SnapshotError:
+        manifest = None
+    # One read transaction, so the fingerprint and the rows come from the same state of the ledger
+    connection.execute("BEGIN")
+    try:
+        if manifest is not None and list(connection.execute(FINGERPRINT_SQL, (0, manifest["last_id"])).fetchone()) \
+                != manifest["fingerprint"]:
+            manifest = None
+        rebuilt = manifest is None
+        last_id = 0 if rebuilt else manifest["last_id"]
+        fingerprint = [0] * 6 if rebuilt else manifest["fingerprint"]
+        # Each fetched batch becomes arrays right away, so memory holds columns rather than row tuples
+        parts, widths = [], []
+        cursor = connection.execute(EXPORT_ROWS_SQL, (last_id,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            columns, width = _segment_columns(batch)
+            parts.append(columns)
+            widths.append(width)
+        new_last_id = max([last_id] + [int(part["id"].max()) for part in parts])
+        added = connection.execute(FINGERPRINT_SQL, (last_id, new_last_id)).fetchone()
+        categories = dict(connection.execute(CATEGORY_NAMES_SQL).fetchall())
+        expense_types = dict(connection.execute(EXPENSE_TYPE_NAMES_SQL).fetchall())
+    finally:
+        connection.commit()
+
+    os.makedirs(path, exist_ok=True)
+    segments = [] if rebuilt else manifest["segments"]
+    next_number = _next_segment_number(path)
+    appended = sum(part["id"].size for part in parts)
+    if parts:
+        name = f"{next_number:05d}"
+        _write_segment(path, name, _concatenate(parts))
+        segments.append({"name": name, "rows": appended, "description_width": max(widths)})
+        next_number += 1
+    if len(segments) > MAX_SEGMENTS:
+        name = f"{next_number:05d}"
+        _write_segment(path, name, _concatenate([_load_segment(path, segment["name"]) for segment in segments]))
+        segments = [{"name": name, "rows": sum(segment["rows"] for segment in segments),
+                     "description_width": max(segment["description_width"] for segment in segments)}]
+    total = sum(segment["rows"] for segment in segments)
+    _write_manifest(path, {
+        "format": SNAPSHOT_FORMAT,
+        "last_id": new_last_id,
+        "rows": total,
+        "fingerprint": [old + new for old, new in zip(fingerprint, added)],
+        "categories": {str(category_id): name for category_id, name in categories.items()},
+        "expense_types": {str(type_id): name for type_id, name in expense_types.items()},
+        "segments": segments,
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    # Segments the new manifest no longer lists (replaced by a rewrite or a merge, or left by an interrupted export)
+    kept = {segment["name"] for segment in segments}
+    for name in os.listdir(os.path.join(path, "segments")) if os.path.isdir(os.path.join(path, "segments")) else []:
+        if name not in kept:
+            shutil.rmtree(os.path.join(path, "segments", name), ignore_errors=True)
+    return appended, total, new_last_id, rebuilt
+
+
+def _date_mask(dates, start, end):
+    # Rows with start <= date < end, either bound a YYYY-MM-DD string or None
+    mask = np.ones(dates.shape, bool)
+    if start:
+        mask &= dates >= np.datetime64(start, "D")
+    if end:
+        mask &= dates < np.datetime64(end, "D")
+    return mask
+
+
+class Snapshot:
+    # A snapshot reopened read-only: every column is memory-mapped, so opening costs the same for any size and
+    # reports run as NumPy passes over the mapped pages without SQLite
+    def __init__(self, path):
+        self.path = path
+        manifest = _read_manifest(path)
+        self.last_id = manifest["last_id"]
+        self.rows = manifest["rows"]
+        self.exported_at = manifest["exported_at"]
+        self.categories = {int(category_id): name for category_id, name in manifest["categories"].items()}
+        self.expense_types = {int(type_id): name for type_id, name in manifest["expense_types"].items()}
+        self.description_width = max((segment["description_width"] for segment in manifest["segments"]), default=0)
+        self.segments = [_load_segment(path, segment["name"]) for segment in manifest["segments"]]
+        self.category_count = max(self.categories, default=0) + 1
+        self.monthly = None
+        self.first_month = 0
+
+    def _monthly_totals(self):
+        # (cents, counts) category x month matrices built in one pass over the mapped columns on first use, so every
+        # monthly report after that costs a column lookup, like the rollup table does in the database
+        if self.monthly is None:
+            month_columns = [segment["date"].astype("datetime64[M]").astype(np.int64) for segment in self.segments]
+            self.first_month = min((int(months.min()) for months in month_columns if months.size), default=0)
+            last_month = max((int(months.max()) for months in month_columns if months.size), default=0)
+            width = last_month - self.first_month + 1
+            cents = np.zeros(self.category_count * width, np.int64)
+            counts = np.zeros(self.category_count * width, np.int64)
+            for segment, months in zip(self.segments, month_columns):
+                keys = segment["category"].astype(np.int64) * width + (months - self.first_month)
+                # float64 sums stay exact up to 2**53 cents
+                cents += np.rint(np.bincount(keys, weights=segment["amount"], minlength=cents.size)).astype(np.int64)
+                counts += np.bincount(keys, minlength=counts.size)
+            self.monthly = cents.reshape(self.category_count, width), counts.reshape(self.category_count, width)
+        return self.monthly
+
+    def _month_range_totals(self, first, last):
+        # Per-category (cents, counts) over the months [first, last], counted as year * 12 + month - 1
+        cents, counts = self._monthly_totals()
+        offset = 1970 * 12
+        start = max(first - offset - self.first_month, 0)
+        end = max(last - offset - self.first_month + 1, 0)
+        return cents[:, start:end].sum(axis=1), counts[:, start:end].sum(axis=1)
+
+    def monthly_expenses(self, month, year):
+        # The same (total, [(category, cents)]) as ExpenseRepository.monthly_expenses; total is None for no expenses
+        index = year * 12 + month - 1
+        cents, counts = self._month_range_totals(index, index)
+        present = np.flatnonzero(counts)
+        if not present.size:
+            return None, []
+        by_category = sorted((self.categories[category_id], int(cents[category_id])) for category_id in present)
+        return int(cents[present].sum()), by_category
+
+    def trailing_averages(self, month, year, months=12):
+        # Averaged over the months of the window the snapshot covers, like analytics.trailing_averages
+        last = year * 12 + month - 1
+        cents, counts = self._month_range_totals(last - months + 1, last)
+        covered = last - max(last - months + 1, 1970 * 12 + self.first_month) + 1
+        return {self.categories[category_id]: divide_cents(int(cents[category_id]), covered)
+                for category_id in np.flatnonzero(counts)}
+
+    def monthly_report(self, month, year):
+        # The same triple as ExpenseRepository.monthly_report, so the report formatting is shared
+        total, by_category = self.monthly_expenses(month, year)
+        return total, by_category, self.trailing_averages(month, year)
+
+    def yearly_totals(self, start=None, end=None):
+        # The same {year: [(category, cents, count)]} over [start, end) as ExpenseRepository.yearly_totals
+        totals = {}
+        for segment in self.segments:
+            mask = _date_mask(segment["date"], start, end)
+            if not mask.any():
+                continue
+            years = segment["date"][mask].astype("datetime64[Y]").astype(np.int64) + 1970
+            first_year = int(years.min())
+            keys = (years - first_year) * self.category_count + segment["category"][mask]
+            length = (int(years.max()) - first_year + 1) * self.category_count
+            cents = np.rint(np.bincount(keys, weights=segment["amount"][mask], minlength=length)).astype(np.int64)
+            counts = np.bincount(keys, minlength=length)
+            for key in np.flatnonzero(counts):
+                year, category_id = divmod(int(key), self.category_count)
+                merged = totals.setdefault(first_year + year, {}).setdefault(category_id, [0, 0])
+                merged[0] += int(cents[key])
+                merged[1] += int(counts[key])
+        return {year: sorted([(self.categories[category_id], cents, count)
+                              for category_id, (cents, count) in by_category.items()],
+                             key=lambda row: row[0].casefold())
+                for year, by_category in sorted(totals.items())}
+
+    def _listing_batches(self, size=FETCH_SIZE):
+        # Rows in (date, id) order like the SQLite listing; only the sort keys are copied out of the mapped files
+        if not self.segments:
+            return
+        segment_of = np.repeat(np.arange(len(self.segments)), [segment["id"].size for segment in self.segments])
+        starts = np.cumsum([0] + [segment["id"].size for segment in self.segments])
+        order = np.lexsort((np.concatenate([segment["id"] for segment in self.segments]),
+                            np.concatenate([segment["date"] for segment in self.segments])))
+        descriptions = [memoryview(segment["description"]) for segment in self.segments]
+        for batch_start in range(0, order.size, size):
+            batch = order[batch_start:batch_start + size]
+            rows = [None] * batch.size
+            for segment_index in np.unique(segment_of[batch]).tolist():
+                segment = self.segments[segment_index]
+                positions = np.flatnonzero(segment_of[batch] == segment_index)
+                local = batch[positions] - starts[segment_index]
+                offsets = segment["description_offsets"]
+                data = descriptions[segment_index]
+                for position, expense_id, amount, category_id, type_id, date, first, last in zip(
+                        positions.tolist(), segment["id"][local].tolist(), segment["amount"][local].tolist(),
+                        segment["category"][local].tolist(), segment["expense_type"][local].tolist(),
+                        np.datetime_as_string(segment["date"][local]).tolist(), offsets[local].tolist(),
+                        offsets[local + 1].tolist()):
+                    rows[position] = (expense_id, format_cents(amount), self.categories[category_id],
+                                      str(data[first:last], "utf-8"), self.expense_types[type_id], date)
+            yield rows
+
+    def _column_widths(self):
+        # The same widths LIST_COLUMN_WIDTHS_SQL gives: names over the whole dictionaries, like the lookup tables
+        if not self.rows:
+            return (None,) * 6
+        amounts = [int(extreme) for segment in self.segments for extreme in (segment["amount"].min(),
+                                                                          segment["amount"].max())]
+        return (len(str(self.last_id)), max(len(format_cents(amount)) for amount in amounts),
+                max(map(len, self.categories.values()), default=0), self.description_width,
+                max(map(len, self.expense_types.values()), default=0), 10)
+
+    def write_expenses(self, output, output_format="table"):
+        return write_rows(self._listing_batches(), self._column_widths, output, output_format)
+
+    def summary(self):
+        return (f"{self.path}: {self.rows} expenses up to id {self.last_id} in {len(self.segments)} segments, "
+                f"exported {self.exported_at}")